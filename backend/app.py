@@ -7,9 +7,11 @@ Flask后端应用 - 数据分析API
 import os
 import sys
 import json
-import sqlite3
+import zlib
+import uuid
+import atexit
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
@@ -18,14 +20,116 @@ import numpy as np
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-from core.sqlite_analytics import SQLiteAnalytics
+from core.sqlite_analytics import (ROLLUP_SOURCES, is_valid_timestamp, invalid_event_reason,
+                                   encode_export_stream)
+from backend.ingest_queue import IngestQueueFull
+from backend.ingest_writer import IngestWriterClient, parse_address, writer_authkey
+from backend.storage import open_analytics, start_retention, create_ingest_queue
+from backend.overview_cache import (OverviewCache, etag_matches, OVERVIEW_MIN_AGE,
+                                    OVERVIEW_CACHE_TTL, OVERVIEW_REFRESH_INTERVAL)
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
-# 初始化分析器 - 使用项目根目录的数据库路径
-db_path = os.path.join(project_root, 'data', 'learning_analytics.db')
-analytics = SQLiteAnalytics(db_path=db_path)
+# 多进程部署（gunicorn，见 backend/gunicorn.conf.py）时由 PYCHATCAT_INGEST_WRITER 指定写入进程：
+# 工作进程以只读方式（mode=ro）打开数据库，建表与迁移、写入队列、磁盘缓冲与数据保留任务
+# 只在写入进程中运行，上报的批次交给写入进程
+INGEST_WRITER = os.environ.get('PYCHATCAT_INGEST_WRITER')
+
+# 初始化分析器（分片、写入队列等配置见 backend/storage.py）
+# 每个进程打开自己的分析器，查询时按需打开连接，连接不跨进程共享
+analytics, shards = open_analytics(readonly=bool(INGEST_WRITER))
+
+if INGEST_WRITER:
+    retention_managers = []
+    ingest_queue = IngestWriterClient(parse_address(INGEST_WRITER), writer_authkey())
+else:
+    retention_managers = start_retention(shards)
+    ingest_queue = create_ingest_queue(analytics)
+
+# 流式导出：每次从数据库读取的行数，以及响应数据块的大小（字节）
+EXPORT_STREAM_BATCH_ROWS = int(os.environ.get('PYCHATCAT_EXPORT_BATCH_ROWS', '1000'))
+EXPORT_STREAM_CHUNK_BYTES = 64 * 1024
+
+# 总体统计缓存：数据库无新写入时直接返回缓存结果，常用窗口由后台线程刷新
+# PYCHATCAT_OVERVIEW_MIN_AGE 为无条件使用缓存的秒数（也是 Cache-Control max-age），
+# PYCHATCAT_OVERVIEW_TTL 为缓存的最长使用秒数，PYCHATCAT_OVERVIEW_REFRESH 为后台刷新间隔（0 表示不刷新）
+overview_cache = OverviewCache(
+    analytics.get_overview_stats, analytics.data_version,
+    min_age=float(os.environ.get('PYCHATCAT_OVERVIEW_MIN_AGE', str(OVERVIEW_MIN_AGE))),
+    ttl=float(os.environ.get('PYCHATCAT_OVERVIEW_TTL', str(OVERVIEW_CACHE_TTL))),
+    refresh_interval=float(os.environ.get('PYCHATCAT_OVERVIEW_REFRESH', str(OVERVIEW_REFRESH_INTERVAL)))
+)
+
+def shutdown():
+    """
+    进程退出前的清理：写完本进程的写入队列（未写完的批次留在磁盘缓冲中，下次启动时重放），
+    停止后台线程；多进程部署时只关闭与写入进程的连接
+    """
+    overview_cache.close()
+    if ingest_queue is not None:
+        ingest_queue.close()
+    for retention in retention_managers:
+        retention.stop()
+
+atexit.register(shutdown)
+
+def submit_events(batch):
+    """
+    提交一批上报数据：有写入队列时入队并返回 202，否则同步写入并返回 200
+
+    队列已满时返回 503 与 Retry-After，客户端稍后重发（幂等键保证不会重复写入）。
+    """
+    if ingest_queue is None:
+        counts, duplicate = analytics.ingest_batch(
+            batch['sessions'], batch['events'], batch['session_ends'], batch_key=batch.get('key')
+        )
+        return jsonify({
+            'success': True,
+            'duplicate': duplicate,
+            'counts': counts
+        })
+    try:
+        size = ingest_queue.put(batch)
+    except IngestQueueFull as e:
+        return queue_full_response(e)
+    return jsonify({
+        'success': True,
+        'accepted': size
+    }), 202
+
+def queue_full_response(error):
+    """写入队列已满（或写入进程不可用）时的 503 响应"""
+    response = jsonify({
+        'success': False,
+        'error': str(error)
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(ingest_queue.retry_after())
+    return response
+
+def parse_time_arg(name):
+    """解析 ISO 格式的时间参数，未提供时返回 None"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+
+
+def single_event(session_id, event):
+    """
+    把旧版单事件接口的请求包装为批次
+
+    与批量接口一样在入队前同步校验，写入时会被跳过的事件直接拒绝（ValueError，返回 400）。
+    """
+    event['session_id'] = session_id
+    reason = invalid_event_reason(event)
+    if reason:
+        raise ValueError(reason)
+    return {'sessions': [], 'events': [event], 'session_ends': [], 'key': None}
 
 @app.route('/')
 def index():
@@ -40,13 +144,25 @@ def create_session():
         alias = data.get('alias')
         device_label = data.get('device_label') or data.get('user_id') or 'Python_Learning_Assistant'
         user_id = alias or data.get('user_id', 'anonymous')
-        session_id = analytics.start_session(user_id=user_id, device_label=device_label)
+        # 客户端可以自带会话 ID（UUID），重复创建同一个会话不会清空已有数据
+        if INGEST_WRITER:
+            # 工作进程不直接写库，会话开始记录交给写入进程（排在该会话的事件之前）
+            session_id = data.get('session_id') or str(uuid.uuid4())
+            ingest_queue.put({'sessions': [{'session_id': session_id, 'user_id': user_id,
+                                            'device_label': device_label}],
+                              'events': [], 'session_ends': [], 'key': None})
+        else:
+            session_id = analytics.start_session(
+                user_id=user_id, session_id=data.get('session_id'), device_label=device_label
+            )
         
         return jsonify({
             'success': True,
             'session_id': session_id,
             'message': 'Session created successfully'
         })
+    except IngestQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -62,12 +178,15 @@ def log_behavior(session_id):
         duration = data.get('duration')
         additional_data = data.get('additional_data', {})
         
-        analytics.log_behavior(session_id, behavior_code, duration, additional_data)
-        
+        return submit_events(single_event(session_id, {
+            'type': 'behavior', 'behavior_code': behavior_code,
+            'duration': duration, 'additional_data': additional_data
+        }))
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'message': 'Behavior logged successfully'
-        })
+            'success': False,
+            'error': f'Invalid event: {e}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -85,15 +204,16 @@ def log_code_operation(session_id):
         error_message = data.get('error_message')
         execution_time = data.get('execution_time')
         
-        analytics.log_code_operation(
-            session_id, operation_type, code, success, 
-            error_message, execution_time
-        )
-        
+        return submit_events(single_event(session_id, {
+            'type': 'code', 'operation_type': operation_type, 'code': code,
+            'success': success, 'error_message': error_message,
+            'execution_time': execution_time
+        }))
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'message': 'Code operation logged successfully'
-        })
+            'success': False,
+            'error': f'Invalid event: {e}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -111,15 +231,16 @@ def log_ai_interaction(session_id):
         response_time = data.get('response_time')
         feedback_quality = data.get('feedback_quality')
         
-        analytics.log_ai_interaction(
-            session_id, interaction_type, question, response,
-            response_time, feedback_quality
-        )
-        
+        return submit_events(single_event(session_id, {
+            'type': 'ai', 'interaction_type': interaction_type, 'question': question,
+            'response': response, 'response_time': response_time,
+            'feedback_quality': feedback_quality
+        }))
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'message': 'AI interaction logged successfully'
-        })
+            'success': False,
+            'error': f'Invalid event: {e}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -137,15 +258,117 @@ def log_error_analysis(session_id):
         fix_attempts = data.get('fix_attempts', 0)
         fix_success = data.get('fix_success', False)
         
-        analytics.log_error_analysis(
-            session_id, error_type, error_line, error_message,
-            fix_attempts, fix_success
+        return submit_events(single_event(session_id, {
+            'type': 'error', 'error_type': error_type, 'error_line': error_line,
+            'error_message': error_message, 'fix_attempts': fix_attempts,
+            'fix_success': fix_success
+        }))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid event: {e}'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# 批量上报的大小上限：请求体（压缩后）字节数、解压后字节数、行数
+BATCH_MAX_BYTES = int(os.environ.get('PYCHATCAT_BATCH_MAX_BYTES', str(4 * 1024 * 1024)))
+BATCH_MAX_RAW_BYTES = int(os.environ.get('PYCHATCAT_BATCH_MAX_RAW_BYTES', str(32 * 1024 * 1024)))
+BATCH_MAX_LINES = int(os.environ.get('PYCHATCAT_BATCH_MAX_LINES', '10000'))
+
+class BatchTooLargeError(ValueError):
+    """批次超过大小上限"""
+
+def parse_event_batch(body: bytes, content_encoding: str = None):
+    """
+    解码并校验一批上报数据（gzip 压缩的 NDJSON，每行一个带 type 与 session_id 的对象）
+
+    整批一次校验，任何一行无效时整批拒绝，不会只写入一部分。
+
+    Returns:
+        (会话开始记录, 事件列表, 会话结束记录)
+    """
+    if (content_encoding or '').lower() == 'gzip':
+        # 限制解压后的大小，防止压缩炸弹
+        try:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = decompressor.decompress(body, BATCH_MAX_RAW_BYTES)
+            if decompressor.unconsumed_tail:
+                raise BatchTooLargeError(f'decompressed batch exceeds {BATCH_MAX_RAW_BYTES} bytes')
+            if not decompressor.eof:
+                raise ValueError('truncated gzip body')
+        except zlib.error as e:
+            raise ValueError(f'invalid gzip body: {e}') from None
+
+    sessions, events, session_ends = [], [], []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        if number > BATCH_MAX_LINES:
+            raise BatchTooLargeError(f'batch exceeds {BATCH_MAX_LINES} lines')
+        try:
+            event = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {number}: {e}') from None
+        if not isinstance(event, dict):
+            raise ValueError(f'line {number}: expected a JSON object')
+        category = event.get('type')
+        session_id = event.get('session_id')
+        if not session_id or not isinstance(session_id, str):
+            raise ValueError(f'line {number}: missing session_id')
+        timestamp = event.get('timestamp')
+        if not is_valid_timestamp(timestamp):
+            raise ValueError(f'line {number}: invalid timestamp')
+        if category == 'session':
+            sessions.append(event)
+        elif category == 'session_end':
+            session_ends.append(event)
+        elif category in ROLLUP_SOURCES:
+            dimension = event.get(ROLLUP_SOURCES[category][1])
+            if dimension is not None and not isinstance(dimension, str):
+                raise ValueError(f'line {number}: invalid {ROLLUP_SOURCES[category][1]}')
+            events.append(event)
+        else:
+            raise ValueError(f'line {number}: unknown type {category!r}')
+    return sessions, events, session_ends
+
+@app.route('/api/events:batch', methods=['POST'])
+def ingest_event_batch():
+    """
+    批量写入事件（gzip 压缩的 NDJSON，每行一个事件，带 type 与 session_id）
+
+    一个批次可以包含多个会话的数据。type 为 session / session_end 的行创建、
+    结束客户端生成 ID 的会话；会话、事件与 Idempotency-Key 在同一事务中写入，
+    重发已写入的批次（包括服务重启之后）不会重复写入。
+    校验通过后放入写入队列并返回 202（见 submit_events）。
+    """
+    try:
+        if (request.content_length or 0) > BATCH_MAX_BYTES:
+            raise BatchTooLargeError(f'request body exceeds {BATCH_MAX_BYTES} bytes')
+        body = request.get_data()
+        if len(body) > BATCH_MAX_BYTES:
+            raise BatchTooLargeError(f'request body exceeds {BATCH_MAX_BYTES} bytes')
+        sessions, events, session_ends = parse_event_batch(
+            body, request.headers.get('Content-Encoding')
         )
         
-        return jsonify({
-            'success': True,
-            'message': 'Error analysis logged successfully'
+        return submit_events({
+            'sessions': sessions, 'events': events, 'session_ends': session_ends,
+            'key': request.headers.get('Idempotency-Key')
         })
+    except BatchTooLargeError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Batch too large: {e}'
+        }), 413
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid batch: {e}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -173,95 +396,52 @@ def get_analytics_overview():
     try:
         # 获取查询参数
         days = request.args.get('days', 30, type=int)
-        start_date = datetime.now() - timedelta(days=days)
         
-        with sqlite3.connect(analytics.db_path) as conn:
-            # 总体统计
-            cursor = conn.cursor()
-            
-            # 会话统计
-            cursor.execute('''
-                SELECT COUNT(*) as total_sessions,
-                       COUNT(DISTINCT user_id) as unique_users,
-                       AVG(total_activities) as avg_activities_per_session
-                FROM user_sessions 
-                WHERE start_time >= ?
-            ''', (start_date,))
-            session_stats = dict(zip([col[0] for col in cursor.description], cursor.fetchone()))
-            
-            # 行为统计
-            cursor.execute('''
-                SELECT behavior_code, activity_name, COUNT(*) as count
-                FROM learning_behaviors lb
-                JOIN user_sessions us ON lb.session_id = us.session_id
-                WHERE us.start_time >= ?
-                GROUP BY behavior_code, activity_name
-                ORDER BY count DESC
-            ''', (start_date,))
-            behavior_stats = [
-                dict(zip([col[0] for col in cursor.description], row))
-                for row in cursor.fetchall()
-            ]
-            
-            # 代码操作统计
-            cursor.execute('''
-                SELECT operation_type,
-                       COUNT(*) as total_operations,
-                       SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_operations,
-                       AVG(execution_time) as avg_execution_time
-                FROM code_operations co
-                JOIN user_sessions us ON co.session_id = us.session_id
-                WHERE us.start_time >= ?
-                GROUP BY operation_type
-            ''', (start_date,))
-            code_stats = [
-                dict(zip([col[0] for col in cursor.description], row))
-                for row in cursor.fetchall()
-            ]
-            
-            # AI交互统计
-            cursor.execute('''
-                SELECT interaction_type,
-                       COUNT(*) as total_interactions,
-                       AVG(response_time) as avg_response_time,
-                       AVG(question_length) as avg_question_length,
-                       AVG(response_length) as avg_response_length
-                FROM ai_interactions ai
-                JOIN user_sessions us ON ai.session_id = us.session_id
-                WHERE us.start_time >= ?
-                GROUP BY interaction_type
-            ''', (start_date,))
-            ai_stats = [
-                dict(zip([col[0] for col in cursor.description], row))
-                for row in cursor.fetchall()
-            ]
-            
-            # 错误分析统计
-            cursor.execute('''
-                SELECT error_type,
-                       COUNT(*) as total_errors,
-                       SUM(CASE WHEN fix_success = 1 THEN 1 ELSE 0 END) as fixed_errors,
-                       AVG(fix_attempts) as avg_fix_attempts
-                FROM error_analysis ea
-                JOIN user_sessions us ON ea.session_id = us.session_id
-                WHERE us.start_time >= ?
-                GROUP BY error_type
-            ''', (start_date,))
-            error_stats = [
-                dict(zip([col[0] for col in cursor.description], row))
-                for row in cursor.fetchall()
-            ]
+        # 统计数据来自汇总表并按窗口缓存，数据库无新写入时不重新查询
+        overview, etag, age = overview_cache.get(days)
+        max_age = max(0, int(overview_cache.min_age - age))
+        
+        # 客户端已有相同结果时只返回 304
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify({
+                'success': True,
+                'overview': overview
+            })
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = f'private, max-age={max_age}'
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/analytics/search', methods=['GET'])
+def search_events():
+    """全文检索AI问答与错误信息"""
+    try:
+        query = request.args.get('q', '')
+        user_id = request.args.get('user_id')
+        kind = request.args.get('kind')
+        days = request.args.get('days', type=int)
+        page = max(1, request.args.get('page', 1, type=int))
+        page_size = min(100, max(1, request.args.get('page_size', 20, type=int)))
+        start_time = datetime.now() - timedelta(days=days) if days else None
+        
+        result = analytics.search(
+            query, user_id=user_id, start_time=start_time, kind=kind,
+            limit=page_size, offset=(page - 1) * page_size
+        )
         
         return jsonify({
             'success': True,
-            'overview': {
-                'period': f'Last {days} days',
-                'session_stats': session_stats,
-                'behavior_stats': behavior_stats,
-                'code_stats': code_stats,
-                'ai_stats': ai_stats,
-                'error_stats': error_stats
-            }
+            'query': query,
+            'page': page,
+            'page_size': page_size,
+            'total': result['total'],
+            'results': result['results']
         })
     except Exception as e:
         return jsonify({
@@ -271,15 +451,89 @@ def get_analytics_overview():
 
 @app.route('/api/analytics/export', methods=['GET'])
 def export_data():
-    """导出数据"""
+    """
+    流式导出数据（NDJSON 或 CSV），边读数据库边发送，不在服务器上生成文件
+    
+    参数：format（jsonl/csv）、table（逗号分隔，csv 时只能一张）、session_id、user_id、
+    start_time / end_time（ISO 时间）或 days、compress（true 时 gzip 压缩）
+    """
+    try:
+        fmt = request.args.get('format', 'jsonl')
+        tables = [table for table in request.args.get('table', '').split(',') if table] or None
+        days = request.args.get('days', type=int)
+        start_time = parse_time_arg('start_time')
+        if start_time is None and days:
+            start_time = datetime.now() - timedelta(days=days)
+        end_time = parse_time_arg('end_time')
+        compress = (request.args.get('compress', 'false').lower() == 'true'
+                    or 'gzip' in request.headers.get('Accept-Encoding', ''))
+        
+        chunks = analytics.stream_export(
+            tables, fmt=fmt, session_id=request.args.get('session_id'),
+            user_id=request.args.get('user_id'), start_time=start_time, end_time=end_time,
+            batch_size=EXPORT_STREAM_BATCH_ROWS
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"analytics_export_{timestamp}.{'csv' if fmt == 'csv' else 'jsonl'}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"',
+               'Cache-Control': 'no-store'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    context = (f"{filename}: tables={','.join(tables or ['all'])} "
+               f"session_id={request.args.get('session_id')} user_id={request.args.get('user_id')} "
+               f"start_time={start_time} end_time={end_time} compress={compress}")
+    return Response(encode_export_stream(chunks, compress, EXPORT_STREAM_CHUNK_BYTES,
+                                         logger=analytics.logger, context=context),
+                    mimetype=mimetype, headers=headers)
+
+@app.route('/api/analytics/export/parquet', methods=['GET'])
+def export_parquet():
+    """导出列式Parquet分析快照"""
     try:
         session_id = request.args.get('session_id')
-        output_file = analytics.export_data(session_id)
+        user_id = request.args.get('user_id')
+        days = request.args.get('days', type=int)
+        start_time = datetime.now() - timedelta(days=days) if days else None
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_dir = os.path.join(project_root, 'data', 'exports', f'parquet_{timestamp}')
+        result = analytics.export_parquet(
+            output_dir, session_id=session_id, user_id=user_id, start_time=start_time
+        )
         
         return jsonify({
             'success': True,
-            'message': 'Data exported successfully',
-            'file': output_file
+            'message': 'Parquet snapshot exported successfully',
+            'snapshot': result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    """写入队列（多进程部署时为写入进程的队列）的深度、延迟与计数器"""
+    try:
+        return jsonify({
+            'success': True,
+            'async': ingest_queue is not None,
+            'writer_process': bool(INGEST_WRITER),
+            'queue': ingest_queue.stats() if ingest_queue is not None else None,
+            'overview_cache': overview_cache.stats()
         })
     except Exception as e:
         return jsonify({
@@ -290,18 +544,37 @@ def export_data():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
-    return jsonify({
+    health = {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'database': analytics.db_path
-    })
+        'database': analytics.db_path,
+        'pid': os.getpid()
+    }
+    if ingest_queue is not None:
+        try:
+            stats = ingest_queue.stats()
+            health['ingest_queue'] = {
+                'depth_events': stats['depth_events'],
+                'lag': stats['lag'],
+            }
+        except IngestQueueFull as e:
+            # 写入进程不可用：查询仍可用，上报会返回 503
+            health['status'] = 'degraded'
+            health['ingest_queue'] = {'error': str(e)}
+    return jsonify(health)
 
-if __name__ == '__main__':
-    # 创建templates目录
-    os.makedirs('backend/templates', exist_ok=True)
+def write_index_template():
+    """
+    创建主页使用的简单HTML模板（backend/templates/index.html）
     
-    # 创建简单的HTML模板
-    with open('backend/templates/index.html', 'w', encoding='utf-8') as f:
+    先写入临时文件再替换，多个工作进程同时启动时不会读到写了一半的模板。
+    """
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+    os.makedirs(template_dir, exist_ok=True)
+    
+    template_path = os.path.join(template_dir, 'index.html')
+    temp_path = f'{template_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
         f.write('''
 <!DOCTYPE html>
 <html>
@@ -317,6 +590,17 @@ if __name__ == '__main__':
 </body>
 </html>
         ''')
+    os.replace(temp_path, template_path)
+    return template_path
+
+if __name__ == '__main__':
+    # 创建简单的HTML模板
+    write_index_template()
     
-    # 启动Flask应用
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 启动Flask开发服务器（单进程多线程，仅用于开发调试）
+    # 生产环境使用多进程模式：gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+    # 不启用自动重载：重载器会再启动一个进程，两个进程同时写入队列的磁盘缓冲
+    app.run(host=os.environ.get('PYCHATCAT_HOST', '0.0.0.0'),
+            port=int(os.environ.get('PYCHATCAT_PORT', '5000')),
+            debug=os.environ.get('PYCHATCAT_DEBUG', 'false').lower() == 'true',
+            threaded=True, use_reloader=False)
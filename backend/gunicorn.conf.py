@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置 - 生产环境多进程部署
+
+在项目根目录运行：
+    gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+- 主进程启动时先启动独立的写入进程，所有数据库写入都由它完成
+- 工作进程（gthread，多进程 × 多线程）各自导入应用（不预加载），
+  SQLite 连接与后台线程都在工作进程内创建，不跨 fork 共享
+- 关闭时（SIGTERM / Ctrl+C）工作进程先处理完进行中的请求（graceful_timeout），
+  随后写入进程写完队列再退出；未写完的批次保留在磁盘缓冲中，下次启动时重放
+
+可通过环境变量调整：PYCHATCAT_BIND、PYCHATCAT_WEB_WORKERS、PYCHATCAT_WEB_THREADS、
+PYCHATCAT_INGEST_WRITER（写入进程地址）、PYCHATCAT_WRITER_DRAIN_TIMEOUT
+"""
+
+import os
+import sys
+import secrets
+import multiprocessing
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.ingest_writer import (default_address, parse_address, start_writer, stop_writer,
+                                   WRITER_DRAIN_TIMEOUT)
+
+bind = os.environ.get('PYCHATCAT_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('PYCHATCAT_WEB_WORKERS', str(min(8, multiprocessing.cpu_count() * 2 + 1))))
+worker_class = 'gthread'
+threads = int(os.environ.get('PYCHATCAT_WEB_THREADS', '4'))
+
+# 每个工作进程自己导入应用：SQLite 连接与线程不能在 fork 之后继续使用
+preload_app = False
+
+# 流式导出可能持续较长时间；gthread 工作进程的心跳不受单个请求阻塞
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+
+
+def on_starting(server):
+    """主进程启动：生成连接密钥并启动写入进程（工作进程继承这两个环境变量）"""
+    os.environ.setdefault('PYCHATCAT_INGEST_WRITER', default_address())
+    os.environ.setdefault('PYCHATCAT_INGEST_WRITER_KEY', secrets.token_hex(16))
+    address = parse_address(os.environ['PYCHATCAT_INGEST_WRITER'])
+    server.ingest_writer = start_writer(address, os.environ['PYCHATCAT_INGEST_WRITER_KEY'].encode('utf-8'))
+    server.log.info("Ingest writer started (pid: %s) at %s", server.ingest_writer.pid, address)
+
+
+def on_exit(server):
+    """所有工作进程退出后，通知写入进程写完队列并退出"""
+    writer = getattr(server, 'ingest_writer', None)
+    if writer is None:
+        return
+    if stop_writer(writer, WRITER_DRAIN_TIMEOUT):
+        server.log.info("Ingest writer drained and stopped")
+    else:
+        server.log.warning("Ingest writer did not drain within %ss; "
+                           "remaining batches stay in the spool", WRITER_DRAIN_TIMEOUT)
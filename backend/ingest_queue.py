@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后端的异步写入队列
+
+上报接口只做解码与校验，将批次放入有界队列后立即返回 202，由写入线程合并多个批次、
+在一个事务中写入数据库（analytics.ingest_batches），请求延迟不再受数据库锁等待影响。
+
+- 队列分为若干条通道（lane），每条通道一个写入线程、先进先出。包含同一会话的批次
+  （前一批仍在队列中时）进入同一通道，保证会话开始先于该会话的事件写入
+- 配置了 spool_dir 时，批次在接口返回 202 之前先追加到所在通道的磁盘缓冲并 fsync，
+  写库成功后确认；进程崩溃或关闭时未写入的批次在下次启动时重放
+- 数据库忙时批次留在通道队首原地重试，直到写入成功或队列关闭（通道保持先进先出，
+  确认位置按顺序推进）；其他原因无法写入的批次逐批隔离（转存到缓冲的隔离目录）
+- 队列中的事件数达到上限时拒绝新批次（接口返回 503 与 Retry-After）
+"""
+
+import os
+import math
+import time
+import zlib
+import threading
+from collections import deque
+from typing import Callable, Dict, List
+
+from core.db_connection import is_busy_error
+from integrations.event_spool import EventSpool
+
+# 队列中最多容纳的事件数（会话开始/结束记录也计入）
+INGEST_QUEUE_MAX_EVENTS = 100000
+
+# 写入线程每个事务最多合并的事件数
+INGEST_WRITE_BATCH_EVENTS = 5000
+
+# 数据库忙（SQLITE_BUSY / SQLITE_LOCKED）时的重试间隔（秒），用完后按最后一个间隔一直重试
+INGEST_RETRY_DELAYS = (0.5, 1.0, 2.0, 5.0)
+
+# 重启时每次重放的批次数
+INGEST_REPLAY_BATCHES = 20
+
+
+class IngestQueueFull(Exception):
+    """队列已满或正在关闭，批次未被接收"""
+
+
+class _Interrupted(Exception):
+    """关闭时放弃重试：批次不确认，留在磁盘缓冲中下次启动时重放"""
+
+
+class _Lane:
+    """一条写入通道：先进先出的批次队列、写入线程与可选的磁盘缓冲"""
+
+    def __init__(self, index: int, spool):
+        self.index = index
+        self.spool = spool
+        # (入队时间, 事件数, 批次, 会话集合, 缓冲位置)
+        self.items = deque()
+        # 保证缓冲中的顺序与队列顺序一致
+        self.append_lock = threading.Lock()
+        self.in_flight = 0
+        # 关闭时放弃了重试，仍有批次未写入
+        self.interrupted = False
+        self.thread = None
+
+
+class IngestQueue:
+    """有界的批次写入队列 + 按会话分区的写入线程"""
+
+    def __init__(self, ingest: Callable[[List[Dict]], object], workers: int = 1,
+                 max_events: int = INGEST_QUEUE_MAX_EVENTS,
+                 batch_events: int = INGEST_WRITE_BATCH_EVENTS,
+                 spool_dir: str = None, name: str = 'ingest-writer'):
+        """
+        Args:
+            ingest: 写入多个批次的函数（如 SQLiteAnalytics.ingest_batches），在一个事务中写入
+            workers: 写入线程（通道）数，单库时 1 个即可，分片时可与分片数相同
+            max_events: 队列容量（事件数）
+            batch_events: 每个事务最多合并的事件数
+            spool_dir: 磁盘缓冲目录（每条通道一个子目录 lane-<序号>），为空时不落盘
+            name: 写入线程名前缀
+        """
+        self.ingest = ingest
+        self.max_events = max_events
+        self.batch_events = batch_events
+
+        # 已有的通道缓冲都要重放，通道数不少于已有的缓冲目录数
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            existing = [entry for entry in os.listdir(spool_dir) if entry.startswith('lane-')]
+            workers = max(workers, len(existing))
+        self._lanes = [
+            _Lane(index, EventSpool(os.path.join(spool_dir, f'lane-{index:02d}')) if spool_dir else None)
+            for index in range(max(1, workers))
+        ]
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self._depth = 0
+        # 队列中各会话所在的通道与批次数
+        self._pending_sessions: Dict[str, list] = {}
+
+        # 计数器
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.quarantined = 0
+        self.transactions = 0
+        self.replayed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+
+        for lane in self._lanes:
+            lane.thread = threading.Thread(target=self._worker, args=(lane,),
+                                           name=f'{name}-{lane.index}', daemon=True)
+            lane.thread.start()
+
+    def put(self, batch: Dict) -> int:
+        """
+        批次入队（请求线程调用），配置了缓冲时先落盘
+
+        Args:
+            batch: {'sessions', 'events', 'session_ends', 'key'}
+
+        Returns:
+            批次的事件数
+
+        Raises:
+            IngestQueueFull: 队列已满或正在关闭
+        """
+        groups = [batch.get(field) or () for field in ('sessions', 'events', 'session_ends')]
+        size = max(1, sum(len(group) for group in groups))
+        session_ids = {item['session_id'] for group in groups for item in group}
+
+        with self._cond:
+            if self._closed:
+                self.rejected += 1
+                raise IngestQueueFull('ingest queue is shutting down')
+            if self._depth and self._depth + size > self.max_events:
+                self.rejected += 1
+                raise IngestQueueFull(f'ingest queue is full ({self._depth} events queued)')
+            lane = self._choose_lane(session_ids)
+            self._depth += size
+            for session_id in session_ids:
+                self._pending_sessions.setdefault(session_id, [lane.index, 0])[1] += 1
+
+        position = None
+        with lane.append_lock:
+            try:
+                if lane.spool is not None:
+                    position = lane.spool.append([batch])
+            except Exception:
+                with self._cond:
+                    self._release(size, session_ids)
+                raise
+            with self._cond:
+                lane.items.append((time.time(), size, batch, session_ids, position))
+                self.accepted += 1
+                self._cond.notify_all()
+        return size
+
+    def _choose_lane(self, session_ids) -> _Lane:
+        """同一会话的批次仍在队列中时进入同一通道，否则按会话 ID 哈希（调用方持有锁）"""
+        for session_id in session_ids:
+            pending = self._pending_sessions.get(session_id)
+            if pending:
+                return self._lanes[pending[0]]
+        key = min(session_ids) if session_ids else ''
+        return self._lanes[zlib.crc32(key.encode('utf-8')) % len(self._lanes)]
+
+    def _release(self, size: int, session_ids):
+        """批次出队后释放容量与会话占用（调用方持有锁）"""
+        self._depth -= size
+        for session_id in session_ids:
+            pending = self._pending_sessions.get(session_id)
+            if pending:
+                pending[1] -= 1
+                if pending[1] <= 0:
+                    del self._pending_sessions[session_id]
+
+    def _worker(self, lane: _Lane):
+        """写入线程：重放缓冲后，每次取出若干批次在一个事务中写入"""
+        if lane.spool is not None:
+            try:
+                replayed = lane.spool.replay(lambda batches: self._write(lane, batches),
+                                             INGEST_REPLAY_BATCHES)
+                with self._cond:
+                    self.replayed += replayed
+            except _Interrupted:
+                lane.interrupted = True
+                return
+            except Exception as e:
+                print(f"⚠️ 重放未写入的上报批次失败: {e}")
+
+        while True:
+            with self._cond:
+                while not lane.items and not self._closed:
+                    self._cond.wait()
+                if not lane.items:
+                    return
+                taken, events = [], 0
+                while lane.items and (not taken or events + lane.items[0][1] <= self.batch_events):
+                    item = lane.items.popleft()
+                    taken.append(item)
+                    events += item[1]
+                lane.in_flight = len(taken)
+
+            try:
+                failed = self._write(lane, [item[2] for item in taken])
+            except _Interrupted:
+                # 这些批次与通道中剩余的批次都已在缓冲中，下次启动时按顺序重放
+                with self._cond:
+                    lane.interrupted = True
+                    lane.in_flight = 0
+                    self._cond.notify_all()
+                return
+            position = taken[-1][4]
+            if position is not None:
+                try:
+                    lane.spool.ack(position)
+                except Exception as e:
+                    print(f"⚠️ 确认上报缓冲失败: {e}")
+
+            now = time.time()
+            with self._cond:
+                lane.in_flight = 0
+                self.transactions += 1
+                self.written += len(taken) - failed
+                self.failed += failed
+                for enqueued_at, size, _, session_ids, _ in taken:
+                    self._release(size, session_ids)
+                    latency = now - enqueued_at
+                    self.latency_total += latency
+                    self.latency_count += 1
+                    if latency > self.latency_max:
+                        self.latency_max = latency
+                self._cond.notify_all()
+
+    def _write(self, lane: _Lane, batches: List[Dict]) -> int:
+        """
+        写入若干批次，返回未能写入（已隔离或丢弃）的批次数
+
+        数据库忙（SQLITE_BUSY / SQLITE_LOCKED）时原地重试，直到写入成功或队列关闭；
+        其他错误（包括缺表、磁盘 I/O 错误、数据库损坏等 OperationalError）时逐批写入，无法写入的批次转存到缓冲的隔离目录（未配置缓冲时丢弃）。
+
+        Raises:
+            _Interrupted: 配置了缓冲且队列正在关闭，放弃重试
+        """
+        attempt = 0
+        while True:
+            try:
+                results = self.ingest(batches)
+                with self._cond:
+                    self.duplicates += sum(1 for _, duplicate in results or () if duplicate)
+                return 0
+            except Exception as e:
+                if not is_busy_error(e):
+                    if len(batches) > 1:
+                        return sum(self._write(lane, [batch]) for batch in batches)
+                    self._quarantine(lane, batches, e)
+                    return 1
+                if self._closed:
+                    if lane.spool is not None:
+                        raise _Interrupted() from e
+                    print(f"⚠️ 写入上报批次失败（数据库忙），已丢弃 {len(batches)} 批: {e}")
+                    return len(batches)
+                if attempt == 0:
+                    print(f"⚠️ 写入上报批次失败（数据库忙），重试中: {e}")
+                delay = INGEST_RETRY_DELAYS[min(attempt, len(INGEST_RETRY_DELAYS) - 1)]
+                attempt += 1
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, delay)
+
+    def _quarantine(self, lane: _Lane, batches: List[Dict], error: Exception):
+        """隔离无法写入的批次（之后照常确认，不阻塞后续批次）"""
+        with self._cond:
+            self.quarantined += len(batches)
+        if lane.spool is None:
+            print(f"⚠️ 上报批次无法写入，已丢弃: {error}")
+            return
+        try:
+            path = lane.spool.quarantine(batches)
+            print(f"⚠️ 上报批次无法写入，已转入隔离文件 {path}: {error}")
+        except Exception as e:
+            print(f"⚠️ 隔离无法写入的上报批次失败: {e}")
+
+    def retry_after(self) -> int:
+        """队列满时建议客户端等待的秒数（按最早批次的等待时间估计，1~60 秒）"""
+        with self._cond:
+            oldest = min((lane.items[0][0] for lane in self._lanes if lane.items), default=None)
+        lag = time.time() - oldest if oldest is not None else 0.0
+        return min(60, max(1, math.ceil(lag)))
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待队列中已有的批次全部写入
+
+        Returns:
+            是否在超时前写完
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while any(lane.items or lane.in_flight for lane in self._lanes):
+                if not any(lane.thread.is_alive() for lane in self._lanes):
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """
+        停止接收新批次，在限定时间内写完队列
+
+        未写完的批次保留在磁盘缓冲中（如已配置），下次启动时重放。
+
+        Returns:
+            是否在超时前全部写入
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        deadline = time.time() + timeout
+        for lane in self._lanes:
+            lane.thread.join(max(0.0, deadline - time.time()))
+        drained = not any(lane.thread.is_alive() or lane.interrupted for lane in self._lanes)
+        for lane in self._lanes:
+            if lane.spool is not None and not lane.thread.is_alive():
+                lane.spool.close()
+        return drained
+
+    def stats(self) -> Dict:
+        """队列深度、延迟与计数器快照"""
+        now = time.time()
+        with self._cond:
+            oldest = min((lane.items[0][0] for lane in self._lanes if lane.items), default=None)
+            return {
+                'depth_events': self._depth,
+                'depth_batches': sum(len(lane.items) + lane.in_flight for lane in self._lanes),
+                'max_events': self.max_events,
+                'workers': len(self._lanes),
+                'lanes': [len(lane.items) for lane in self._lanes],
+                'lag': now - oldest if oldest is not None else 0.0,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'written': self.written,
+                'duplicates': self.duplicates,
+                'failed': self.failed,
+                'quarantined': self.quarantined,
+                'transactions': self.transactions,
+                'replayed': self.replayed,
+                'avg_latency': self.latency_total / self.latency_count if self.latency_count else None,
+                'max_latency': self.latency_max,
+                'durable': self._lanes[0].spool is not None,
+            }
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程部署时的独立写入进程
+
+gunicorn 等预派生（pre-fork）服务器运行多个工作进程时，各进程不再各自写库：
+工作进程校验请求后通过本地套接字（multiprocessing.connection）把批次交给写入进程，
+写入进程持有唯一的写入队列（IngestQueue）、磁盘缓冲与数据保留任务，
+数据库写锁只由一个进程使用，磁盘缓冲也不会被多个进程同时追加。
+建表与迁移也只在写入进程中执行，工作进程以只读方式（mode=ro）打开数据库。
+
+- 写入进程把批次追加到磁盘缓冲（fsync）后才答复，工作进程随后返回 202
+- 写入进程的队列已满、正在关闭或无法连接时，工作进程返回 503 与 Retry-After
+- 收到 SIGTERM / SIGINT 后停止接收，在 WRITER_DRAIN_TIMEOUT 秒内写完队列后退出，
+  未写完的批次保留在磁盘缓冲中，下次启动时重放
+
+连接使用共享密钥（PYCHATCAT_INGEST_WRITER_KEY）认证，消息以 pickle 编码，
+写入进程只应监听本机地址。
+
+单独运行（例如配合其他 WSGI 服务器）：
+    PYCHATCAT_INGEST_WRITER=data/ingest_writer.sock PYCHATCAT_INGEST_WRITER_KEY=... \\
+        python -m backend.ingest_writer
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from typing import Dict
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.ingest_queue import IngestQueueFull
+
+# 关闭时等待队列写完的最长时间（秒）
+WRITER_DRAIN_TIMEOUT = float(os.environ.get('PYCHATCAT_WRITER_DRAIN_TIMEOUT', '20'))
+
+# 工作进程等待写入进程答复的最长时间（秒）
+WRITER_REPLY_TIMEOUT = 10.0
+
+# 写入进程不可用时建议客户端等待的秒数
+WRITER_UNAVAILABLE_RETRY_AFTER = 5
+
+# 启动时等待写入进程开始监听的最长时间（秒）
+WRITER_START_TIMEOUT = 60.0
+
+
+def default_address() -> str:
+    """默认的写入进程地址：POSIX 上为 data/ 下的 Unix 套接字，Windows 上为本机端口"""
+    if hasattr(os, 'fork'):
+        return os.path.join(project_root, 'data', 'ingest_writer.sock')
+    return '127.0.0.1:5055'
+
+
+def parse_address(text: str):
+    """解析地址配置：host:port 为 TCP 地址，否则为 Unix 套接字路径"""
+    host, _, port = text.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def format_address(address) -> str:
+    """parse_address 的逆操作"""
+    if isinstance(address, tuple):
+        return f'{address[0]}:{address[1]}'
+    return address
+
+
+def writer_authkey() -> bytes:
+    """读取连接密钥（PYCHATCAT_INGEST_WRITER_KEY）"""
+    key = os.environ.get('PYCHATCAT_INGEST_WRITER_KEY')
+    if not key:
+        raise RuntimeError('PYCHATCAT_INGEST_WRITER_KEY is not set')
+    return key.encode('utf-8')
+
+
+class IngestWriterServer:
+    """写入进程中的监听端：每个工作进程连接一个线程，把批次放入写入队列"""
+
+    def __init__(self, queue, address, authkey: bytes):
+        """
+        Args:
+            queue: 写入队列（IngestQueue）
+            address: 监听地址（parse_address 的结果）
+            authkey: 连接密钥
+        """
+        self.queue = queue
+        self.address = address
+        self.authkey = authkey
+        if isinstance(address, str) and os.path.exists(address):
+            # 上次异常退出时残留的套接字文件
+            os.remove(address)
+        self.listener = Listener(address, authkey=authkey)
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, name='ingest-writer-accept',
+                                        daemon=True)
+        self._thread.start()
+
+    def _accept_loop(self):
+        # 关闭时总是通过 accept 返回后退出：close() 的唤醒连接在认证握手中等待，必须被接受
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                if self._closed:
+                    return
+                print(f"⚠️ 写入进程拒绝连接: {e}")
+                continue
+            if self._closed:
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), name='ingest-writer-conn',
+                             daemon=True).start()
+
+    def _serve(self, conn):
+        """处理一个工作进程（线程）的请求，直到连接断开"""
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self._handle(message))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _handle(self, message):
+        op = message[0]
+        try:
+            if op == 'put':
+                return ('ok', self.queue.put(message[1]))
+            if op == 'stats':
+                return ('ok', self.queue.stats())
+            return ('error', f'unknown operation {op!r}')
+        except IngestQueueFull as e:
+            return ('full', str(e), self.queue.retry_after())
+        except Exception as e:
+            return ('error', str(e))
+
+    def close(self):
+        """停止接收新连接（已建立的连接上的新批次由队列以“正在关闭”拒绝）"""
+        if self._closed:
+            return
+        self._closed = True
+        # 阻塞中的 accept() 不会因关闭监听套接字而返回，连接一次将其唤醒
+        if self._thread is None:
+            self.listener.close()
+            return
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except Exception:
+            pass
+        self.listener.close()
+
+
+class IngestWriterClient:
+    """
+    工作进程中的写入进程客户端，接口与 IngestQueue 的 put / retry_after / stats / close 相同
+
+    每个线程使用自己的连接（请求/答复不会交错）；连接断开（如写入进程重启）时自动重连。
+    """
+
+    def __init__(self, address, authkey: bytes, timeout: float = WRITER_REPLY_TIMEOUT):
+        """
+        Args:
+            address: 写入进程地址（parse_address 的结果）
+            authkey: 连接密钥
+            timeout: 等待答复的最长时间（秒）
+        """
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _discard(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _unavailable(self, message: str):
+        self._local.retry_after = WRITER_UNAVAILABLE_RETRY_AFTER
+        return IngestQueueFull(message)
+
+    def _call(self, message):
+        """
+        发送一个请求并等待答复
+
+        发送失败（连接已失效）时重连重发一次；已发出但没有答复时不重发，
+        由客户端用同一个幂等键重试，避免重复写入。
+        """
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+            except (AuthenticationError, OSError, EOFError) as e:
+                raise self._unavailable(f'ingest writer unavailable: {e}')
+            try:
+                conn.send(message)
+            except (OSError, EOFError) as e:
+                self._discard()
+                if attempt:
+                    raise self._unavailable(f'ingest writer unavailable: {e}')
+                continue
+            try:
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f'no reply within {self.timeout}s')
+                return conn.recv()
+            except (OSError, EOFError) as e:
+                self._discard()
+                raise self._unavailable(f'ingest writer did not respond: {e}')
+
+    def put(self, batch: Dict) -> int:
+        """
+        把批次交给写入进程
+
+        Returns:
+            批次的事件数
+
+        Raises:
+            IngestQueueFull: 写入进程的队列已满、正在关闭或无法连接
+        """
+        reply = self._call(('put', batch))
+        if reply[0] == 'ok':
+            return reply[1]
+        if reply[0] == 'full':
+            self._local.retry_after = reply[2]
+            raise IngestQueueFull(reply[1])
+        raise RuntimeError(reply[1])
+
+    def retry_after(self) -> int:
+        """本线程上次被拒绝时写入进程建议的等待秒数"""
+        return getattr(self._local, 'retry_after', WRITER_UNAVAILABLE_RETRY_AFTER)
+
+    def stats(self) -> Dict:
+        """写入进程中队列的统计信息"""
+        reply = self._call(('stats',))
+        if reply[0] != 'ok':
+            raise RuntimeError(reply[1])
+        return dict(reply[1], writer=str(self.address))
+
+    def close(self, timeout: float = None) -> bool:
+        """关闭本进程的全部连接（批次在答复前已由写入进程落盘，无需等待）"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        return True
+
+
+def run_writer(address, authkey: bytes, drain_timeout: float = WRITER_DRAIN_TIMEOUT,
+               managed: bool = False):
+    """
+    写入进程主函数：打开数据库（建表与迁移，工作进程只读打开），启动写入队列与数据保留任务，
+    直到收到 SIGTERM / SIGINT
+
+    Args:
+        address: 监听地址（parse_address 的结果）
+        authkey: 连接密钥
+        drain_timeout: 关闭时等待队列写完的最长时间（秒）
+        managed: 由 gunicorn 主进程管理时忽略 SIGINT（终端 Ctrl+C 会发给整个进程组），
+            等工作进程处理完请求后由主进程发送 SIGTERM
+    """
+    from backend.storage import open_analytics, start_retention, create_ingest_queue
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN if managed else (lambda *_: stop.set()))
+
+    # 开始监听之前完成建表与迁移：工作进程以只读方式打开，要求数据库已经初始化
+    analytics, shards = open_analytics(readonly=False)
+    retention_managers = start_retention(shards)
+    queue = create_ingest_queue(analytics, min_workers=1)
+    server = IngestWriterServer(queue, address, authkey)
+    server.start()
+    print(f"✅ 写入进程已启动 (pid {os.getpid()}): {address}")
+
+    while not stop.wait(1.0):
+        pass
+
+    server.close()
+    drained = queue.close(drain_timeout)
+    for retention in retention_managers:
+        retention.stop()
+    if hasattr(analytics, 'close'):
+        analytics.close()
+    stats = queue.stats()
+    if drained:
+        print(f"✅ 写入进程已退出，共写入 {stats['written']} 个批次")
+    else:
+        print(f"⚠️ 写入进程退出时仍有 {stats['depth_batches']} 个批次未写入，已保留在磁盘缓冲中")
+
+
+def start_writer(address, authkey: bytes, timeout: float = WRITER_START_TIMEOUT):
+    """
+    在新进程中启动写入进程（python -m backend.ingest_writer --managed），等待其开始监听
+    （上次未写入的批次在后台重放）
+
+    使用 subprocess 而不是 multiprocessing：gunicorn 工作进程由主进程 fork 而来，
+    multiprocessing 记录的子进程会被工作进程在退出时错误地等待。
+
+    Returns:
+        subprocess.Popen
+    """
+    env = dict(os.environ, PYCHATCAT_INGEST_WRITER=format_address(address),
+               PYCHATCAT_INGEST_WRITER_KEY=authkey.decode('utf-8'))
+    process = subprocess.Popen([sys.executable, '-m', 'backend.ingest_writer', '--managed'],
+                               cwd=project_root, env=env)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            Client(address, authkey=authkey).close()
+            return process
+        except (OSError, EOFError):
+            if process.poll() is not None:
+                raise RuntimeError(f'ingest writer exited with code {process.returncode}')
+            if time.time() > deadline:
+                process.terminate()
+                raise RuntimeError(f'ingest writer did not start within {timeout}s')
+            time.sleep(0.1)
+
+
+def stop_writer(process, timeout: float = WRITER_DRAIN_TIMEOUT) -> bool:
+    """
+    通知写入进程退出并等待其写完队列
+
+    Returns:
+        是否在超时前退出（超时后强制结束，未写完的批次留在磁盘缓冲中）
+    """
+    if process is None or process.poll() is not None:
+        return True
+    process.terminate()
+    try:
+        process.wait(timeout + 5)
+        return True
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        return False
+
+
+if __name__ == '__main__':
+    run_writer(parse_address(os.environ.get('PYCHATCAT_INGEST_WRITER') or default_address()),
+               writer_authkey(), managed='--managed' in sys.argv[1:])
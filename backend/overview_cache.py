@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+总体统计（/api/analytics/overview）的结果缓存
+
+每个 days 窗口缓存一份统计结果及其 ETag（结果内容的哈希）：
+
+- 结果生成后 OVERVIEW_MIN_AGE 秒内直接使用；之后只在数据库写入水位
+  （analytics.data_version()）不变时继续使用，最长 OVERVIEW_CACHE_TTL 秒
+  （统计窗口随时间推移，超过后必须重新计算）
+- 后台线程定期刷新最近被请求过的窗口，仪表盘轮询时总是命中缓存
+- 数据未变化时重新计算得到相同的 ETag，客户端带 If-None-Match 请求时返回 304
+"""
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+# 结果生成后无条件使用的时长（秒），也是响应的 Cache-Control max-age
+OVERVIEW_MIN_AGE = 5.0
+
+# 结果的最长使用时长（秒）
+OVERVIEW_CACHE_TTL = 300.0
+
+# 后台刷新的间隔（秒），以及多久内被请求过的窗口算作常用窗口
+OVERVIEW_REFRESH_INTERVAL = 5.0
+OVERVIEW_POPULAR_SECONDS = 600.0
+
+# 最多缓存的窗口数
+OVERVIEW_CACHE_SIZE = 32
+
+
+def make_etag(payload) -> str:
+    """结果内容的强 ETag"""
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return '"' + hashlib.sha1(text.encode('utf-8')).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 请求头是否包含该 ETag（忽略弱校验前缀 W/）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or any(
+        (value[2:] if value.startswith('W/') else value) == etag for value in candidates
+    )
+
+
+class _Entry:
+    __slots__ = ('overview', 'etag', 'watermark', 'computed_at', 'last_used')
+
+    def __init__(self, overview: Dict, etag: str, watermark, computed_at: float):
+        self.overview = overview
+        self.etag = etag
+        self.watermark = watermark
+        self.computed_at = computed_at
+        self.last_used = computed_at
+
+
+class OverviewCache:
+    """按 days 窗口缓存总体统计，写入水位变化或超时后重新计算"""
+
+    def __init__(self, compute: Callable[[int], Dict], watermark: Callable[[], object],
+                 min_age: float = OVERVIEW_MIN_AGE, ttl: float = OVERVIEW_CACHE_TTL,
+                 refresh_interval: float = OVERVIEW_REFRESH_INTERVAL,
+                 max_entries: int = OVERVIEW_CACHE_SIZE):
+        """
+        Args:
+            compute: 计算统计结果的函数（如 analytics.get_overview_stats）
+            watermark: 返回数据库写入水位的函数（如 analytics.data_version）
+            min_age: 结果生成后无条件使用的时长（秒）
+            ttl: 结果的最长使用时长（秒）
+            refresh_interval: 后台刷新间隔（秒），为 0 时不启动后台线程
+            max_entries: 最多缓存的窗口数
+        """
+        self.compute = compute
+        self.watermark = watermark
+        self.min_age = min_age
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        # 同一时刻只计算一个窗口，并发的冷请求等待同一次计算的结果
+        self._compute_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # 计数器
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self, days: int) -> Tuple[Dict, str, float]:
+        """
+        取得某个窗口的统计结果
+
+        Returns:
+            (统计结果, ETag, 结果已生成的秒数)
+        """
+        self._start()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(days)
+            if entry is not None:
+                entry.last_used = now
+                self._entries.move_to_end(days)
+        if entry is not None and self._is_fresh(entry, now):
+            with self._lock:
+                self.hits += 1
+            return entry.overview, entry.etag, now - entry.computed_at
+
+        with self._lock:
+            self.misses += 1
+        entry = self._refresh(days)
+        return entry.overview, entry.etag, time.time() - entry.computed_at
+
+    def _is_fresh(self, entry: _Entry, now: float) -> bool:
+        age = now - entry.computed_at
+        if age < self.min_age:
+            return True
+        if age >= self.ttl:
+            return False
+        return self.watermark() == entry.watermark
+
+    def _refresh(self, days: int) -> _Entry:
+        """重新计算某个窗口（其他线程刚刚算完时直接使用其结果）"""
+        with self._compute_lock:
+            with self._lock:
+                entry = self._entries.get(days)
+            if entry is not None and self._is_fresh(entry, time.time()):
+                return entry
+            # 先读取水位再计算：计算期间的新写入会在下次检查时被发现
+            watermark = self.watermark()
+            overview = self.compute(days)
+            fresh = _Entry(overview, make_etag(overview), watermark, time.time())
+            with self._lock:
+                if entry is not None:
+                    fresh.last_used = entry.last_used
+                self._entries[days] = fresh
+                self._entries.move_to_end(days)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self.refreshes += 1
+            return fresh
+
+    def _start(self):
+        """首次请求时启动后台刷新线程"""
+        if self._thread is not None or self.refresh_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresher, name='overview-cache',
+                                                daemon=True)
+                self._thread.start()
+
+    def _refresher(self):
+        """后台线程：刷新最近被请求过且已过期的窗口"""
+        while not self._stop.wait(self.refresh_interval):
+            now = time.time()
+            with self._lock:
+                popular = [days for days, entry in self._entries.items()
+                           if now - entry.last_used < OVERVIEW_POPULAR_SECONDS]
+            for days in popular:
+                if self._stop.is_set():
+                    return
+                try:
+                    with self._lock:
+                        entry = self._entries.get(days)
+                    if entry is None or not self._is_fresh(entry, time.time()):
+                        self._refresh(days)
+                except Exception as e:
+                    print(f"⚠️ 刷新总体统计缓存失败: {e}")
+
+    def invalidate(self):
+        """清空缓存（如数据被批量修改后）"""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'windows': list(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+            }
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后端的数据存储配置
+
+Flask 应用（backend/app.py）与多进程部署时的写入进程（backend/ingest_writer.py）
+使用同一套配置打开分析数据库、启动数据保留任务和创建写入队列。
+"""
+
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多进程部署，不加锁
+    fcntl = None
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from core.sqlite_analytics import SQLiteAnalytics
+from core.sharded_analytics import ShardedAnalytics
+from core.analytics_retention import RetentionManager
+from backend.ingest_queue import IngestQueue, INGEST_QUEUE_MAX_EVENTS
+
+# 分片数量：大于 1 时按 user_id 哈希将学生分布到多个数据库文件，写入可并行
+# （可通过 PYCHATCAT_SHARDS 设置，创建后不要修改）
+SHARD_COUNT = int(os.environ.get('PYCHATCAT_SHARDS', '1'))
+
+# 异步写入：上报接口校验后放入写入队列并返回 202，由写入线程批量写库
+# PYCHATCAT_INGEST_WORKERS 为写入线程数（默认每个分片一个，0 表示在请求线程中同步写入），
+# PYCHATCAT_INGEST_QUEUE_EVENTS 为队列容量（事件数），
+# PYCHATCAT_INGEST_SPOOL 为磁盘缓冲目录（空字符串表示不落盘）
+INGEST_WORKERS = int(os.environ.get('PYCHATCAT_INGEST_WORKERS', str(max(1, SHARD_COUNT))))
+INGEST_QUEUE_EVENTS = int(os.environ.get('PYCHATCAT_INGEST_QUEUE_EVENTS', str(INGEST_QUEUE_MAX_EVENTS)))
+INGEST_SPOOL_DIR = os.environ.get('PYCHATCAT_INGEST_SPOOL', os.path.join(project_root, 'data', 'ingest_spool'))
+
+# 本进程持有的磁盘缓冲锁文件（进程退出时自动释放）
+_spool_lock = None
+
+
+def open_analytics(readonly: bool = False):
+    """
+    打开分析数据库 - 使用项目根目录的数据库路径
+
+    Args:
+        readonly: 只读打开（多进程部署的工作进程），建表与迁移只在写入进程中执行
+
+    Returns:
+        (analytics, 分片列表)，未分片时分片列表只有 analytics 本身
+    """
+    if SHARD_COUNT > 1:
+        analytics = ShardedAnalytics(data_dir=os.path.join(project_root, 'data', 'shards'),
+                                     num_shards=SHARD_COUNT, readonly=readonly)
+        return analytics, analytics.shards
+    analytics = SQLiteAnalytics(db_path=os.path.join(project_root, 'data', 'learning_analytics.db'),
+                                readonly=readonly)
+    return analytics, [analytics]
+
+
+def start_retention(shards):
+    """
+    数据保留：空闲时归档过期数据并压缩数据库（可通过 PYCHATCAT_RETENTION=false 关闭）
+
+    分片共用一个目录，各分片的归档分别放在 archive/<分片文件名>/ 下。
+
+    Returns:
+        各分片的 RetentionManager 列表（关闭时未启动）
+    """
+    retention_managers = [
+        RetentionManager(shard, archive_dir=os.path.join(
+            project_root, 'data', 'shards', 'archive',
+            os.path.splitext(os.path.basename(shard.db_path))[0]
+        ) if SHARD_COUNT > 1 else None)
+        for shard in shards
+    ]
+    if os.environ.get('PYCHATCAT_RETENTION', 'true').lower() == 'true':
+        for retention in retention_managers:
+            retention.start()
+    return retention_managers
+
+
+def _lock_spool(spool_dir: str) -> bool:
+    """
+    锁定磁盘缓冲目录，保证只有一个进程向其中追加和重放
+
+    Returns:
+        是否成功锁定（已被其他进程锁定时返回 False）
+    """
+    global _spool_lock
+    if fcntl is None or _spool_lock is not None:
+        return True
+    os.makedirs(spool_dir, exist_ok=True)
+    handle = open(os.path.join(spool_dir, '.lock'), 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _spool_lock = handle
+    return True
+
+
+def create_ingest_queue(analytics, min_workers: int = 0):
+    """
+    按配置创建写入队列
+
+    磁盘缓冲目录已被其他进程使用时（如未使用 backend/gunicorn.conf.py 直接以多个工作进程运行），
+    本进程改为同步写入，由 SQLite 的写锁协调各进程。
+
+    Args:
+        analytics: 分析器（SQLiteAnalytics 或 ShardedAnalytics）
+        min_workers: 最少写入线程数（写入进程总是使用异步队列）
+
+    Returns:
+        IngestQueue，同步写入时返回 None
+
+    Raises:
+        RuntimeError: 写入进程（min_workers > 0）无法独占磁盘缓冲目录
+    """
+    workers = max(INGEST_WORKERS, min_workers)
+    if workers <= 0:
+        return None
+    if INGEST_SPOOL_DIR and not _lock_spool(INGEST_SPOOL_DIR):
+        if min_workers:
+            raise RuntimeError(f'ingest spool {INGEST_SPOOL_DIR} is used by another process')
+        print("⚠️ 写入队列的磁盘缓冲已被其他进程使用，本进程改为同步写入"
+              "（多进程部署请使用 backend/gunicorn.conf.py）")
+        return None
+    return IngestQueue(analytics.ingest_batches, workers=workers,
+                       max_events=INGEST_QUEUE_EVENTS, spool_dir=INGEST_SPOOL_DIR or None)
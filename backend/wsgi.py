@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WSGI 入口 - 生产环境多进程部署
+
+在项目根目录运行：
+    gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+gunicorn 主进程先启动独立的写入进程（backend/ingest_writer.py），再派生多个工作进程；
+每个工作进程各自导入应用、打开自己的数据库连接，只读数据库，上报的批次交给写入进程写入。
+其他 WSGI 服务器请先单独运行写入进程，并为工作进程设置相同的
+PYCHATCAT_INGEST_WRITER / PYCHATCAT_INGEST_WRITER_KEY（单进程服务器可以不设置）。
+"""
+
+import os
+import sys
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from backend.app import app, write_index_template
+
+if not os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'templates', 'index.html')):
+    write_index_template()
+
+application = app
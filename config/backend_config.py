@@ -20,3 +20,12 @@ REQUEST_TIMEOUT = float(os.environ.get("PYCHATCAT_REQUEST_TIMEOUT", "5"))
 BACKEND_URL = _DEFAULT_URL.rstrip("/") if _DEFAULT_URL else ""
 
 
+# 云端批量上报：每批最多事件数、最早的事件最多等待的秒数
+CLOUD_BATCH_SIZE = int(os.environ.get("PYCHATCAT_CLOUD_BATCH_SIZE", "200"))
+CLOUD_FLUSH_INTERVAL = float(os.environ.get("PYCHATCAT_CLOUD_FLUSH_INTERVAL", "10"))
+
+# 云端上报的本地发件箱：网络不可用时保存未上传的批次，恢复后重发（设为空字符串关闭）
+CLOUD_OUTBOX_PATH = os.environ.get("PYCHATCAT_CLOUD_OUTBOX", os.path.join("data", "cloud_outbox.db")).strip()
+
+# 与云端的最大并发连接数（所有请求共用一个保持连接的会话）
+CLOUD_MAX_CONNECTIONS = int(os.environ.get("PYCHATCAT_CLOUD_MAX_CONNECTIONS", "2"))
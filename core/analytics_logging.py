@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析日志配置
+
+- 日志记录只放入内存队列，由后台监听线程写文件，事件写入路径不再等待磁盘 IO
+- 逐事件日志按级别采样：DEBUG 全量记录，INFO 每 N 条记录 1 条，更高级别不记录
+- 日志文件按大小轮转，轮转出的旧文件压缩为 .gz
+"""
+
+import os
+import gzip
+import shutil
+import queue
+import atexit
+import logging
+import itertools
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
+
+# 日志目录与轮转设置
+LOG_DIR = 'logs'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 日志级别（可通过 PYCHATCAT_LOG_LEVEL 覆盖，如 DEBUG / INFO / WARNING）
+LOG_LEVEL = os.environ.get('PYCHATCAT_LOG_LEVEL', 'INFO').upper()
+
+# 逐事件日志的采样间隔：日志器级别 -> 每多少个事件记录一条
+EVENT_SAMPLE_RATES = {
+    logging.DEBUG: 1,
+    logging.INFO: int(os.environ.get('PYCHATCAT_LOG_SAMPLE', '100')),
+}
+
+# 已配置的日志器 -> 后台监听器（同一进程内多次创建分析器时不重复添加处理器）
+_listeners: Dict[str, QueueListener] = {}
+_listeners_lock = threading.Lock()
+
+
+class GzipRotatingFileHandler(RotatingFileHandler):
+    """按大小轮转的文件处理器，轮转出的旧文件压缩保存"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = self._gzip_name
+        self.rotator = self._gzip_rotate
+
+    @staticmethod
+    def _gzip_name(name: str) -> str:
+        return name + '.gz'
+
+    @staticmethod
+    def _gzip_rotate(source: str, dest: str):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+class EventSampler:
+    """按日志器当前级别对逐事件日志采样"""
+
+    def __init__(self, logger: logging.Logger, rates: Dict[int, int] = None):
+        """
+        Args:
+            logger: 目标日志器
+            rates: 级别 -> 采样间隔，默认 EVENT_SAMPLE_RATES；未列出的级别不记录逐事件日志
+        """
+        self.logger = logger
+        self.rates = EVENT_SAMPLE_RATES if rates is None else rates
+        self._counter = itertools.count()
+
+    def should_log(self) -> bool:
+        """本次事件是否需要写日志"""
+        rate = self.rates.get(self.logger.getEffectiveLevel())
+        if not rate or rate < 1:
+            return False
+        return rate == 1 or next(self._counter) % rate == 0
+
+
+def setup_analytics_logging(name: str = 'learning_analytics', log_dir: str = LOG_DIR,
+                            level: str = LOG_LEVEL) -> logging.Logger:
+    """
+    配置异步写入的分析日志器（重复调用直接返回已配置的日志器）
+
+    Args:
+        name: 日志器名称
+        log_dir: 日志目录
+        level: 日志级别
+
+    Returns:
+        日志器
+    """
+    logger = logging.getLogger(name)
+    with _listeners_lock:
+        if name in _listeners:
+            return logger
+
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = logging.Formatter(LOG_FORMAT)
+
+        # 文件处理器（在监听线程中写入与轮转）
+        file_handler = GzipRotatingFileHandler(
+            os.path.join(log_dir, f"analytics_{datetime.now().strftime('%Y%m%d')}.log"),
+            maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+
+        # 控制台处理器
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.WARNING)
+        console_handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, console_handler,
+                                 respect_handler_level=True)
+        listener.start()
+        # 进程退出前写完队列中剩余的日志
+        atexit.register(listener.stop)
+        _listeners[name] = listener
+
+        logger.setLevel(getattr(logging, level, logging.INFO))
+        logger.addHandler(QueueHandler(log_queue))
+    return logger
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析数据库的数据保留、归档与压缩
+
+- 超过保留期的原始事件按月归档为 gzip 压缩的 JSON Lines 文件后从热库删除
+- 删除的原始数据已计入汇总表（session_rollups / user_day_rollups），统计不受影响
+- 空闲时执行增量 VACUUM 与 ANALYZE，保持热库体积与查询计划稳定
+- 旧数据库转换为增量 auto_vacuum 需要一次完整 VACUUM，只在停机维护时手动执行：
+    python -m core.analytics_retention data/learning_analytics.db
+"""
+
+import os
+import sys
+import json
+import gzip
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from core.sqlite_analytics import SQLiteAnalytics, encode_export_rows
+
+# 各事件表原始数据的默认保留天数
+DEFAULT_RETENTION_DAYS = {
+    'learning_behaviors': 180,
+    'code_operations': 365,
+    'ai_interactions': 365,
+    'error_analysis': 365,
+    'code_snapshots': 365,
+}
+
+# 高频行为单独设置更短的保留期（悬停与键入事件占据了绝大部分行数）
+BEHAVIOR_RETENTION_DAYS = {
+    'VC': 30,
+    'CP': 30,
+    'SC': 60,
+}
+
+
+class RetentionManager:
+    """数据保留管理器：归档、清理与空闲时压缩"""
+
+    def __init__(self, analytics: SQLiteAnalytics, archive_dir: str = None,
+                 retention_days: Dict[str, int] = None,
+                 behavior_retention_days: Dict[str, int] = None,
+                 batch_size: int = 5000, max_vacuum_pages: int = 2000):
+        """
+        初始化保留管理器
+
+        Args:
+            analytics: 分析器实例
+            archive_dir: 归档目录，默认为数据库所在目录下的 archive/
+            retention_days: 各事件表的保留天数，默认 DEFAULT_RETENTION_DAYS
+            behavior_retention_days: 按行为编码覆盖的保留天数，默认 BEHAVIOR_RETENTION_DAYS
+            batch_size: 每批归档/删除的行数（控制单个写事务的时长）
+            max_vacuum_pages: 每次增量 VACUUM 最多回收的页数
+        """
+        self.analytics = analytics
+        self.db_path = analytics.db_path
+        self.archive_dir = archive_dir or os.path.join(
+            os.path.dirname(os.path.abspath(self.db_path)), 'archive'
+        )
+        self.retention_days = dict(DEFAULT_RETENTION_DAYS if retention_days is None else retention_days)
+        self.behavior_retention_days = dict(
+            BEHAVIOR_RETENTION_DAYS if behavior_retention_days is None else behavior_retention_days
+        )
+        self.batch_size = batch_size
+        self.max_vacuum_pages = max_vacuum_pages
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._vacuum_warned = False
+
+        with self.analytics.connect() as conn:
+            # 记录每个归档文件已确认写入的字节数，用于中断后截断重复数据
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    row_count INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP
+                )
+            ''')
+            conn.commit()
+
+        self._repair_archives()
+
+    # ---- 归档与清理 -------------------------------------------------------
+    def archive_expired(self, now: datetime = None) -> Dict[str, int]:
+        """
+        将超过保留期的原始事件归档并从热库删除
+
+        Returns:
+            各表归档的行数
+        """
+        now = now or datetime.now()
+        self._repair_archives()
+        archived = {}
+        for table in self.retention_days:
+            condition, params = self._expired_condition(table, now)
+            archived[table] = self._archive_table(table, condition, params)
+
+        total = sum(archived.values())
+        if total:
+            self.analytics.logger.info(f"Archived {total} expired rows: {archived}")
+        return archived
+
+    def _expired_condition(self, table: str, now: datetime):
+        """构造某张表“已过保留期”的 WHERE 条件"""
+        cutoff = now - timedelta(days=self.retention_days[table])
+        if table == 'code_snapshots':
+            # 差异版本依赖其前面直到最近一个完整版本的所有版本：
+            # 只有之后（到下一个完整版本为止）没有未过期版本时才能删除，否则保留的版本无法还原
+            return '''(timestamp < ? AND NOT EXISTS (
+                SELECT 1 FROM code_snapshots later
+                WHERE later.session_id = code_snapshots.session_id
+                  AND later.file_key = code_snapshots.file_key
+                  AND later.seq > code_snapshots.seq
+                  AND later.timestamp >= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM code_snapshots base
+                      WHERE base.session_id = later.session_id
+                        AND base.file_key = later.file_key
+                        AND base.content IS NOT NULL
+                        AND base.seq > code_snapshots.seq
+                        AND base.seq <= later.seq
+                  )
+            ))''', [cutoff, cutoff]
+        if table != 'learning_behaviors' or not self.behavior_retention_days:
+            return 'timestamp < ?', [cutoff]
+
+        codes = list(self.behavior_retention_days)
+        placeholders = ', '.join('?' for _ in codes)
+        clauses = [f'(behavior_code NOT IN ({placeholders}) AND timestamp < ?)']
+        params = codes + [cutoff]
+        for code, days in self.behavior_retention_days.items():
+            clauses.append('(behavior_code = ? AND timestamp < ?)')
+            params.extend([code, now - timedelta(days=days)])
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def _archive_table(self, table: str, condition: str, params: List) -> int:
+        """分批归档并删除满足条件的行"""
+        total = 0
+        while not self._stop_event.is_set():
+            columns = self.analytics.base_columns(table)
+            with self.analytics.connect() as conn:
+                rows = conn.execute(
+                    f'SELECT rowid, {", ".join(columns)} FROM {table} '
+                    f'WHERE {condition} ORDER BY rowid LIMIT ?',
+                    params + [self.batch_size]
+                ).fetchall()
+            if not rows:
+                break
+
+            # 按月份分组写入归档文件
+            months: Dict[str, List[tuple]] = {}
+            for row in rows:
+                months.setdefault(str(row[columns.index('timestamp') + 1])[:7], []).append(row[1:])
+            sizes = {}
+            for month, month_rows in months.items():
+                path = self.archive_path(table, month)
+                sizes[path] = (self._append_archive(path, table, columns, month_rows), len(month_rows))
+
+            # 归档文件落盘后再删除原始行及其全文索引行，并记录文件的有效长度
+            rowids = [row[0] for row in rows]
+            with self.analytics.lock:
+                with self.analytics.connect() as conn:
+                    conn.executemany(f'DELETE FROM {table} WHERE rowid = ?',
+                                     [(rowid,) for rowid in rowids])
+                    self.analytics.remove_search_rows(conn, table, rowids)
+                    for path, (size, count) in sizes.items():
+                        conn.execute('''
+                            INSERT INTO archive_files (path, size, row_count, updated_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(path) DO UPDATE SET
+                                size = excluded.size,
+                                row_count = row_count + excluded.row_count,
+                                updated_at = excluded.updated_at
+                        ''', (path, size, count, datetime.now()))
+                    conn.commit()
+            total += len(rows)
+        return total
+
+    def _repair_archives(self):
+        """将归档文件截断到已确认的长度（上次中断时可能写入了未删除原始行的数据）"""
+        with self.analytics.connect() as conn:
+            rows = conn.execute('SELECT path, size FROM archive_files').fetchall()
+        for path, size in rows:
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def _append_archive(self, path: str, table: str, columns: List[str], rows: List[tuple]) -> int:
+        """追加一个 gzip 成员到归档文件，返回写入后的文件长度"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.analytics.connect() as conn:
+            row = conn.execute('SELECT size FROM archive_files WHERE path = ?', (path,)).fetchone()
+        committed = row[0] if row else 0
+
+        with open(path, 'ab') as f:
+            # 首次写入或未登记的文件从头开始
+            if f.tell() != committed:
+                f.truncate(committed)
+                f.seek(committed)
+            f.write(gzip.compress(encode_export_rows(table, columns, rows, 'jsonl').encode('utf-8')))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def archive_path(self, table: str, month: str) -> str:
+        """归档文件路径：<archive_dir>/<表名>/<YYYY-MM>.jsonl.gz"""
+        return os.path.join(self.archive_dir, table, f'{month}.jsonl.gz')
+
+    # ---- 历史数据查询 -----------------------------------------------------
+    def list_archives(self, table: str = None) -> List[Dict]:
+        """列出已有的归档文件"""
+        with self.analytics.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('SELECT * FROM archive_files ORDER BY path').fetchall()
+        archives = []
+        for row in rows:
+            archive_table = os.path.basename(os.path.dirname(row['path']))
+            if table and archive_table != table:
+                continue
+            archives.append({
+                'table': archive_table,
+                'month': os.path.basename(row['path'])[:7],
+                **dict(row)
+            })
+        return archives
+
+    def iter_archive(self, table: str, month: str = None, session_id: str = None,
+                     user_id: str = None):
+        """
+        逐行读取归档数据
+
+        Args:
+            table: 事件表名
+            month: 可选，只读取某个月（YYYY-MM）
+            session_id / user_id: 可选过滤条件
+
+        Yields:
+            事件字典
+        """
+        for archive in self.list_archives(table):
+            if month and archive['month'] != month:
+                continue
+            with gzip.open(archive['path'], 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)['data']
+                    if session_id and record.get('session_id') != session_id:
+                        continue
+                    if user_id and record.get('user_id') != user_id:
+                        continue
+                    yield record
+
+    # ---- 压缩与统计信息 ---------------------------------------------------
+    def compact(self):
+        """
+        增量回收空闲页并更新查询优化器统计信息
+
+        每次最多回收 max_vacuum_pages 页，持有写锁的时间有限；
+        未启用增量 auto_vacuum 的旧数据库只更新统计信息，需先手动执行 vacuum_full()。
+        """
+        with self.analytics.lock:
+            conn = self.analytics.connect(isolation_level=None)
+            try:
+                auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+                if auto_vacuum == 2:
+                    # 每执行一步只回收一页：execute() 只执行第一步，executescript() 执行到结束
+                    conn.executescript(f'PRAGMA incremental_vacuum({int(self.max_vacuum_pages)});')
+                elif not self._vacuum_warned:
+                    self._vacuum_warned = True
+                    self.analytics.logger.warning(
+                        f"Incremental auto_vacuum is off for {self.db_path}; free pages are not "
+                        f"reclaimed until 'python -m core.analytics_retention {self.db_path}' is run"
+                    )
+                conn.execute('ANALYZE')
+            finally:
+                conn.close()
+
+    def vacuum_full(self):
+        """
+        完整 VACUUM：将旧数据库切换为增量 auto_vacuum 并回收全部空闲页
+
+        需要重写整个数据库文件，期间阻塞所有写入，只在停机维护时手动执行，不在空闲调度中调用。
+        """
+        with self.analytics.lock:
+            conn = self.analytics.connect(isolation_level=None)
+            try:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            finally:
+                conn.close()
+        self._vacuum_warned = False
+        self.analytics.logger.info(f"Vacuumed {self.db_path} (auto_vacuum = INCREMENTAL)")
+
+    def run_maintenance(self) -> Dict[str, int]:
+        """执行一次完整维护：归档过期数据后压缩"""
+        archived = self.archive_expired()
+        self.compact()
+        return archived
+
+    # ---- 空闲调度 ---------------------------------------------------------
+    def start(self, check_interval: float = 600, idle_seconds: float = 300):
+        """
+        启动后台调度：数据库在 idle_seconds 内没有新的写入时执行维护
+
+        Args:
+            check_interval: 检查间隔（秒）
+            idle_seconds: 判定空闲所需的无写入时长（秒）
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._schedule_worker, args=(check_interval, idle_seconds), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台调度"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _schedule_worker(self, check_interval: float, idle_seconds: float):
+        """后台线程：通过 PRAGMA data_version 检测其他连接（包括其他进程）的写入"""
+        monitor = self.analytics.connect(check_same_thread=False)
+        last_version = None
+        last_change = time.time()
+        maintained_version = None
+        try:
+            while not self._stop_event.wait(check_interval):
+                version = monitor.execute('PRAGMA data_version').fetchone()[0]
+                if version != last_version:
+                    last_version = version
+                    last_change = time.time()
+                if time.time() - last_change < idle_seconds or version == maintained_version:
+                    continue
+                try:
+                    self.run_maintenance()
+                except sqlite3.Error as e:
+                    self.analytics.logger.warning(f"Retention maintenance failed: {e}")
+                maintained_version = monitor.execute('PRAGMA data_version').fetchone()[0]
+                last_version = maintained_version
+        finally:
+            monitor.close()
+
+
+if __name__ == '__main__':
+    # 停机维护：python -m core.analytics_retention <数据库文件>...
+    for path in sys.argv[1:] or ['data/learning_analytics.db']:
+        RetentionManager(SQLiteAnalytics(db_path=path)).vacuum_full()
+        print(f"✅ 已完成 VACUUM: {path}")
@@ -15,6 +15,28 @@ import os
 import uuid
 from collections import defaultdict, deque
 
+try:
+    from core.event_records import (AIInteractionEvent, BehaviorEvent, CodeOperationEvent,
+                                    ErrorEvent, EventRecord)
+    from core.sqlite_analytics import BEHAVIOR_MAPPING
+except ImportError:
+    from event_records import (AIInteractionEvent, BehaviorEvent, CodeOperationEvent,  # type: ignore
+                               ErrorEvent, EventRecord)
+    from sqlite_analytics import BEHAVIOR_MAPPING  # type: ignore
+
+# track_learning_behavior 的行为类型到行为编码的映射（传入的已是行为编码时直接使用，
+# 没有对应编码的类型 behavior_code 为 None，原始类型保存在 additional_data 中）
+LEARNING_BEHAVIOR_CODES = {
+    'error_encountered': 'VE',
+    'error_fix': 'VE',
+    'suggestion_viewed': 'RF',
+    'example_view': 'RAM',
+    'help_usage': 'RAM',
+}
+
+# 复制粘贴动作到行为编码的映射
+COPY_PASTE_CODES = {'copy': 'CC', 'paste': 'PC'}
+
 class AnalyticsTracker:
     """学生行为数据追踪器"""
     
@@ -69,24 +91,19 @@ class AnalyticsTracker:
     def track_code_run(self, code: str, success: bool, error_msg: str = None, 
                       execution_time: float = None):
         """追踪代码运行行为"""
-        event = {
-            'event_type': 'code_run',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
+        event = CodeOperationEvent(
+            self.session_id, 'run', success=success, error_message=error_msg,
+            execution_time=execution_time,
+            additional_data={
                 'code_length': len(code),
                 'code_lines': len(code.split('\n')),
-                'success': success,
-                'error_message': error_msg,
-                'execution_time': execution_time,
                 'has_imports': 'import ' in code,
                 'has_functions': 'def ' in code,
                 'has_classes': 'class ' in code,
                 'has_loops': any(keyword in code for keyword in ['for ', 'while ']),
                 'has_conditions': any(keyword in code for keyword in ['if ', 'elif ', 'else:'])
             }
-        }
+        )
         self._add_event(event)
         self.stats['code_operations']['total_runs'] += 1
         if success:
@@ -97,18 +114,11 @@ class AnalyticsTracker:
     def track_debug_operation(self, operation_type: str, line_number: int = None,
                             breakpoints: List[int] = None, duration: float = None):
         """追踪调试操作"""
-        event = {
-            'event_type': 'debug_operation',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'operation_type': operation_type,  # 'breakpoint_set', 'step_over', 'step_into', etc.
-                'line_number': line_number,
-                'breakpoints_count': len(breakpoints) if breakpoints else 0,
-                'duration': duration
-            }
-        }
+        event = BehaviorEvent(self.session_id, 'DP', duration=duration, additional_data={
+            'operation_type': operation_type,  # 'breakpoint_set', 'step_over', 'step_into', etc.
+            'line_number': line_number,
+            'breakpoints_count': len(breakpoints) if breakpoints else 0
+        })
         self._add_event(event)
         self.stats['code_operations'][f'debug_{operation_type}'] += 1
     
@@ -123,18 +133,12 @@ class AnalyticsTracker:
             content_length: 内容长度
             content_type: 内容类型 ('code', 'text', 'ai_response')
         """
-        event = {
-            'event_type': 'copy_paste',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'action': action,
-                'source': source,
-                'content_length': content_length,
-                'content_type': content_type
-            }
-        }
+        event = BehaviorEvent(self.session_id, COPY_PASTE_CODES.get(action), additional_data={
+            'action': action,
+            'source': source,
+            'content_length': content_length,
+            'content_type': content_type
+        })
         self._add_event(event)
         self.stats['learning_behavior'][f'{action}_{source}'] += 1
     
@@ -149,39 +153,26 @@ class AnalyticsTracker:
             typing_duration: 输入耗时
             auto_complete_used: 是否使用了自动补全
         """
-        event = {
-            'event_type': 'code_input',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'input_type': input_type,
-                'code_length': code_length,
-                'typing_duration': typing_duration,
-                'auto_complete_used': auto_complete_used,
-                'is_original': input_type == 'manual'
-            }
-        }
+        event = BehaviorEvent(self.session_id, 'CP', duration=typing_duration, additional_data={
+            'input_type': input_type,
+            'code_length': code_length,
+            'auto_complete_used': auto_complete_used,
+            'is_original': input_type == 'manual'
+        })
         self._add_event(event)
         self.stats['learning_behavior'][f'input_{input_type}'] += 1
     
     def track_ai_interaction(self, question: str, response_time: float = None,
                            response_length: int = None, suggestion_used: bool = False):
         """追踪AI交互行为"""
-        event = {
-            'event_type': 'ai_interaction',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'question_length': len(question),
-                'question_type': self._classify_question_type(question),
-                'response_time': response_time,
-                'response_length': response_length,
-                'suggestion_used': suggestion_used,
-                'has_code_example': '```' in question or 'code' in question.lower()
-            }
-        }
+        event = AIInteractionEvent(self.session_id, 'ask_question', response_time=response_time,
+                                   additional_data={
+            'question_length': len(question),
+            'question_type': self._classify_question_type(question),
+            'response_length': response_length,
+            'suggestion_used': suggestion_used,
+            'has_code_example': '```' in question or 'code' in question.lower()
+        })
         self._add_event(event)
         self.stats['ai_interactions']['total_questions'] += 1
         if suggestion_used:
@@ -198,37 +189,25 @@ class AnalyticsTracker:
             frequency: 行为频率
             details: 详细信息
         """
-        event = {
-            'event_type': 'learning_behavior',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'behavior_type': behavior_type,
-                'duration': duration,
-                'frequency': frequency,
-                'details': details or {}
-            }
-        }
+        if behavior_type in BEHAVIOR_MAPPING:
+            behavior_code = behavior_type
+        else:
+            behavior_code = LEARNING_BEHAVIOR_CODES.get(behavior_type)
+        event = BehaviorEvent(self.session_id, behavior_code, duration=duration, additional_data={
+            'behavior_type': behavior_type,
+            'frequency': frequency,
+            'details': details or {}
+        })
         self._add_event(event)
         self.stats['learning_behavior'][behavior_type] += frequency
     
     def track_error_analysis(self, error_type: str, error_line: int, 
                            fix_attempts: int, success: bool):
         """追踪错误分析和修复过程"""
-        event = {
-            'event_type': 'error_analysis',
-            'timestamp': datetime.now().isoformat(),
-            'user_id': self.user_id,
-            'session_id': self.session_id,
-            'data': {
-                'error_type': error_type,
-                'error_line': error_line,
-                'fix_attempts': fix_attempts,
-                'fix_success': success,
-                'learning_progress': self._calculate_learning_progress()
-            }
-        }
+        event = ErrorEvent(self.session_id, error_type, error_line=error_line,
+                           fix_attempts=fix_attempts, fix_success=success, additional_data={
+            'learning_progress': self._calculate_learning_progress()
+        })
         self._add_event(event)
         self.stats['learning_behavior']['errors_encountered'] += 1
         if success:
@@ -258,7 +237,7 @@ class AnalyticsTracker:
         
         return min(1.0, successful_operations / total_operations)
     
-    def _add_event(self, event: Dict[str, Any]):
+    def _add_event(self, event: EventRecord):
         """添加事件到缓冲区"""
         self.events_buffer.append(event)
         self.stats['last_activity'] = datetime.now().isoformat()
@@ -282,10 +261,12 @@ class AnalyticsTracker:
             return
         
         try:
+            # 每行一个事件：记录的 to_dict() 加上所属用户
             with open(self.local_data_file, 'a', encoding='utf-8') as f:
                 while self.events_buffer:
                     event = self.events_buffer.popleft()
-                    f.write(json.dumps(event, ensure_ascii=False) + '\n')
+                    line = {'user_id': self.user_id, **event.to_dict()}
+                    f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
         except Exception as e:
             print(f"保存分析数据失败: {e}")
     
@@ -323,7 +304,7 @@ class AnalyticsTracker:
                 'session_duration': (datetime.now() - self.start_time).total_seconds()
             },
             'statistics': dict(self.stats),
-            'events': list(self.events_buffer)
+            'events': [event.to_dict() for event in self.events_buffer]
         }
         
         with open(file_path, 'w', encoding='utf-8') as f:
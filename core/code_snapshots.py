@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代码快照的增量编码
+
+每个会话中每个文件的第一个版本保存完整内容（基准），之后每次运行/保存只记录与
+上一版本的按行差异；内容未变化（哈希相同）时只引用上一版本，不产生新的快照。
+每 SNAPSHOT_REBASE_EVERY 个版本，或差异不比完整内容小时，重新保存完整内容，
+限制还原某个版本时需要依次应用的差异数。
+
+快照描述（随 CodeOperationEvent.snapshot 写库与上报）：
+    {'file': 文件名, 'seq': 版本号, 'hash': 内容哈希, 'length': 字符数, 'lines': 行数,
+     'content': 完整内容}                        # 基准版本
+    {..., 'base': 上一版本哈希, 'delta': 差异}     # 增量版本
+    {...}（无 content / delta）                   # 与版本 seq 相同
+差异为 [[起始行, 结束行, [新行...]], ...]，表示将上一版本的 [起始行, 结束行) 替换为新行。
+"""
+
+import json
+import hashlib
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+# 每隔多少个增量版本重新保存一次完整内容
+SNAPSHOT_REBASE_EVERY = 20
+
+
+def content_hash(code: str) -> str:
+    """代码内容的哈希（用于去重与校验还原结果）"""
+    return hashlib.sha1(code.encode('utf-8')).hexdigest()
+
+
+def make_delta(old: str, new: str) -> List:
+    """计算从 old 到 new 的按行差异"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [[i1, i2, new_lines[j1:j2]]
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_delta(old: str, delta: List) -> str:
+    """将差异应用到 old，得到新版本"""
+    old_lines = old.splitlines(keepends=True)
+    result, position = [], 0
+    for start, end, lines in delta:
+        result.extend(old_lines[position:start])
+        result.extend(lines)
+        position = end
+    result.extend(old_lines[position:])
+    return ''.join(result)
+
+
+class SnapshotEncoder:
+    """客户端：记住每个文件的上一版本，为新版本生成快照描述"""
+
+    def __init__(self, rebase_every: int = SNAPSHOT_REBASE_EVERY):
+        """
+        Args:
+            rebase_every: 每隔多少个增量版本重新保存完整内容
+        """
+        self.rebase_every = rebase_every
+        self._lock = threading.Lock()
+        # 文件名 -> (版本号, 哈希, 内容, 距上一个基准的版本数)
+        self._files: Dict[str, tuple] = {}
+
+    def encode(self, file_key: str, code: str) -> Dict:
+        """生成某个文件当前内容的快照描述"""
+        digest = content_hash(code)
+        snapshot = {
+            'file': file_key,
+            'hash': digest,
+            'length': len(code),
+            'lines': len(code.split('\n')) if code else 0,
+        }
+        with self._lock:
+            previous = self._files.get(file_key)
+            if previous and previous[1] == digest:
+                snapshot['seq'] = previous[0]
+                return snapshot
+
+            snapshot['seq'] = previous[0] + 1 if previous else 1
+            since_base = 0
+            if previous and previous[3] < self.rebase_every:
+                delta = make_delta(previous[2], code)
+                if len(json.dumps(delta, ensure_ascii=False)) < len(code):
+                    snapshot['base'] = previous[1]
+                    snapshot['delta'] = delta
+                    since_base = previous[3] + 1
+            if 'delta' not in snapshot:
+                snapshot['content'] = code
+            self._files[file_key] = (snapshot['seq'], digest, code, since_base)
+        return snapshot
+
+    def reset(self):
+        """新会话开始时清空（每个会话的第一个版本保存完整内容）"""
+        with self._lock:
+            self._files.clear()
+
+
+def resolve_snapshot(snapshot: Dict, previous: Optional[str]) -> Optional[str]:
+    """
+    由快照描述与上一版本内容还原当前版本
+
+    Args:
+        snapshot: 快照描述
+        previous: 增量版本的上一版本内容，或未变化版本所引用版本的内容
+
+    Returns:
+        当前版本内容；缺少上一版本或校验失败时返回 None
+    """
+    if 'content' in snapshot:
+        return snapshot['content']
+    if previous is None:
+        return None
+    code = apply_delta(previous, snapshot['delta']) if 'delta' in snapshot else previous
+    return code if content_hash(code) == snapshot.get('hash') else None
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析数据库连接工具
+
+- 统一的连接参数（WAL 模式、busy_timeout、缓存等 PRAGMA）
+- 报表用的一致性读快照：WAL 读事务或在线备份副本，长时间报表不阻塞写入
+- 区分可重试的写锁冲突与其他数据库错误
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.request import pathname2url
+
+# 写锁等待时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+# 每个连接的页缓存大小（负数表示 KiB）
+CACHE_SIZE_KIB = 16000
+
+# WAL 文件达到多少页时自动检查点
+WAL_AUTOCHECKPOINT_PAGES = 1000
+
+# 可重试的主错误码：SQLITE_BUSY、SQLITE_LOCKED
+BUSY_ERROR_CODES = (5, 6)
+
+
+def enable_wal(db_path: str):
+    """将数据库切换为 WAL 模式（持久生效，只需执行一次）"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conn.close()
+
+
+def apply_pragmas(conn: sqlite3.Connection, readonly: bool = False):
+    """为连接设置推荐的 PRAGMA"""
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    if not readonly:
+        # WAL 模式下 NORMAL 仍能保证数据库一致性，只在断电时可能丢失最近的事务
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT_PAGES}')
+
+
+def connect(db_path: str, readonly: bool = False, **kwargs) -> sqlite3.Connection:
+    """
+    打开一个已设置好 PRAGMA 的连接
+
+    Args:
+        db_path: 数据库文件路径
+        readonly: 是否以只读方式打开
+        **kwargs: 透传给 sqlite3.connect 的参数
+    """
+    kwargs.setdefault('timeout', BUSY_TIMEOUT_MS / 1000)
+    if readonly:
+        uri = 'file:' + pathname2url(os.path.abspath(db_path)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+    apply_pragmas(conn, readonly=readonly)
+    return conn
+
+
+@contextmanager
+def read_snapshot(db_path: str, row_factory=None):
+    """
+    在一个 WAL 读事务中打开数据库，事务内所有查询看到同一时刻的数据
+
+    WAL 模式下读事务不会阻塞写入，适合多条查询组成的报表。
+    事务持续期间检查点无法越过该快照，超长报表请改用 backup_snapshot。
+
+    用法:
+        with read_snapshot(db_path) as conn:
+            conn.execute(...)
+    """
+    conn = connect(db_path, readonly=True, isolation_level=None)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    try:
+        conn.execute('BEGIN')
+        # 读取一次以固定快照
+        conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        yield conn
+    finally:
+        try:
+            conn.execute('ROLLBACK')
+        except sqlite3.Error:
+            pass
+        conn.close()
+
+
+def backup_snapshot(db_path: str, target_path: str = None, pages: int = 1024,
+                    sleep: float = 0.005) -> str:
+    """
+    使用 SQLite 在线备份 API 复制一份数据库快照
+
+    分步复制，每步之间短暂让出，写入方可以继续提交；
+    报表工具随后可以在副本上任意执行重查询。
+
+    Args:
+        db_path: 源数据库路径
+        target_path: 快照文件路径，默认为源数据库旁的 snapshots/ 目录
+        pages: 每步复制的页数
+        sleep: 每步之间的等待时间（秒）
+
+    Returns:
+        快照文件路径
+    """
+    if target_path is None:
+        snapshot_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'snapshots')
+        os.makedirs(snapshot_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(db_path))[0]
+        target_path = os.path.join(
+            snapshot_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        )
+
+    source = connect(db_path, readonly=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+        # 快照只用于读取，改回普通日志模式便于单文件拷贝
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+    return target_path
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    """
+    是否为写锁冲突（SQLITE_BUSY / SQLITE_LOCKED），等待后重试可以成功
+
+    缺表、磁盘 I/O 错误、数据库损坏等同样是 OperationalError，但重试无效。
+    """
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, 'sqlite_errorcode', None)
+    if code is not None:
+        # 扩展错误码的低 8 位为主错误码
+        return code & 0xff in BUSY_ERROR_CODES
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学习事件记录
+
+本地写库、磁盘缓冲、云端上报与行为追踪器共用的事件模型。
+每类事件一个使用 __slots__ 的记录类，事件只构造一次，在各层之间直接传递：
+
+- 存储：to_row() 得到按字段顺序排列的元组，pack() / unpack() 将其编码为 JSON 数组帧
+- 写库：记录支持 get() / [] 访问，可直接传给 SQLiteAnalytics.log_events
+- 上报：to_payload() 生成 REST 接口的 JSON 字典（只在网络边界转换为 JSON）
+"""
+
+import json
+import time
+import zlib
+import struct
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+# 二进制帧头：长度 + CRC32
+FRAME_HEADER = struct.Struct('<II')
+
+# 行元组的第一个元素为类型编号，新增类型只能追加编号
+_TYPE_IDS = {}
+
+
+class EventRecord:
+    """事件记录基类：会话 ID 与发生时间（Unix 时间戳，唯一的时间字段）"""
+
+    __slots__ = ('session_id', 'timestamp')
+
+    # 事件类型（与 SQLiteAnalytics.log_events 的 'type' 一致）
+    type = None
+    # 类型编号（存储格式使用）
+    type_id = 0
+    # 云端接口路径：/api/sessions/<session_id>/<endpoint>
+    endpoint = None
+    # 除 session_id / timestamp 外的字段，按存储顺序排列（只能在末尾追加）
+    fields = ()
+    # 旧数据缺少某字段时使用的默认值
+    defaults: Dict[str, Any] = {}
+
+    def __init__(self, session_id: Optional[str] = None, timestamp: Optional[float] = None):
+        self.session_id = session_id
+        self.timestamp = timestamp or time.time()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.type_id:
+            _TYPE_IDS[cls.type_id] = cls
+
+    # ---- 字典式访问（供 log_events 使用） -----------------------------------
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    # ---- 序列化 -----------------------------------------------------------
+    def to_row(self) -> tuple:
+        """存储格式：(类型编号, session_id, timestamp, 字段...)"""
+        return (self.type_id, self.session_id, self.timestamp) + tuple(
+            getattr(self, name) for name in self.fields
+        )
+
+    @staticmethod
+    def from_row(row) -> 'EventRecord':
+        """由存储格式还原记录（旧数据缺少的末尾字段取默认值）"""
+        cls = _TYPE_IDS[row[0]]
+        record = cls.__new__(cls)
+        record.session_id = row[1]
+        record.timestamp = row[2]
+        values = row[3:]
+        for index, name in enumerate(cls.fields):
+            setattr(record, name, values[index] if index < len(values) else cls.defaults.get(name))
+        return record
+
+    def to_payload(self) -> Dict[str, Any]:
+        """云端接口的请求体（会话 ID 在 URL 中，不重复发送）"""
+        payload = {name: getattr(self, name) for name in self.fields}
+        if 'additional_data' in payload:
+            payload['additional_data'] = payload['additional_data'] or {}
+        payload['timestamp'] = datetime.fromtimestamp(self.timestamp).isoformat()
+        return payload
+
+    def to_dict(self) -> Dict[str, Any]:
+        """完整的字典形式（导出、调试用）"""
+        data = {'type': self.type, 'session_id': self.session_id,
+                'timestamp': datetime.fromtimestamp(self.timestamp).isoformat()}
+        data.update((name, getattr(self, name)) for name in self.fields)
+        return data
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+
+class BehaviorEvent(EventRecord):
+    """学习行为（行为编码见 BEHAVIOR_MAPPING）"""
+
+    __slots__ = ('behavior_code', 'duration', 'additional_data')
+    type = 'behavior'
+    type_id = 1
+    endpoint = 'behaviors'
+    fields = __slots__
+
+    def __init__(self, session_id: Optional[str], behavior_code: str, duration: float = None,
+                 additional_data: Dict = None, timestamp: float = None):
+        super().__init__(session_id, timestamp)
+        self.behavior_code = behavior_code
+        self.duration = duration
+        self.additional_data = additional_data
+
+
+class CodeOperationEvent(EventRecord):
+    """代码操作（运行、保存等），snapshot 为代码快照描述（见 core.code_snapshots）"""
+
+    __slots__ = ('operation_type', 'code', 'success', 'error_message',
+                 'execution_time', 'additional_data', 'snapshot')
+    type = 'code'
+    type_id = 2
+    endpoint = 'code-operations'
+    fields = __slots__
+    defaults = {'success': True}
+
+    def __init__(self, session_id: Optional[str], operation_type: str, code: str = None,
+                 success: bool = True, error_message: str = None,
+                 execution_time: float = None, additional_data: Dict = None,
+                 snapshot: Dict = None, timestamp: float = None):
+        super().__init__(session_id, timestamp)
+        self.operation_type = operation_type
+        self.code = code
+        self.success = success
+        self.error_message = error_message
+        self.execution_time = execution_time
+        self.additional_data = additional_data
+        self.snapshot = snapshot
+
+    def to_payload(self) -> Dict[str, Any]:
+        """有快照时只上报快照（差异），不重复发送完整代码"""
+        payload = super().to_payload()
+        if self.snapshot is not None:
+            payload.pop('code', None)
+        else:
+            payload.pop('snapshot', None)
+        return payload
+
+
+class AIInteractionEvent(EventRecord):
+    """AI 交互"""
+
+    __slots__ = ('interaction_type', 'question', 'response', 'response_time',
+                 'feedback_quality', 'additional_data')
+    type = 'ai'
+    type_id = 3
+    endpoint = 'ai-interactions'
+    fields = __slots__
+
+    def __init__(self, session_id: Optional[str], interaction_type: str, question: str = None,
+                 response: str = None, response_time: float = None,
+                 feedback_quality: str = None, additional_data: Dict = None,
+                 timestamp: float = None):
+        super().__init__(session_id, timestamp)
+        self.interaction_type = interaction_type
+        self.question = question
+        self.response = response
+        self.response_time = response_time
+        self.feedback_quality = feedback_quality
+        self.additional_data = additional_data
+
+
+class ErrorEvent(EventRecord):
+    """错误分析"""
+
+    __slots__ = ('error_type', 'error_line', 'error_message', 'fix_attempts',
+                 'fix_success', 'additional_data')
+    type = 'error'
+    type_id = 4
+    endpoint = 'errors'
+    fields = __slots__
+    defaults = {'fix_attempts': 0, 'fix_success': False}
+
+    def __init__(self, session_id: Optional[str], error_type: str, error_line: int = None,
+                 error_message: str = None, fix_attempts: int = 0, fix_success: bool = False,
+                 additional_data: Dict = None, timestamp: float = None):
+        super().__init__(session_id, timestamp)
+        self.error_type = error_type
+        self.error_line = error_line
+        self.error_message = error_message
+        self.fix_attempts = fix_attempts
+        self.fix_success = fix_success
+        self.additional_data = additional_data
+
+
+class SessionStartEvent(EventRecord):
+    """云端会话开始（客户端生成会话 ID，随第一批事件上传，无需等待服务端返回）"""
+
+    __slots__ = ('user_id', 'device_label')
+    type = 'session'
+    type_id = 5
+    fields = __slots__
+
+    def __init__(self, session_id: Optional[str], user_id: str = None, device_label: str = None,
+                 timestamp: float = None):
+        super().__init__(session_id, timestamp)
+        self.user_id = user_id
+        self.device_label = device_label
+
+
+class SessionEndEvent(EventRecord):
+    """云端会话结束"""
+
+    __slots__ = ()
+    type = 'session_end'
+    type_id = 6
+
+
+# ---- 存储格式 -------------------------------------------------------------
+def pack(event) -> bytes:
+    """
+    将记录编码为存储负载（UTF-8 JSON）
+
+    记录编码为数组 [类型编号, session_id, timestamp, 字段...]，字典等其他对象编码为 JSON 对象。
+    """
+    value = event.to_row() if isinstance(event, EventRecord) else event
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def unpack(payload: bytes):
+    """解码存储负载：数组还原为对应类型的记录，其他值原样返回"""
+    value = json.loads(payload.decode('utf-8'))
+    return EventRecord.from_row(value) if isinstance(value, list) else value
+
+
+def write_frames(f: BinaryIO, events: Iterable) -> None:
+    """将事件写为带长度与校验的帧"""
+    chunks = []
+    for event in events:
+        payload = pack(event)
+        chunks.append(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)))
+        chunks.append(payload)
+    f.write(b''.join(chunks))
+
+
+def read_frames(f: BinaryIO) -> Iterator:
+    """
+    逐帧读取事件，遇到不完整或校验失败的帧即停止（写入中途崩溃）
+
+    Yields:
+        (帧结束处的文件偏移, 事件)
+    """
+    while True:
+        header = f.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        length, checksum = FRAME_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        try:
+            event = unpack(payload)
+        except Exception:
+            return
+        yield f.tell(), event
@@ -48,6 +48,16 @@ class FileManager:
             })
         except Exception as e:
             print(f"记录文件行为失败: {e}")
+
+    def _log_file_snapshot(self, content: str):
+        """内部工具：将保存的代码记录为代码快照（按文件增量保存）"""
+        if sqlite_integration is None or not getattr(sqlite_integration, "enabled", False):
+            return
+        try:
+            sqlite_integration.log_code_operation('save', code=content,
+                                                  file_key=self.get_current_file())
+        except Exception as e:
+            print(f"记录代码快照失败: {e}")
         
     def new_file(self, code_editor=None):
         """
@@ -159,6 +169,7 @@ class FileManager:
 
             # 记录保存文件行为
             self._log_file_behavior('SV')
+            self._log_file_snapshot(content)
             
             return True
             
@@ -202,6 +213,7 @@ class FileManager:
 
                 # 记录另存为行为
                 self._log_file_behavior('SA')
+                self._log_file_snapshot(content)
                 
                 return True
                 
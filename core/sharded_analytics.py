@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片的分析数据存储
+
+- 按 user_id 的哈希值将会话路由到 N 个 SQLite 数据库文件，每个分片有独立的写锁，
+  不同学生的写入可以并行进行
+- 同一学生的全部数据位于同一分片，按学生的查询只访问一个分片
+- 全局统计、检索与导出并行访问各分片后合并结果
+"""
+
+import os
+import zlib
+import threading
+from itertools import chain
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.sqlite_analytics import (SQLiteAnalytics, ROLLUP_SOURCES, format_overview_stats,
+                                   check_stream_export, iter_export_chunks)
+
+# 会话 -> 分片缓存的最大条目数（超过后清空重建）
+SESSION_CACHE_SIZE = 100000
+
+
+class ShardedAnalytics:
+    """按学生分片的分析器，接口与 SQLiteAnalytics 的写入/统计接口一致"""
+
+    def __init__(self, data_dir: str = "data/shards", num_shards: int = 4,
+                 name: str = "learning_analytics", readonly: bool = False):
+        """
+        初始化分片分析器
+
+        Args:
+            data_dir: 分片数据库所在目录
+            num_shards: 分片数量（创建后不可更改，否则已有学生会被路由到其他分片）
+            name: 数据库文件名前缀，分片文件为 <name>_<序号>.db
+            readonly: 以只读方式打开各分片（见 SQLiteAnalytics）
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.db_path = data_dir
+        self.num_shards = num_shards
+        self.shards: List[SQLiteAnalytics] = [
+            SQLiteAnalytics(db_path=os.path.join(data_dir, f"{name}_{index:02d}.db"), readonly=readonly)
+            for index in range(num_shards)
+        ]
+        self.logger = self.shards[0].logger
+        self._executor = ThreadPoolExecutor(max_workers=num_shards,
+                                            thread_name_prefix='analytics-shard')
+        self._session_shards: Dict[str, int] = {}
+        self._session_lock = threading.Lock()
+
+    # ---- 路由 -------------------------------------------------------------
+    def shard_index(self, user_id: Optional[str]) -> int:
+        """学生所在的分片序号（稳定哈希，与进程无关）"""
+        return zlib.crc32((user_id or 'anonymous').encode('utf-8')) % self.num_shards
+
+    def shard_for_user(self, user_id: Optional[str]) -> SQLiteAnalytics:
+        """学生所在的分片"""
+        return self.shards[self.shard_index(user_id)]
+
+    def shard_for_session(self, session_id: str) -> SQLiteAnalytics:
+        """会话所在的分片（未知会话归入匿名用户的分片，与单库时记为 anonymous 一致）"""
+        with self._session_lock:
+            index = self._session_shards.get(session_id)
+        if index is None:
+            index = self._locate_session(session_id)
+            if index is None:
+                return self.shard_for_user(None)
+            self._remember_session(session_id, index)
+        return self.shards[index]
+
+    def _locate_session(self, session_id: str) -> Optional[int]:
+        """在各分片中查找会话（会话可能由其他进程创建）"""
+        def _has_session(shard):
+            with shard.connect(readonly=True) as conn:
+                return conn.execute('SELECT 1 FROM user_sessions WHERE session_id = ?',
+                                    (session_id,)).fetchone() is not None
+
+        for index, found in enumerate(self._executor.map(_has_session, self.shards)):
+            if found:
+                return index
+        return None
+
+    def _remember_session(self, session_id: str, index: int):
+        with self._session_lock:
+            if len(self._session_shards) >= SESSION_CACHE_SIZE:
+                self._session_shards.clear()
+            self._session_shards[session_id] = index
+
+    def _fan_out(self, func) -> List:
+        """在所有分片上并行执行 func(shard)，按分片顺序返回结果"""
+        return list(self._executor.map(func, self.shards))
+
+    # ---- 写入 -------------------------------------------------------------
+    def start_session(self, user_id: str = None, session_id: str = None,
+                      device_label: str = None, start_time=None) -> str:
+        """开始新的学习会话（写入学生所在的分片）"""
+        index = self.shard_index(user_id)
+        session_id = self.shards[index].start_session(
+            user_id=user_id, session_id=session_id, device_label=device_label,
+            start_time=start_time
+        )
+        self._remember_session(session_id, index)
+        return session_id
+
+    def log_behavior(self, session_id: str, *args, **kwargs):
+        """记录学习行为"""
+        self.shard_for_session(session_id).log_behavior(session_id, *args, **kwargs)
+
+    def log_code_operation(self, session_id: str, *args, **kwargs):
+        """记录代码操作"""
+        self.shard_for_session(session_id).log_code_operation(session_id, *args, **kwargs)
+
+    def log_ai_interaction(self, session_id: str, *args, **kwargs):
+        """记录AI交互"""
+        self.shard_for_session(session_id).log_ai_interaction(session_id, *args, **kwargs)
+
+    def log_error_analysis(self, session_id: str, *args, **kwargs):
+        """记录错误分析"""
+        self.shard_for_session(session_id).log_error_analysis(session_id, *args, **kwargs)
+
+    def log_events(self, events: List[Dict]) -> Dict[str, int]:
+        """
+        批量记录事件：按会话所在分片分组后并行写入
+
+        Returns:
+            各类型写入的条数，以及被跳过的无效事件数 'skipped'
+        """
+        groups: Dict[int, List[Dict]] = {}
+        shard_indexes = {shard: index for index, shard in enumerate(self.shards)}
+        for event in events:
+            shard = self.shard_for_session(event.get('session_id'))
+            groups.setdefault(shard_indexes[shard], []).append(event)
+
+        counts = {category: 0 for category in ROLLUP_SOURCES}
+        counts['skipped'] = 0
+        results = self._executor.map(
+            lambda item: self.shards[item[0]].log_events(item[1]), groups.items()
+        )
+        for result in results:
+            for key, value in result.items():
+                counts[key] += value
+        return counts
+
+    def ingest_batch(self, sessions: List[Dict], events: List[Dict], session_ends: List[Dict],
+                     batch_key: str = None) -> Tuple[Dict[str, int], bool]:
+        """
+        按分片拆分一批上报数据后并行写入
+
+        Returns:
+            (各类型写入的条数, 是否为重复批次)
+        """
+        return self.ingest_batches([{
+            'sessions': sessions, 'events': events,
+            'session_ends': session_ends, 'key': batch_key
+        }])[0]
+
+    def ingest_batches(self, batches: List[Dict]) -> List[Tuple[Dict[str, int], bool]]:
+        """
+        按分片拆分多批上报数据，各分片在一个事务内写入自己的部分（分片之间并行）
+
+        每个分片以同一个幂等键对其部分去重：部分分片写入失败时，
+        客户端重发后只有失败的分片会再次写入。
+
+        Returns:
+            每批的 (各类型写入的条数, 是否为重复批次)
+        """
+        # 本次新建的会话按学生路由，其事件随会话写入同一分片
+        batch_shards = {session['session_id']: self.shard_index(session.get('user_id'))
+                        for batch in batches for session in batch.get('sessions') or ()}
+        shard_indexes = {shard: index for index, shard in enumerate(self.shards)}
+
+        def _index(session_id):
+            index = batch_shards.get(session_id)
+            return index if index is not None else shard_indexes[self.shard_for_session(session_id)]
+
+        # 分片 -> [(原批次序号, 该分片的部分)]
+        groups: Dict[int, List[tuple]] = {}
+        for position, batch in enumerate(batches):
+            parts: Dict[int, Dict] = {}
+            for field in ('sessions', 'events', 'session_ends'):
+                for item in batch.get(field) or ():
+                    index = _index(item.get('session_id'))
+                    if index not in parts:
+                        parts[index] = {'sessions': [], 'events': [], 'session_ends': [],
+                                        'key': batch.get('key')}
+                    parts[index][field].append(item)
+            for index, part in parts.items():
+                groups.setdefault(index, []).append((position, part))
+
+        def _ingest(item):
+            index, parts = item
+            return [position for position, _ in parts], \
+                self.shards[index].ingest_batches([part for _, part in parts])
+
+        results = [[] for _ in batches]
+        for positions, shard_results in self._executor.map(_ingest, groups.items()):
+            for position, result in zip(positions, shard_results):
+                results[position].append(result)
+        for session_id, index in batch_shards.items():
+            self._remember_session(session_id, index)
+
+        merged = []
+        for parts in results:
+            counts = {category: 0 for category in ROLLUP_SOURCES}
+            counts['skipped'] = 0
+            for part_counts, _ in parts:
+                for key, value in part_counts.items():
+                    counts[key] += value
+            merged.append((counts, bool(parts) and all(duplicate for _, duplicate in parts)))
+        return merged
+
+    def end_session(self, session_id: str, end_time=None):
+        """结束学习会话"""
+        self.shard_for_session(session_id).end_session(session_id, end_time=end_time)
+
+    # ---- 查询 -------------------------------------------------------------
+    def data_version(self) -> tuple:
+        """各分片的写入水位（任一分片有新的写入时取值变化）"""
+        return tuple(shard.data_version() for shard in self.shards)
+
+    def get_session_stats(self, session_id: str) -> Dict:
+        """获取会话统计信息"""
+        return self.shard_for_session(session_id).get_session_stats(session_id)
+
+    def get_code_history(self, session_id: str, file_key: str = None) -> Dict:
+        """还原会话中各文件的代码版本历史"""
+        return self.shard_for_session(session_id).get_code_history(session_id, file_key)
+
+    def get_overview_stats(self, days: int = 30) -> Dict:
+        """
+        获取最近若干天的总体统计：各分片并行读取累计值，相加后统一计算平均值
+
+        学生按 user_id 分片，各分片的用户互不重叠，用户数可以直接相加。
+        """
+        start_date = datetime.now() - timedelta(days=days)
+        results = self._fan_out(lambda shard: shard.fetch_overview_totals(start_date))
+
+        session_totals = [0, 0, 0]
+        merged: Dict[tuple, List] = {}
+        for shard_totals, rows in results:
+            session_totals = [a + (b or 0) for a, b in zip(session_totals, shard_totals)]
+            for category, dim, *values in rows:
+                current = merged.setdefault((category, dim), [0] * len(values))
+                merged[(category, dim)] = [a + (b or 0) for a, b in zip(current, values)]
+
+        rows = [key + tuple(values) for key, values in merged.items()]
+        return format_overview_stats(days, tuple(session_totals), rows)
+
+    def search(self, query: str, user_id: str = None, start_time=None, end_time=None,
+               kind: str = None, limit: int = 20, offset: int = 0) -> Dict:
+        """
+        全文检索
+
+        指定 user_id 时只检索该学生所在分片，结果按相关度排序；
+        否则并行检索所有分片，合并后按时间倒序分页（各分片的相关度分值不可比较）。
+        """
+        if user_id is not None:
+            return self.shard_for_user(user_id).search(
+                query, user_id=user_id, start_time=start_time, end_time=end_time,
+                kind=kind, limit=limit, offset=offset
+            )
+
+        results = self._fan_out(lambda shard: shard.search(
+            query, start_time=start_time, end_time=end_time, kind=kind,
+            limit=offset + limit, offset=0
+        ))
+        merged = [row for result in results for row in result['results']]
+        merged.sort(key=lambda row: str(row['timestamp']), reverse=True)
+        return {
+            'total': sum(result['total'] for result in results),
+            'results': merged[offset:offset + limit]
+        }
+
+    # ---- 导出 -------------------------------------------------------------
+    def export_data(self, session_id: str = None, output_file: str = None, **kwargs):
+        """
+        导出数据
+
+        指定 session_id 时只导出该会话所在分片，返回文件路径；
+        否则每个分片导出一个文件（文件名追加 _<序号>），返回文件路径列表。
+        """
+        if session_id is not None:
+            return self.shard_for_session(session_id).export_data(
+                session_id=session_id, output_file=output_file, **kwargs
+            )
+
+        def _export(index):
+            target = None
+            if output_file:
+                root, ext = os.path.splitext(output_file)
+                target = f"{root}_{index:02d}{ext}"
+            return self.shards[index].export_data(output_file=target, **kwargs)
+
+        return list(self._executor.map(_export, range(self.num_shards)))
+
+    def stream_export(self, tables: List[str] = None, fmt: str = 'jsonl',
+                      session_id: str = None, user_id: str = None,
+                      start_time=None, end_time=None, batch_size: int = 1000) -> Iterator[str]:
+        """
+        流式导出：指定 session_id 或 user_id 时只读取所在分片，否则依次读取各分片
+
+        同一张表在各分片的数据连续输出，csv 表头只输出一次。
+        """
+        tables = check_stream_export(tables, fmt)
+        if session_id is not None:
+            targets = [self.shard_for_session(session_id)]
+        elif user_id is not None:
+            targets = [self.shard_for_user(user_id)]
+        else:
+            targets = self.shards
+        filters = {'session_id': session_id, 'user_id': user_id,
+                   'start_time': start_time, 'end_time': end_time}
+        return iter_export_chunks(
+            tables, fmt,
+            lambda table: chain.from_iterable(
+                shard.iter_export_batches(table, batch_size=batch_size, **filters)
+                for shard in targets
+            )
+        )
+
+    def export_parquet(self, output_dir: str = None, **kwargs) -> Dict:
+        """
+        并行导出各分片的 Parquet 快照，分片 i 写入 <output_dir>/shard_<序号>/
+
+        Returns:
+            合并后的行数与文件数，'shards' 中为各分片的导出结果
+        """
+        output_dir = output_dir or os.path.join(
+            'data', 'exports', f"parquet_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        )
+        results = list(self._executor.map(
+            lambda index: self.shards[index].export_parquet(
+                os.path.join(output_dir, f"shard_{index:02d}"), **kwargs
+            ),
+            range(self.num_shards)
+        ))
+
+        row_counts: Dict[str, int] = {}
+        for result in results:
+            for table, count in result['row_counts'].items():
+                row_counts[table] = row_counts.get(table, 0) + count
+        return {
+            'output_dir': output_dir,
+            'export_time': datetime.now().isoformat(),
+            'row_counts': row_counts,
+            'file_count': sum(result['file_count'] for result in results),
+            'shards': results
+        }
+
+    def close(self):
+        """关闭分片线程池"""
+        self._executor.shutdown(wait=True)
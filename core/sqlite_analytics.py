@@ -6,43 +6,248 @@ SQLite + Logging 数据采集系统
 """
 
 import sqlite3
-import logging
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import logging
+import io
+import re
+import csv
+import gzip
+import math
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple, Iterator
 import threading
 import time
+from collections import OrderedDict
+
+try:
+    from core import db_connection
+    from core.analytics_logging import setup_analytics_logging, EventSampler
+    from core.code_snapshots import apply_delta, content_hash, resolve_snapshot
+except ImportError:
+    import db_connection  # type: ignore
+    from analytics_logging import setup_analytics_logging, EventSampler  # type: ignore
+    from code_snapshots import apply_delta, content_hash, resolve_snapshot  # type: ignore
+
+# 行为编码映射表（可拓展，至少覆盖 15 种典型学习行为）
+BEHAVIOR_MAPPING = {
+    # 任务与资源
+    'UT': ('Understanding Task', '资源', '学生通过任务窗口查看编程任务详情'),
+    'RAM': ('Referring to Additional Materials', '资源', '学生在参考资料中查阅内容'),
+
+    # 代码编辑与操作
+    'CP': ('Coding in Python', '编辑代码', '学生在代码编辑器中键入或修改代码'),
+    'SC': ('Select Code', '编辑代码', '学生在编辑器中选中一段代码'),
+    'CC': ('Copy Code', '编辑代码', '学生在代码编辑器中复制代码'),
+    'PC': ('Paste Code', '粘贴代码', '学生在代码编辑器中粘贴代码'),
+
+    # 文件操作
+    'NF': ('New File', '文件操作', '学生新建代码文件'),
+    'OF': ('Open File', '文件操作', '学生打开现有代码文件'),
+    'SV': ('Save File', '文件操作', '学生保存当前文件'),
+    'SA': ('Save As File', '文件操作', '学生将代码另存为新文件'),
+
+    # 运行与调试
+    'CR': ('Code Run', '运行代码', '学生执行代码'),
+    'DP': ('Debugging in Python', '调试', '学生在调试过程中执行单步/跳过/跳出/设置断点等操作'),
+
+    # 代码与结果阅读
+    'UPC': ('Understanding Python Codes', '理解代码', '学生通过鼠标在代码上来回移动理解代码'),
+    'CRC': ('Checking Result/Chart', '检查输出', '学生在控制台或图表区域检查输出结果'),
+    'RCM': ('Reading Console Message', '阅读信息', '学生在阅读或复制控制台中的提示/警告信息'),
+    'VE': ('Viewing Error', '查看错误', '学生在控制台中查看错误信息'),
+    'VO': ('Viewing Output', '查看输出', '学生在控制台中查看普通输出'),
+    'VC': ('Viewing Code', '查看代码', '学生在代码区域停留浏览'),
+
+    # AI 相关行为
+    'ANQ': ('Asking New Questions', 'AI辅助编程', '学生在AI助手中自主提出新的问题'),
+    'PCM': ('Pasting Console Message', 'AI辅助编程', '学生在AI助手中粘贴控制台中的错误或输出信息'),
+    'PPC': ('Pasting Python Codes', 'AI辅助编程', '学生在AI助手中粘贴自己的Python代码'),
+    'CPC': ('Copy and Paste Codes', 'AI辅助编程', '学生将AI助手中的代码拷贝到编辑器'),
+    'CAC': ('Copy AI Code', 'AI辅助编程', '学生从AI助手复制代码'),
+    'RF': ('Reading Feedback', 'AI辅助编程', '学生在AI助手中阅读反馈信息'),
+    'AC': ('AI Chat Area', 'AI交互', '学生在AI聊天区停留的时间'),
+    'SAI': ('Select AI Text', 'AI交互', '学生在AI对话区域选中文本'),
+
+    # 其他行为
+    'FC': ('Failure in ChatGPT', '其他行为', '因平台/网络故障导致AI无法正常响应'),
+    'IO': ('Idle Operation', '其他行为', '学生在一段时间内无任何可见操作')
+}
+
+
+# 数据库结构版本（保存在 PRAGMA user_version 中）
+SCHEMA_VERSION = 2
+
+# 汇总表数据来源：类别 -> (表, 维度列, 成功条件, 耗时列, 长度列, 第二长度列)
+ROLLUP_SOURCES = {
+    'behavior': ('learning_behaviors', 'behavior_code', '0', 'duration', '0', '0'),
+    'code': ('code_operations', 'operation_type', 'success = 1', 'execution_time', 'code_length', 'line_count'),
+    'ai': ('ai_interactions', 'interaction_type', '0', 'response_time', 'question_length', 'response_length'),
+    'error': ('error_analysis', 'error_type', 'fix_success = 1', 'NULL', 'fix_attempts', '0'),
+}
+
+# 各类事件的插入列（批量写入时按此顺序组装行）
+EVENT_COLUMNS = {
+    'behavior': ('session_id', 'user_id', 'behavior_code', 'activity_name', 'category',
+                 'description', 'timestamp', 'duration', 'additional_data'),
+    'code': ('session_id', 'user_id', 'operation_type', 'code_length', 'line_count', 'success',
+             'error_message', 'execution_time', 'timestamp', 'additional_data'),
+    'ai': ('session_id', 'user_id', 'interaction_type', 'question_length', 'response_length',
+           'response_time', 'feedback_quality', 'timestamp', 'additional_data'),
+    'error': ('session_id', 'user_id', 'error_type', 'error_line', 'error_message',
+              'fix_attempts', 'fix_success', 'timestamp', 'additional_data'),
+}
+
+# 中日韩字符（全文检索时逐字切分）
+_CJK_PATTERN = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+# 有全文索引行的原始事件表（event_search.source_table 的取值）
+SEARCH_SOURCE_TABLES = ('ai_interactions', 'error_analysis')
+
+# 还原代码快照时缓存每个 (会话, 文件) 的最新版本，最多缓存的条数
+SNAPSHOT_CACHE_SIZE = 256
+
+# 已写入批次的幂等键保留天数（需长于客户端发件箱的最长保留时间），
+# 以及清理过期键的最小间隔（秒）
+INGEST_KEY_RETENTION_DAYS = 8
+INGEST_KEY_PURGE_INTERVAL = 3600
+
+# 可导出的原始事件表（汇总表可由原始数据重建，不导出）
+EXPORT_TABLES = ['user_sessions', 'learning_behaviors', 'code_operations',
+                 'ai_interactions', 'error_analysis']
+
+# 支持的导出格式
+EXPORT_FORMATS = ('json', 'jsonl', 'csv')
+
+# 支持流式导出（边读边发送）的格式：csv 每次只能导出一张表
+STREAM_EXPORT_FORMATS = ('jsonl', 'csv')
+
+# 常用的 additional_data 键：表 -> {键: SQLite 类型}
+# 数据库中创建为带索引的虚拟生成列，Parquet 导出时展开为独立列（列名均为 data_<键>）
+PROMOTED_JSON_KEYS = {
+    'learning_behaviors': {
+        'line_number': 'INTEGER',
+        'start_line': 'INTEGER',
+        'end_line': 'INTEGER',
+        'code_range': 'TEXT',
+        'content_length': 'INTEGER',
+        'source': 'TEXT',
+        'error_type': 'TEXT',
+        'action': 'TEXT',
+    },
+    'code_operations': {
+        'start_line': 'INTEGER',
+        'end_line': 'INTEGER',
+        'code_range': 'TEXT',
+        'error_line': 'INTEGER',
+    },
+    'ai_interactions': {
+        'question_preview': 'TEXT',
+        'response_preview': 'TEXT',
+        'question_type': 'TEXT',
+    },
+    'error_analysis': {
+        'source': 'TEXT',
+    },
+}
+
+# Parquet 导出的列类型（未列出的列按字符串处理）
+PARQUET_COLUMN_TYPES = {
+    'id': 'INTEGER', 'total_activities': 'INTEGER', 'code_length': 'INTEGER',
+    'line_count': 'INTEGER', 'question_length': 'INTEGER', 'response_length': 'INTEGER',
+    'error_line': 'INTEGER', 'fix_attempts': 'INTEGER',
+    'duration': 'REAL', 'execution_time': 'REAL', 'response_time': 'REAL',
+    'success': 'BOOLEAN', 'fix_success': 'BOOLEAN',
+    'start_time': 'TIMESTAMP', 'end_time': 'TIMESTAMP', 'timestamp': 'TIMESTAMP',
+}
+
 
 class SQLiteAnalytics:
     """SQLite数据分析采集器"""
     
-    def __init__(self, db_path: str = "data/learning_analytics.db"):
+    def __init__(self, db_path: str = "data/learning_analytics.db",
+                 promoted_keys: Dict[str, Dict[str, str]] = None, readonly: bool = False):
         """
         初始化分析器
         
         Args:
             db_path: SQLite数据库文件路径
+            promoted_keys: 需要提升为生成列并建索引的 additional_data 键，
+                格式同 PROMOTED_JSON_KEYS，默认使用 PROMOTED_JSON_KEYS
+            readonly: 只读打开（多进程部署的工作进程）：所有连接使用 mode=ro，
+                不建表、不迁移，数据库须已由写入进程初始化
         """
         self.db_path = db_path
+        self.readonly = readonly
         self.lock = threading.Lock()
+        self.promoted_keys = PROMOTED_JSON_KEYS if promoted_keys is None else promoted_keys
+        # 实际已创建的生成列：表 -> {键: 列名}
+        self.promoted_columns: Dict[str, Dict[str, str]] = {}
+        # (会话, 文件) -> (版本号, 哈希, 代码)，增量快照还原时避免回查数据库
+        self._snapshot_cache = OrderedDict()
+        self._keys_purged_at = 0.0
+        # 读取 data_version 的常驻只读连接
+        self._version_conn = None
+        self._version_lock = threading.Lock()
         
         # 确保数据目录存在
         db_dir = os.path.dirname(db_path)
-        if db_dir:  # 只有当目录路径不为空时才创建
+        if db_dir and not readonly:  # 只有当目录路径不为空时才创建
             os.makedirs(db_dir, exist_ok=True)
         
-        # 初始化数据库
-        self._init_database()
-        
-        # 初始化日志系统
+        # 初始化日志系统（建表时的配置告警需要写入日志）
         self._init_logging()
+        
+        # 初始化数据库（只读时只读取已有的表结构）
+        if readonly:
+            self._load_schema()
+        else:
+            self._init_database()
+    
+    def connect(self, **kwargs) -> sqlite3.Connection:
+        """打开一个设置好 PRAGMA（busy_timeout、synchronous 等）的连接（只读分析器总是只读连接）"""
+        if self.readonly:
+            kwargs['readonly'] = True
+        return db_connection.connect(self.db_path, **kwargs)
+    
+    def snapshot(self, row_factory=None):
+        """
+        打开一致性读快照（WAL 读事务），报表查询不阻塞写入
+        
+        用法:
+            with analytics.snapshot() as conn:
+                conn.execute(...)
+        """
+        return db_connection.read_snapshot(self.db_path, row_factory=row_factory)
+    
+    def backup(self, target_path: str = None) -> str:
+        """使用在线备份 API 复制数据库副本，供超长报表离线查询"""
+        return db_connection.backup_snapshot(self.db_path, target_path)
+    
+    def data_version(self) -> int:
+        """
+        数据库的写入水位（PRAGMA data_version）
+        
+        任何其他连接（包括其他进程）提交写入后取值变化，取值不变说明数据未修改，
+        统计结果的缓存仍然有效。只读取 WAL 索引头，不访问数据页。
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = self.connect(readonly=True, check_same_thread=False)
+            return self._version_conn.execute('PRAGMA data_version').fetchone()[0]
     
     def _init_database(self):
         """初始化SQLite数据库"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             
+            # 新数据库启用增量 VACUUM（对已有表的数据库无效，需停机执行 RetentionManager.vacuum_full() 转换）
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            
+            # WAL 模式：读取不阻塞写入，写入不阻塞读取
+            cursor.execute('PRAGMA journal_mode = WAL')
+            
             # 创建用户会话表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_sessions (
@@ -124,6 +329,33 @@ class SQLiteAnalytics:
                 )
             ''')
             
+            # 创建代码快照表（每个文件的基准版本保存完整内容，之后只保存按行差异）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS code_snapshots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT,
+                    user_id TEXT,
+                    file_key TEXT,
+                    seq INTEGER,
+                    content_hash TEXT,
+                    base_hash TEXT,
+                    delta TEXT,
+                    content TEXT,
+                    timestamp TIMESTAMP,
+                    UNIQUE (session_id, file_key, seq),
+                    FOREIGN KEY (session_id) REFERENCES user_sessions(session_id)
+                )
+            ''')
+            
+            # 已写入批次的幂等键（与批次数据在同一事务中写入，服务重启后仍能识别重发的批次）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_batches (
+                    idempotency_key TEXT PRIMARY KEY,
+                    counts TEXT,
+                    received_at TIMESTAMP
+                )
+            ''')
+            
             # 创建索引
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_session ON learning_behaviors(session_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_timestamp ON learning_behaviors(timestamp)')
@@ -132,44 +364,310 @@ class SQLiteAnalytics:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_session ON ai_interactions(session_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_error_session ON error_analysis(session_id)')
             
+            # 创建汇总表（随事件写入增量维护，统计查询直接读取）
+            for rollup_table, key_columns in (('session_rollups', 'session_id TEXT'),
+                                              ('user_day_rollups', 'user_id TEXT, day TEXT')):
+                key_names = ', '.join(col.split()[0] for col in key_columns.split(', '))
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {rollup_table} (
+                        {key_columns},
+                        category TEXT,
+                        dim TEXT,
+                        event_count INTEGER DEFAULT 0,
+                        success_count INTEGER DEFAULT 0,
+                        time_sum REAL DEFAULT 0,
+                        time_count INTEGER DEFAULT 0,
+                        size_sum INTEGER DEFAULT 0,
+                        size2_sum INTEGER DEFAULT 0,
+                        PRIMARY KEY ({key_names}, category, dim)
+                    )
+                ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_day_rollups_day ON user_day_rollups(day)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start ON user_sessions(start_time)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingest_batches_received ON ingest_batches(received_at)')
+            
+            # 创建全文检索索引（AI 问题/回答与错误信息），SQLite 未编译 FTS5 时退回 LIKE 查询
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5(
+                        terms,
+                        content UNINDEXED,
+                        kind UNINDEXED,
+                        source_table UNINDEXED,
+                        source_id UNINDEXED,
+                        session_id UNINDEXED,
+                        user_id UNINDEXED,
+                        timestamp UNINDEXED,
+                        tokenize = 'unicode61'
+                    )
+                ''')
+                self.search_enabled = True
+            except sqlite3.OperationalError:
+                self.search_enabled = False
+            
+            self._migrate(cursor)
+            
             conn.commit()
     
-    def _init_logging(self):
-        """初始化日志系统"""
-        # 创建日志目录
-        log_dir = "logs"
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # 配置日志格式
-        log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        
-        # 创建文件处理器
-        file_handler = logging.FileHandler(
-            os.path.join(log_dir, f"analytics_{datetime.now().strftime('%Y%m%d')}.log"),
-            encoding='utf-8'
-        )
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(logging.Formatter(log_format))
+    def _load_schema(self):
+        """
+        只读打开时读取已有数据库的全文索引与生成列（不建表、不迁移）
+        
+        Raises:
+            RuntimeError: 数据库尚未由写入进程初始化
+        """
+        with self.connect() as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if 'user_sessions' not in tables:
+                raise RuntimeError(f'analytics database {self.db_path} is not initialized')
+            self.search_enabled = 'event_search' in tables
+            for table, keys in self.promoted_keys.items():
+                existing = {row[1] for row in conn.execute(f'PRAGMA table_xinfo({table})')}
+                self.promoted_columns[table] = {
+                    key: f'data_{key}' for key in keys if f'data_{key}' in existing
+                }
+    
+    def _migrate(self, cursor):
+        """根据 PRAGMA user_version 执行增量迁移"""
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+        
+        if version < 1:
+            # 为已有数据回填汇总表与会话活动数
+            self._rebuild_rollups(cursor)
+        
+        if version < 2 and self.search_enabled:
+            # 为已有数据建立全文索引（旧记录只保存了问题/回答预览）
+            self._rebuild_search_index(cursor)
+        
+        if version < SCHEMA_VERSION:
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        
+        # 生成列随配置变化，每次启动时补齐缺失的列和索引
+        self._sync_promoted_columns(cursor)
+    
+    def _sync_promoted_columns(self, cursor):
+        """将配置的 additional_data 键创建为虚拟生成列并建立索引（需要 SQLite 3.31+）"""
+        if sqlite3.sqlite_version_info < (3, 31, 0):
+            return
+        
+        for table, keys in self.promoted_keys.items():
+            cursor.execute(f'PRAGMA table_xinfo({table})')
+            existing = {row[1] for row in cursor.fetchall()}
+            if not existing:
+                continue
+            
+            columns = {}
+            for key, sql_type in keys.items():
+                if not key.isidentifier() or sql_type not in ('INTEGER', 'REAL', 'TEXT'):
+                    # 配置错误不影响启动，跳过该键（查询时退回 json_extract）
+                    self.logger.warning(f"Skipping invalid promoted key: {table}.{key} ({sql_type})")
+                    continue
+                column = f'data_{key}'
+                if column not in existing:
+                    cursor.execute(f'''
+                        ALTER TABLE {table} ADD COLUMN {column} {sql_type}
+                        GENERATED ALWAYS AS (json_extract(additional_data, '$.{key}')) VIRTUAL
+                    ''')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})')
+                columns[key] = column
+            self.promoted_columns[table] = columns
+    
+    def json_field(self, table: str, key: str, alias: str = None) -> str:
+        """
+        返回读取 additional_data 某个键的 SQL 表达式
+        
+        已提升为生成列的键直接使用带索引的列，否则退回 json_extract。
+        """
+        prefix = f'{alias}.' if alias else ''
+        column = self.promoted_columns.get(table, {}).get(key)
+        if column:
+            return prefix + column
+        return f"json_extract({prefix}additional_data, '$.{key}')"
+    
+    def base_columns(self, table: str) -> List[str]:
+        """表的原始列（不含 additional_data 生成列），导出与归档只输出这些列"""
+        with self.connect() as conn:
+            return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    
+    def query_events(self, table: str, session_id: str = None, user_id: str = None,
+                     since=None, limit: int = 100, **data_filters) -> List[Dict]:
+        """
+        按 additional_data 中的键筛选事件（已提升的键走索引）
         
-        # 创建控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.WARNING)
-        console_handler.setFormatter(logging.Formatter(log_format))
+        Args:
+            table: 事件表名
+            session_id / user_id: 可选过滤条件
+            since: 起始时间
+            limit: 最多返回条数
+            **data_filters: additional_data 键值过滤，如 error_type='NameError'
+            
+        Returns:
+            按时间倒序排列的事件列表
+        """
+        if table not in EXPORT_TABLES or table == 'user_sessions':
+            raise ValueError(f"Unknown event table: {table}")
+        
+        conditions, params = [], []
+        for column, op, value in (('session_id', '=', session_id),
+                                  ('user_id', '=', user_id),
+                                  ('timestamp', '>=', since)):
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                params.append(value)
+        for key, value in data_filters.items():
+            if not key.isidentifier():
+                raise ValueError(f"Invalid additional_data key: {key}")
+            conditions.append(f'{self.json_field(table, key)} = ?')
+            params.append(value)
         
-        # 配置根日志器
-        self.logger = logging.getLogger('learning_analytics')
-        self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                f'SELECT * FROM {table} {where} ORDER BY timestamp DESC LIMIT ?',
+                params + [limit]
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def _rebuild_rollups(self, cursor):
+        """
+        从原始事件表重新计算全部汇总数据
+        
+        注意：已归档并从热库删除的原始数据不会计入，仅在首次迁移时执行。
+        """
+        cursor.execute('DELETE FROM session_rollups')
+        cursor.execute('DELETE FROM user_day_rollups')
+        
+        for category, (table, dim, success, time_value, size, size2) in ROLLUP_SOURCES.items():
+            select = f'''
+                SELECT {{keys}}, '{category}', COALESCE({dim}, ''),
+                       COUNT(*),
+                       SUM(CASE WHEN {success} THEN 1 ELSE 0 END),
+                       COALESCE(SUM({time_value}), 0),
+                       COUNT({time_value}),
+                       COALESCE(SUM({size}), 0),
+                       COALESCE(SUM({size2}), 0)
+                FROM {table}
+                GROUP BY {{keys}}, COALESCE({dim}, '')
+            '''
+            cursor.execute(
+                'INSERT INTO session_rollups ' + select.format(keys='session_id')
+            )
+            cursor.execute(
+                'INSERT INTO user_day_rollups ' + select.format(keys="user_id, date(timestamp)")
+            )
+        
+        cursor.execute('''
+            UPDATE user_sessions SET total_activities = COALESCE((
+                SELECT SUM(event_count) FROM session_rollups r
+                WHERE r.session_id = user_sessions.session_id
+                  AND r.category = 'behavior'
+            ), 0)
+        ''')
+    
+    def _rebuild_search_index(self, cursor):
+        """从原始事件表重建全文检索索引"""
+        cursor.execute('DELETE FROM event_search')
+        sources = (
+            ('ai_interactions', 'question', "json_extract(additional_data, '$.question_preview')"),
+            ('ai_interactions', 'response', "json_extract(additional_data, '$.response_preview')"),
+            ('error_analysis', 'error', 'error_message'),
+        )
+        for table, kind, expression in sources:
+            cursor.execute(f'''
+                SELECT id, session_id, user_id, timestamp, {expression}
+                FROM {table} WHERE {expression} IS NOT NULL
+            ''')
+            rows = cursor.fetchall()
+            for source_id, session_id, user_id, timestamp, text in rows:
+                self._index_search_text(cursor, table, source_id, session_id, user_id,
+                                        timestamp, kind, text)
+    
+    def _index_search_text(self, cursor, table: str, source_id: int, session_id: str,
+                           user_id: str, timestamp, kind: str, text: Optional[str]):
+        """在事件写入的同一事务中将文本加入全文索引"""
+        if not self.search_enabled or not text:
+            return
+        cursor.execute('''
+            INSERT INTO event_search
+            (terms, content, kind, source_table, source_id, session_id, user_id, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (segment_search_text(text), text, kind, table, source_id,
+              session_id, user_id, timestamp))
+    
+    def remove_search_rows(self, cursor, table: str, source_ids: List[int]):
+        """在调用方的写事务中删除指向这些原始事件的全文索引行（原始行被归档删除时调用）"""
+        if not self.search_enabled or table not in SEARCH_SOURCE_TABLES or not source_ids:
+            return
+        cursor.execute('''
+            DELETE FROM event_search
+            WHERE source_table = ? AND source_id IN (SELECT value FROM json_each(?))
+        ''', (table, json.dumps(list(source_ids))))
+    
+    @staticmethod
+    def _add_rollup(totals, session_id: str, user_id: str, timestamp: datetime,
+                    category: str, dim: Optional[str], success: bool = False,
+                    time_value: float = None, size: int = 0, size2: int = 0):
+        """将一个事件累加到待写入的汇总增量中（totals 为 (会话增量, 用户日增量)）"""
+        delta = (
+            1, 1 if success else 0,
+            time_value or 0, 0 if time_value is None else 1,
+            size or 0, size2 or 0
+        )
+        session_key = (session_id, category, dim or '')
+        day_key = (user_id, timestamp.date().isoformat(), category, dim or '')
+        for bucket, key in ((totals[0], session_key), (totals[1], day_key)):
+            current = bucket.get(key)
+            bucket[key] = delta if current is None else tuple(a + b for a, b in zip(current, delta))
+    
+    @staticmethod
+    def _write_rollups(cursor, totals):
+        """在事件写入的同一事务中累加会话/用户日汇总"""
+        update = '''
+            ON CONFLICT({keys}, category, dim) DO UPDATE SET
+                event_count = event_count + excluded.event_count,
+                success_count = success_count + excluded.success_count,
+                time_sum = time_sum + excluded.time_sum,
+                time_count = time_count + excluded.time_count,
+                size_sum = size_sum + excluded.size_sum,
+                size2_sum = size2_sum + excluded.size2_sum
+        '''
+        cursor.executemany('''
+            INSERT INTO session_rollups
+            (session_id, category, dim, event_count, success_count,
+             time_sum, time_count, size_sum, size2_sum)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''' + update.format(keys='session_id'), [key + delta for key, delta in totals[0].items()])
+        cursor.executemany('''
+            INSERT INTO user_day_rollups
+            (user_id, day, category, dim, event_count, success_count,
+             time_sum, time_count, size_sum, size2_sum)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''' + update.format(keys='user_id, day'), [key + delta for key, delta in totals[1].items()])
+    
+    def _init_logging(self):
+        """初始化日志系统（异步写入，逐事件日志按级别采样）"""
+        self.logger = setup_analytics_logging('learning_analytics')
+        self._event_sampler = EventSampler(self.logger)
+    
+    def _log_event(self, msg: str, *args):
+        """记录逐事件日志（未被采样时不创建日志记录）"""
+        if self._event_sampler.should_log():
+            self.logger.info(msg, *args)
     
     def start_session(self, user_id: str = None, session_id: str = None,
-                     device_label: str = None) -> str:
+                     device_label: str = None, start_time=None) -> str:
         """
         开始新的学习会话
         
+        会话已存在时（如客户端重发）只补全为空的用户、开始时间与设备，活动数与结束时间不变。
+        
         Args:
             user_id: 用户ID
             session_id: 会话ID，如果为None则自动生成
+            device_label: 设备标识
+            start_time: 开始时间（datetime、Unix 时间戳或 ISO 字符串），默认为当前时间
             
         Returns:
             会话ID
@@ -178,20 +676,32 @@ class SQLiteAnalytics:
             session_id = f"session_{int(time.time())}_{user_id or 'anonymous'}"
 
         platform_value = device_label or 'Python_Learning_Assistant'
+        start_time = self._event_timestamp(start_time, datetime.now())
 
         with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO user_sessions 
-                    (session_id, user_id, start_time, platform)
-                    VALUES (?, ?, ?, ?)
-                ''', (session_id, user_id, datetime.now(), platform_value))
+            with self.connect() as conn:
+                self._upsert_sessions(conn.cursor(), [(session_id, user_id, start_time, platform_value)])
                 conn.commit()
         
         self.logger.info(f"Started session: {session_id} for user: {user_id}")
         return session_id
     
+    @staticmethod
+    def _upsert_sessions(cursor, rows):
+        """
+        写入会话 (session_id, user_id, start_time, platform)
+
+        已存在的会话只补全为空的列：汇总表按会话所属用户累计，不能把会话改到其他用户名下。
+        """
+        cursor.executemany('''
+            INSERT INTO user_sessions (session_id, user_id, start_time, platform)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                user_id = COALESCE(user_sessions.user_id, excluded.user_id),
+                start_time = COALESCE(user_sessions.start_time, excluded.start_time),
+                platform = COALESCE(user_sessions.platform, excluded.platform)
+        ''', rows)
+    
     def log_behavior(self, session_id: str, behavior_code: str, 
                     duration: float = None, additional_data: Dict = None):
         """
@@ -203,77 +713,10 @@ class SQLiteAnalytics:
             duration: 行为持续时间（秒）
             additional_data: 额外数据
         """
-        # 行为编码映射表（可拓展，至少覆盖 15 种典型学习行为）
-        behavior_mapping = {
-            # 任务与资源
-            'UT': ('Understanding Task', '资源', '学生通过任务窗口查看编程任务详情'),
-            'RAM': ('Referring to Additional Materials', '资源', '学生在参考资料中查阅内容'),
-
-            # 代码编辑与操作
-            'CP': ('Coding in Python', '编辑代码', '学生在代码编辑器中键入或修改代码'),
-            'SC': ('Select Code', '编辑代码', '学生在编辑器中选中一段代码'),
-            'CC': ('Copy Code', '编辑代码', '学生在代码编辑器中复制代码'),
-            'PC': ('Paste Code', '粘贴代码', '学生在代码编辑器中粘贴代码'),
-
-            # 文件操作
-            'NF': ('New File', '文件操作', '学生新建代码文件'),
-            'OF': ('Open File', '文件操作', '学生打开现有代码文件'),
-            'SV': ('Save File', '文件操作', '学生保存当前文件'),
-            'SA': ('Save As File', '文件操作', '学生将代码另存为新文件'),
-
-            # 运行与调试
-            'CR': ('Code Run', '运行代码', '学生执行代码'),
-            'DP': ('Debugging in Python', '调试', '学生在调试过程中执行单步/跳过/跳出/设置断点等操作'),
-
-            # 代码与结果阅读
-            'UPC': ('Understanding Python Codes', '理解代码', '学生通过鼠标在代码上来回移动理解代码'),
-            'CRC': ('Checking Result/Chart', '检查输出', '学生在控制台或图表区域检查输出结果'),
-            'RCM': ('Reading Console Message', '阅读信息', '学生在阅读或复制控制台中的提示/警告信息'),
-            'VE': ('Viewing Error', '查看错误', '学生在控制台中查看错误信息'),
-            'VO': ('Viewing Output', '查看输出', '学生在控制台中查看普通输出'),
-            'VC': ('Viewing Code', '查看代码', '学生在代码区域停留浏览'),
-
-            # AI 相关行为
-            'ANQ': ('Asking New Questions', 'AI辅助编程', '学生在AI助手中自主提出新的问题'),
-            'PCM': ('Pasting Console Message', 'AI辅助编程', '学生在AI助手中粘贴控制台中的错误或输出信息'),
-            'PPC': ('Pasting Python Codes', 'AI辅助编程', '学生在AI助手中粘贴自己的Python代码'),
-            'CPC': ('Copy and Paste Codes', 'AI辅助编程', '学生将AI助手中的代码拷贝到编辑器'),
-            'CAC': ('Copy AI Code', 'AI辅助编程', '学生从AI助手复制代码'),
-            'RF': ('Reading Feedback', 'AI辅助编程', '学生在AI助手中阅读反馈信息'),
-            'AC': ('AI Chat Area', 'AI交互', '学生在AI聊天区停留的时间'),
-            'SAI': ('Select AI Text', 'AI交互', '学生在AI对话区域选中文本'),
-
-            # 其他行为
-            'FC': ('Failure in ChatGPT', '其他行为', '因平台/网络故障导致AI无法正常响应'),
-            'IO': ('Idle Operation', '其他行为', '学生在一段时间内无任何可见操作')
-        }
-        
-        if behavior_code not in behavior_mapping:
-            self.logger.warning(f"Unknown behavior code: {behavior_code}")
-            return
-        
-        activity_name, category, description = behavior_mapping[behavior_code]
-        
-        with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                # 从会话表中获取 user_id
-                cursor.execute('SELECT user_id FROM user_sessions WHERE session_id = ?', (session_id,))
-                session_row = cursor.fetchone()
-                user_id = session_row[0] if session_row else 'anonymous'
-                
-                cursor.execute('''
-                    INSERT INTO learning_behaviors 
-                    (session_id, user_id, behavior_code, activity_name, category, description, 
-                     timestamp, duration, additional_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id, user_id, behavior_code, activity_name, category, description,
-                    datetime.now(), duration, json.dumps(additional_data or {})
-                ))
-                conn.commit()
-        
-        self.logger.info(f"Logged behavior: {behavior_code} ({activity_name}) for session: {session_id}")
+        self.log_events([{
+            'type': 'behavior', 'session_id': session_id, 'behavior_code': behavior_code,
+            'duration': duration, 'additional_data': additional_data
+        }])
     
     def log_code_operation(self, session_id: str, operation_type: str, 
                           code: str = None, success: bool = True, 
@@ -291,37 +734,11 @@ class SQLiteAnalytics:
             execution_time: 执行时间
             additional_data: 额外数据（如代码位置、行号等）
         """
-        code_length = len(code) if code else 0
-        line_count = len(code.split('\n')) if code else 0
-        
-        # 合并additional_data
-        merged_data = {
-            'code_preview': code[:100] + '...' if code and len(code) > 100 else code,
-            'operation_type': operation_type
-        }
-        if additional_data:
-            merged_data.update(additional_data)
-        
-        # 从会话表中获取 user_id
-        with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM user_sessions WHERE session_id = ?', (session_id,))
-                session_row = cursor.fetchone()
-                user_id = session_row[0] if session_row else 'anonymous'
-                
-                cursor.execute('''
-                    INSERT INTO code_operations 
-                    (session_id, user_id, operation_type, code_length, line_count, success, 
-                     error_message, execution_time, timestamp, additional_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id, user_id, operation_type, code_length, line_count, success,
-                    error_message, execution_time, datetime.now(), json.dumps(merged_data)
-                ))
-                conn.commit()
-        
-        self.logger.info(f"Logged code operation: {operation_type} for session: {session_id}")
+        self.log_events([{
+            'type': 'code', 'session_id': session_id, 'operation_type': operation_type,
+            'code': code, 'success': success, 'error_message': error_message,
+            'execution_time': execution_time, 'additional_data': additional_data
+        }])
     
     def log_ai_interaction(self, session_id: str, interaction_type: str,
                           question: str = None, response: str = None,
@@ -338,38 +755,11 @@ class SQLiteAnalytics:
             response_time: 响应时间
             feedback_quality: 反馈质量
         """
-        question_length = len(question) if question else 0
-        response_length = len(response) if response else 0
-        
-        # 合并additional_data
-        merged_data = {
-            'question_preview': question[:100] + '...' if question and len(question) > 100 else question,
-            'response_preview': response[:100] + '...' if response and len(response) > 100 else response,
-            'interaction_type': interaction_type
-        }
-        if additional_data:
-            merged_data.update(additional_data)
-        
-        # 从会话表中获取 user_id
-        with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM user_sessions WHERE session_id = ?', (session_id,))
-                session_row = cursor.fetchone()
-                user_id = session_row[0] if session_row else 'anonymous'
-                
-                cursor.execute('''
-                    INSERT INTO ai_interactions 
-                    (session_id, user_id, interaction_type, question_length, response_length, 
-                     response_time, feedback_quality, timestamp, additional_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id, user_id, interaction_type, question_length, response_length,
-                    response_time, feedback_quality, datetime.now(), json.dumps(merged_data)
-                ))
-                conn.commit()
-        
-        self.logger.info(f"Logged AI interaction: {interaction_type} for session: {session_id}")
+        self.log_events([{
+            'type': 'ai', 'session_id': session_id, 'interaction_type': interaction_type,
+            'question': question, 'response': response, 'response_time': response_time,
+            'feedback_quality': feedback_quality, 'additional_data': additional_data
+        }])
     
     def log_error_analysis(self, session_id: str, error_type: str, error_line: int,
                           error_message: str, fix_attempts: int = 0, fix_success: bool = False,
@@ -385,6 +775,366 @@ class SQLiteAnalytics:
             fix_attempts: 修复尝试次数
             fix_success: 是否修复成功
         """
+        self.log_events([{
+            'type': 'error', 'session_id': session_id, 'error_type': error_type,
+            'error_line': error_line, 'error_message': error_message,
+            'fix_attempts': fix_attempts, 'fix_success': fix_success,
+            'additional_data': additional_data
+        }])
+    
+    def log_events(self, events: List[Dict]) -> Dict[str, int]:
+        """
+        批量记录事件：一次校验，同一事务内每张表一次 executemany
+        
+        Args:
+            events: 事件列表。每个事件为字典，'type' 为 behavior / code / ai / error，
+                其余键与对应 log_* 方法的参数同名；可选 'timestamp'
+                （datetime、ISO 字符串或 Unix 时间戳，默认为写入时间）
+            
+        Returns:
+            各类型写入的条数，以及被跳过的无效事件数 'skipped'
+        """
+        counts, valid = self._validate_events(events)
+        if not valid:
+            return counts
+        
+        with self.lock:
+            with self.connect() as conn:
+                self._write_events(conn.cursor(), valid, counts)
+                conn.commit()
+        
+        self._log_event("Logged %d events: %s", len(valid), counts)
+        return counts
+    
+    def ingest_batch(self, sessions: List[Dict], events: List[Dict], session_ends: List[Dict],
+                     batch_key: str = None) -> Tuple[Dict[str, int], bool]:
+        """
+        在一个事务内写入一批上报数据：会话开始、事件、会话结束与批次幂等键
+        
+        Args:
+            sessions: 会话开始记录（session_id、user_id、device_label、timestamp）
+            events: 事件列表，格式同 log_events
+            session_ends: 会话结束记录（session_id、timestamp）
+            batch_key: 批次幂等键，已写入过的批次直接返回上次的结果
+            
+        Returns:
+            (各类型写入的条数, 是否为重复批次)
+        """
+        return self.ingest_batches([{
+            'sessions': sessions, 'events': events,
+            'session_ends': session_ends, 'key': batch_key
+        }])[0]
+    
+    def ingest_batches(self, batches: List[Dict]) -> List[Tuple[Dict[str, int], bool]]:
+        """
+        在一个事务内依次写入多批上报数据（后端写入队列合并写入时使用）
+        
+        Args:
+            batches: 批次列表，每批为 {'sessions', 'events', 'session_ends', 'key'}，
+                各字段含义同 ingest_batch 的参数
+            
+        Returns:
+            每批的 (各类型写入的条数, 是否为重复批次)
+        """
+        prepared = [self._validate_events(batch.get('events') or []) for batch in batches]
+        keys = [batch.get('key') for batch in batches if batch.get('key')]
+        now = datetime.now()
+        results = []
+        with self.lock:
+            with self.connect() as conn:
+                cursor = conn.cursor()
+                # 已写入的键（包括本次事务中较早的同键批次）
+                written = {}
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    written.update(
+                        (key, json.loads(counts)) for key, counts in cursor.execute(
+                            f"SELECT idempotency_key, counts FROM ingest_batches "
+                            f"WHERE idempotency_key IN ({', '.join('?' for _ in chunk)})",
+                            chunk
+                        )
+                    )
+                
+                for batch, (counts, valid) in zip(batches, prepared):
+                    key = batch.get('key')
+                    if key and key in written:
+                        results.append((written[key], True))
+                        continue
+                    sessions = batch.get('sessions') or []
+                    session_ends = batch.get('session_ends') or []
+                    if sessions:
+                        self._upsert_sessions(cursor, [(
+                            session['session_id'], session.get('user_id') or 'anonymous',
+                            self._event_timestamp(session.get('timestamp'), now),
+                            session.get('device_label') or 'Python_Learning_Assistant'
+                        ) for session in sessions])
+                    if valid:
+                        self._write_events(cursor, valid, counts)
+                    if session_ends:
+                        cursor.executemany(
+                            'UPDATE user_sessions SET end_time = ? WHERE session_id = ?',
+                            [(self._event_timestamp(end.get('timestamp'), now), end['session_id'])
+                             for end in session_ends]
+                        )
+                    if key:
+                        cursor.execute(
+                            'INSERT INTO ingest_batches (idempotency_key, counts, received_at) VALUES (?, ?, ?)',
+                            (key, json.dumps(counts), now)
+                        )
+                        written[key] = counts
+                    results.append((counts, False))
+                
+                if keys and time.time() - self._keys_purged_at >= INGEST_KEY_PURGE_INTERVAL:
+                    cursor.execute('DELETE FROM ingest_batches WHERE received_at < ?',
+                                   (now - timedelta(days=INGEST_KEY_RETENTION_DAYS),))
+                    self._keys_purged_at = time.time()
+                conn.commit()
+        
+        self._log_event("Ingested %d batches: %d events", len(batches),
+                        sum(len(valid) for _, valid in prepared))
+        return results
+    
+    def _validate_events(self, events: List[Dict]) -> Tuple[Dict[str, int], List[Dict]]:
+        """
+        校验事件（规则见 invalid_event_reason），按原因统计跳过的事件并记录一条警告
+        
+        Returns:
+            (计数字典（已填入 'skipped'）, 有效事件列表)
+        """
+        counts = {category: 0 for category in ROLLUP_SOURCES}
+        counts['skipped'] = 0
+        
+        valid = []
+        reasons = {}
+        for event in events:
+            reason = invalid_event_reason(event)
+            if reason:
+                counts['skipped'] += 1
+                reasons[reason] = reasons.get(reason, 0) + 1
+                continue
+            valid.append(event)
+        if reasons:
+            self.logger.warning("Skipped %d invalid events: %s", counts['skipped'],
+                                '; '.join(f'{reason} x{count}' for reason, count in sorted(reasons.items())))
+        return counts, valid
+    
+    def _write_events(self, cursor, valid: List[Dict], counts: Dict[str, int]):
+        """在调用方的写事务内批量写入已校验的事件（每张表一次 executemany，需要全文索引的表逐行插入），并更新汇总表"""
+        now = datetime.now()
+        user_ids = self._lookup_user_ids(cursor, {event['session_id'] for event in valid})
+        
+        rows = {category: [] for category in ROLLUP_SOURCES}
+        texts = {category: [] for category in ROLLUP_SOURCES}
+        activities: Dict[str, int] = {}
+        totals = ({}, {})
+        for event in valid:
+            category = event['type']
+            session_id = event['session_id']
+            user_id = user_ids.get(session_id, 'anonymous')
+            timestamp = self._event_timestamp(event.get('timestamp'), now)
+            code = None
+            if category == 'code' and event.get('snapshot'):
+                code = self._store_snapshot(cursor, event, user_id, timestamp)
+            row, rollup, text = self._build_event_row(category, event, user_id, timestamp, code)
+            rows[category].append(row)
+            texts[category].append(text)
+            self._add_rollup(totals, session_id, user_id, timestamp, category, *rollup)
+            if category == 'behavior':
+                activities[session_id] = activities.get(session_id, 0) + 1
+        
+        search_rows = []
+        for category, table_rows in rows.items():
+            if not table_rows:
+                continue
+            table = ROLLUP_SOURCES[category][0]
+            columns = EVENT_COLUMNS[category]
+            sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                   f"VALUES ({', '.join('?' for _ in columns)})")
+            counts[category] = len(table_rows)
+            if not self.search_enabled or not any(texts[category]):
+                cursor.executemany(sql, table_rows)
+                continue
+            # 需要建立全文索引的行逐行插入，以 lastrowid 作为检索行指向的 id
+            ts_index = columns.index('timestamp')
+            for row, text in zip(table_rows, texts[category]):
+                cursor.execute(sql, row)
+                for kind, content in text or ():
+                    if content:
+                        search_rows.append((
+                            segment_search_text(content), content, kind, table,
+                            cursor.lastrowid, row[0], row[1], row[ts_index]
+                        ))
+        
+        if search_rows:
+            cursor.executemany('''
+                INSERT INTO event_search
+                (terms, content, kind, source_table, source_id, session_id, user_id, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', search_rows)
+        if activities:
+            cursor.executemany('''
+                UPDATE user_sessions SET total_activities = total_activities + ?
+                WHERE session_id = ?
+            ''', [(count, session_id) for session_id, count in activities.items()])
+        self._write_rollups(cursor, totals)
+    
+    def _store_snapshot(self, cursor, event, user_id: str, timestamp: datetime) -> Optional[str]:
+        """
+        保存代码操作附带的快照（新版本才写入），并得到该版本的完整代码
+        
+        Returns:
+            完整代码：事件自带的代码，或由上一版本与差异还原；无法还原时为 None
+        """
+        snapshot = event['snapshot']
+        session_id = event['session_id']
+        file_key = snapshot.get('file') or ''
+        seq = snapshot.get('seq') or 0
+        code = event.get('code')
+        if code is None:
+            previous = None
+            if 'delta' in snapshot:
+                previous = self._load_snapshot(cursor, session_id, file_key, seq - 1, snapshot.get('base'))
+            elif 'content' not in snapshot:
+                previous = self._load_snapshot(cursor, session_id, file_key, seq, snapshot.get('hash'))
+            code = resolve_snapshot(snapshot, previous)
+        
+        if 'content' in snapshot or 'delta' in snapshot:
+            delta = snapshot.get('delta')
+            cursor.execute('''
+                INSERT OR IGNORE INTO code_snapshots
+                (session_id, user_id, file_key, seq, content_hash, base_hash, delta, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (session_id, user_id, file_key, seq, snapshot.get('hash'), snapshot.get('base'),
+                  json.dumps(delta, ensure_ascii=False) if delta is not None else None,
+                  snapshot.get('content'), timestamp))
+        
+        if code is not None:
+            key = (session_id, file_key)
+            self._snapshot_cache[key] = (seq, snapshot.get('hash'), code)
+            self._snapshot_cache.move_to_end(key)
+            if len(self._snapshot_cache) > SNAPSHOT_CACHE_SIZE:
+                self._snapshot_cache.popitem(last=False)
+        return code
+    
+    def _load_snapshot(self, cursor, session_id: str, file_key: str, seq: int,
+                       expected_hash: str) -> Optional[str]:
+        """取得某个版本的完整代码：优先使用缓存，否则由最近的基准版本依次应用差异"""
+        cached = self._snapshot_cache.get((session_id, file_key))
+        if cached and cached[0] == seq and cached[1] == expected_hash:
+            return cached[2]
+        rows = cursor.execute('''
+            SELECT seq, delta, content FROM code_snapshots
+            WHERE session_id = ? AND file_key = ? AND seq <= ? AND seq >= (
+                SELECT MAX(seq) FROM code_snapshots
+                WHERE session_id = ? AND file_key = ? AND seq <= ? AND content IS NOT NULL
+            )
+            ORDER BY seq
+        ''', (session_id, file_key, seq, session_id, file_key, seq)).fetchall()
+        code = _replay_snapshots(rows)
+        if code is None or content_hash(code) != expected_hash:
+            return None
+        return code
+    
+    @staticmethod
+    def _lookup_user_ids(cursor, session_ids) -> Dict[str, str]:
+        """批量查询会话所属的 user_id"""
+        session_ids = list(session_ids)
+        user_ids = {}
+        for start in range(0, len(session_ids), 500):
+            chunk = session_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT session_id, user_id FROM user_sessions "
+                f"WHERE session_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            user_ids.update(cursor.fetchall())
+        return user_ids
+    
+    @staticmethod
+    def _event_timestamp(value, default: datetime) -> datetime:
+        """解析事件自带的时间戳"""
+        if value is None:
+            return default
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(str(value))
+    
+    @staticmethod
+    def _build_event_row(category: str, event: Dict, user_id: str, timestamp: datetime,
+                         code: str = None):
+        """
+        将事件字典转换为插入行
+        
+        Args:
+            code: 由代码快照还原的完整代码（代码操作事件未携带代码时使用）
+        
+        Returns:
+            (按 EVENT_COLUMNS 排列的行, 汇总参数, [(检索类型, 文本), ...])
+        """
+        session_id = event['session_id']
+        additional_data = event.get('additional_data')
+        
+        if category == 'behavior':
+            behavior_code = event['behavior_code']
+            activity_name, behavior_category, description = BEHAVIOR_MAPPING[behavior_code]
+            duration = event.get('duration')
+            row = (session_id, user_id, behavior_code, activity_name, behavior_category,
+                   description, timestamp, duration, json.dumps(additional_data or {}))
+            return row, (behavior_code, False, duration), None
+        
+        if category == 'code':
+            operation_type = event['operation_type']
+            snapshot = event.get('snapshot')
+            code = event.get('code') if code is None else code
+            success = event.get('success', True)
+            execution_time = event.get('execution_time')
+            if code is None and snapshot:
+                # 快照无法还原时使用客户端记录的长度与行数
+                code_length = snapshot.get('length', 0)
+                line_count = snapshot.get('lines', 0)
+            else:
+                code_length = len(code) if code else 0
+                line_count = len(code.split('\n')) if code else 0
+            # 合并additional_data
+            merged_data = {
+                'code_preview': code[:100] + '...' if code and len(code) > 100 else code,
+                'operation_type': operation_type
+            }
+            if snapshot:
+                merged_data['snapshot'] = {key: snapshot.get(key) for key in ('file', 'seq', 'hash')}
+            if additional_data:
+                merged_data.update(additional_data)
+            row = (session_id, user_id, operation_type, code_length, line_count, success,
+                   event.get('error_message'), execution_time, timestamp, json.dumps(merged_data))
+            return row, (operation_type, success, execution_time, code_length, line_count), None
+        
+        if category == 'ai':
+            interaction_type = event['interaction_type']
+            question = event.get('question')
+            response = event.get('response')
+            response_time = event.get('response_time')
+            question_length = len(question) if question else 0
+            response_length = len(response) if response else 0
+            # 合并additional_data
+            merged_data = {
+                'question_preview': question[:100] + '...' if question and len(question) > 100 else question,
+                'response_preview': response[:100] + '...' if response and len(response) > 100 else response,
+                'interaction_type': interaction_type
+            }
+            if additional_data:
+                merged_data.update(additional_data)
+            row = (session_id, user_id, interaction_type, question_length, response_length,
+                   response_time, event.get('feedback_quality'), timestamp, json.dumps(merged_data))
+            return (row, (interaction_type, False, response_time, question_length, response_length),
+                    [('question', question), ('response', response)])
+        
+        error_type = event['error_type']
+        error_line = event.get('error_line')
+        error_message = event.get('error_message')
+        fix_attempts = event.get('fix_attempts', 0)
+        fix_success = event.get('fix_success', False)
         # 合并additional_data
         merged_data = {
             'error_type': error_type,
@@ -393,81 +1143,107 @@ class SQLiteAnalytics:
         }
         if additional_data:
             merged_data.update(additional_data)
+        row = (session_id, user_id, error_type, error_line, error_message,
+               fix_attempts, fix_success, timestamp, json.dumps(merged_data))
+        return row, (error_type, fix_success, None, fix_attempts), [('error', error_message)]
+    
+    def get_code_history(self, session_id: str, file_key: str = None) -> Dict[str, List[Dict]]:
+        """
+        还原会话中各文件的代码版本历史
         
-        # 从会话表中获取 user_id
-        with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT user_id FROM user_sessions WHERE session_id = ?', (session_id,))
-                session_row = cursor.fetchone()
-                user_id = session_row[0] if session_row else 'anonymous'
-                
-                cursor.execute('''
-                    INSERT INTO error_analysis 
-                    (session_id, user_id, error_type, error_line, error_message, 
-                     fix_attempts, fix_success, timestamp, additional_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id, user_id, error_type, error_line, error_message,
-                    fix_attempts, fix_success, datetime.now(), json.dumps(merged_data)
-                ))
-                conn.commit()
+        Args:
+            session_id: 会话ID
+            file_key: 只返回该文件（默认全部文件）
+            
+        Returns:
+            文件名 -> [{'seq', 'hash', 'timestamp', 'code'}, ...]（按版本号排列，
+            缺少前序版本而无法还原的版本 code 为 None）
+        """
+        sql = '''
+            SELECT file_key, seq, content_hash, delta, content, timestamp
+            FROM code_snapshots WHERE session_id = ?
+        '''
+        params = [session_id]
+        if file_key is not None:
+            sql += ' AND file_key = ?'
+            params.append(file_key)
+        sql += ' ORDER BY file_key, seq'
+        with self.snapshot() as conn:
+            rows = conn.execute(sql, params).fetchall()
         
-        self.logger.info(f"Logged error analysis: {error_type} for session: {session_id}")
+        history: Dict[str, List[Dict]] = {}
+        code, last_seq = None, None
+        for key, seq, digest, delta, content, timestamp in rows:
+            versions = history.setdefault(key, [])
+            if not versions:
+                code, last_seq = None, None
+            code = _replay_snapshots([(seq, delta, content)], code, last_seq)
+            last_seq = seq
+            if code is not None and content_hash(code) != digest:
+                code = None
+            versions.append({'seq': seq, 'hash': digest, 'timestamp': timestamp, 'code': code})
+        return history
     
-    def end_session(self, session_id: str):
-        """结束学习会话"""
+    def end_session(self, session_id: str, end_time=None):
+        """结束学习会话（end_time 默认为当前时间）"""
+        end_time = self._event_timestamp(end_time, datetime.now())
         with self.lock:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connect() as conn:
                 cursor = conn.cursor()
+                # total_activities 已在写入行为时增量维护
                 cursor.execute('''
-                    UPDATE user_sessions 
-                    SET end_time = ?, total_activities = (
-                        SELECT COUNT(*) FROM learning_behaviors WHERE session_id = ?
-                    )
-                    WHERE session_id = ?
-                ''', (datetime.now(), session_id, session_id))
+                    UPDATE user_sessions SET end_time = ? WHERE session_id = ?
+                ''', (end_time, session_id))
                 conn.commit()
         
         self.logger.info(f"Ended session: {session_id}")
     
     def get_session_stats(self, session_id: str) -> Dict:
         """获取会话统计信息"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.snapshot() as conn:
             cursor = conn.cursor()
             
             # 获取会话基本信息
             cursor.execute('SELECT * FROM user_sessions WHERE session_id = ?', (session_id,))
             session_info = cursor.fetchone()
             
-            # 获取行为统计
+            # 获取汇总统计（由写入路径增量维护）
             cursor.execute('''
-                SELECT behavior_code, COUNT(*) as count 
-                FROM learning_behaviors 
-                WHERE session_id = ? 
-                GROUP BY behavior_code
-            ''', (session_id,))
-            behavior_stats = dict(cursor.fetchall())
-            
-            # 获取代码操作统计
-            cursor.execute('''
-                SELECT COUNT(*) as total_operations,
-                       SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_operations,
-                       AVG(execution_time) as avg_execution_time
-                FROM code_operations 
+                SELECT category, dim, event_count, success_count,
+                       time_sum, time_count, size_sum
+                FROM session_rollups
                 WHERE session_id = ?
             ''', (session_id,))
-            code_stats = cursor.fetchone()
+            behavior_stats = {}
+            code_totals = [0, 0, 0.0, 0]
+            ai_totals = [0, 0.0, 0, 0]
+            for category, dim, count, success_count, time_sum, time_count, size_sum in cursor.fetchall():
+                if category == 'behavior':
+                    behavior_stats[dim or None] = count
+                elif category == 'code':
+                    code_totals[0] += count
+                    code_totals[1] += success_count
+                    code_totals[2] += time_sum
+                    code_totals[3] += time_count
+                elif category == 'ai':
+                    ai_totals[0] += count
+                    ai_totals[1] += time_sum
+                    ai_totals[2] += time_count
+                    ai_totals[3] += size_sum
             
-            # 获取AI交互统计
-            cursor.execute('''
-                SELECT COUNT(*) as total_interactions,
-                       AVG(response_time) as avg_response_time,
-                       AVG(question_length) as avg_question_length
-                FROM ai_interactions 
-                WHERE session_id = ?
-            ''', (session_id,))
-            ai_stats = cursor.fetchone()
+            # 代码操作统计：(总数, 成功数, 平均执行时间)
+            code_stats = (
+                code_totals[0],
+                code_totals[1] if code_totals[0] else None,
+                code_totals[2] / code_totals[3] if code_totals[3] else None
+            )
+            
+            # AI交互统计：(总数, 平均响应时间, 平均问题长度)
+            ai_stats = (
+                ai_totals[0],
+                ai_totals[1] / ai_totals[2] if ai_totals[2] else None,
+                ai_totals[3] / ai_totals[0] if ai_totals[0] else None
+            )
             
             return {
                 'session_info': session_info,
@@ -476,51 +1252,639 @@ class SQLiteAnalytics:
                 'ai_stats': ai_stats
             }
     
-    def export_data(self, session_id: str = None, output_file: str = None) -> str:
+    def search(self, query: str, user_id: str = None, start_time=None, end_time=None,
+               kind: str = None, limit: int = 20, offset: int = 0) -> Dict:
+        """
+        全文检索 AI 问题、AI 回答与错误信息
+        
+        Args:
+            query: 检索词，多个词以空格分隔（同时包含）
+            user_id: 可选，只检索某个学生
+            start_time / end_time: 可选时间范围
+            kind: 可选，question / response / error
+            limit / offset: 分页参数
+            
+        Returns:
+            {'total': 命中总数, 'results': 按相关度排序的结果列表}
+        """
+        terms = [term for term in (query or '').split() if term]
+        if not terms:
+            return {'total': 0, 'results': []}
+        
+        conditions, params = [], []
+        for column, op, value in (('user_id', '=', user_id),
+                                  ('timestamp', '>=', start_time),
+                                  ('timestamp', '<', end_time),
+                                  ('kind', '=', kind)):
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                params.append(value)
+        
+        if self.search_enabled:
+            match = ' '.join(
+                '"' + segment_search_text(term).strip().replace('"', '""') + '"*'
+                for term in terms
+            )
+            conditions.insert(0, 'event_search MATCH ?')
+            params.insert(0, match)
+            order = 'rank'
+        else:
+            conditions[:0] = ['content LIKE ?'] * len(terms)
+            params[:0] = [f'%{term}%' for term in terms]
+            order = 'timestamp DESC'
+        where = ' AND '.join(conditions)
+        source = 'event_search' if self.search_enabled else '''(
+            SELECT id AS source_id, 'ai_interactions' AS source_table, 'question' AS kind,
+                   session_id, user_id, timestamp,
+                   json_extract(additional_data, '$.question_preview') AS content
+            FROM ai_interactions
+            UNION ALL
+            SELECT id, 'ai_interactions', 'response', session_id, user_id, timestamp,
+                   json_extract(additional_data, '$.response_preview')
+            FROM ai_interactions
+            UNION ALL
+            SELECT id, 'error_analysis', 'error', session_id, user_id, timestamp, error_message
+            FROM error_analysis
+        )'''
+        
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(f'''
+                SELECT source_table, source_id, kind, session_id, user_id, timestamp, content
+                FROM {source} WHERE {where}
+                ORDER BY {order} LIMIT ? OFFSET ?
+            ''', params + [limit, offset])
+            results = [dict(row) for row in cursor.fetchall()]
+        
+        return {'total': total, 'results': results}
+    
+    def get_overview_stats(self, days: int = 30) -> Dict:
+        """
+        获取最近若干天的总体统计（基于用户日汇总表）
+        
+        Args:
+            days: 统计的天数范围
+            
+        Returns:
+            包含会话、行为、代码操作、AI交互、错误分析统计的字典
+        """
+        session_totals, rows = self.fetch_overview_totals(datetime.now() - timedelta(days=days))
+        return format_overview_stats(days, session_totals, rows)
+    
+    def fetch_overview_totals(self, start_date: datetime):
+        """
+        读取总体统计的原始累计值（可跨多个数据库相加后再计算平均值）
+        
+        Returns:
+            ((会话数, 用户数, 活动总数), [(类别, 维度, 事件数, 成功数, 耗时和, 耗时计数, 长度和, 第二长度和), ...])
+        """
+        with self.snapshot() as conn:
+            cursor = conn.cursor()
+            
+            # 会话统计
+            cursor.execute('''
+                SELECT COUNT(*), COUNT(DISTINCT user_id), TOTAL(total_activities)
+                FROM user_sessions 
+                WHERE start_time >= ?
+            ''', (start_date,))
+            session_totals = cursor.fetchone()
+            
+            cursor.execute('''
+                SELECT category, NULLIF(dim, '') AS dim,
+                       SUM(event_count), SUM(success_count),
+                       SUM(time_sum), SUM(time_count),
+                       SUM(size_sum), SUM(size2_sum)
+                FROM user_day_rollups
+                WHERE day >= ?
+                GROUP BY category, dim
+            ''', (start_date.date().isoformat(),))
+            rows = cursor.fetchall()
+        return session_totals, rows
+    
+    def iter_export_batches(self, table: str, session_id: str = None, user_id: str = None,
+                            start_time=None, end_time=None, after_rowid: int = 0,
+                            batch_size: int = 1000, include_promoted: bool = False):
         """
-        导出数据到JSON文件
+        按 rowid 分页逐批读取某张表的数据（每批单独查询，不长期占用读锁）
+        
+        Args:
+            table: 表名，必须是 EXPORT_TABLES 之一
+            session_id / user_id: 可选过滤条件
+            start_time / end_time: 可选时间范围（会话表按 start_time，其余按 timestamp）
+            after_rowid: 从该 rowid 之后继续读取，用于断点续传
+            batch_size: 每批读取的行数
+            include_promoted: 是否同时读取 additional_data 生成列（data_<键>）
+            
+        Yields:
+            (本批最后一行的 rowid, 列名列表, 行列表)
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table}")
+        
+        time_column = 'start_time' if table == 'user_sessions' else 'timestamp'
+        conditions = ['rowid > ?']
+        params = []
+        for column, op, value in (('session_id', '=', session_id),
+                                  ('user_id', '=', user_id),
+                                  (time_column, '>=', start_time),
+                                  (time_column, '<', end_time)):
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                params.append(value)
+        columns = self.base_columns(table)
+        if include_promoted:
+            columns += self.promoted_columns.get(table, {}).values()
+        sql = (f'SELECT rowid, {", ".join(columns)} FROM {table} '
+               f'WHERE {" AND ".join(conditions)} ORDER BY rowid LIMIT ?')
+        
+        last_rowid = after_rowid
+        while True:
+            with self.connect() as conn:
+                rows = conn.execute(sql, [last_rowid] + params + [batch_size]).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield last_rowid, columns, [row[1:] for row in rows]
+            if len(rows) < batch_size:
+                return
+    
+    def export_data(self, session_id: str = None, output_file: str = None,
+                    fmt: str = 'json', compress: bool = False, user_id: str = None,
+                    start_time=None, end_time=None, resume: bool = False,
+                    batch_size: int = 1000) -> str:
+        """
+        流式导出数据，内存占用与表大小无关
         
         Args:
             session_id: 会话ID，如果为None则导出所有数据
-            output_file: 输出文件路径
+            output_file: 输出路径；csv 格式时为输出目录（每张表一个文件）
+            fmt: 导出格式，json（兼容旧结构）、jsonl（每行一条记录）或 csv
+            compress: 是否使用 gzip 压缩
+            user_id / start_time / end_time: 可选过滤条件
+            resume: 是否根据进度文件从上次中断处继续（json 格式不支持）
+            batch_size: 每批读取和写入的行数
             
         Returns:
             输出文件路径
         """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        if resume and fmt == 'json':
+            raise ValueError("Resumable export requires jsonl or csv format")
+        
         if output_file is None:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_file = f"analytics_export_{timestamp}.json"
+            output_file = f"analytics_export_{timestamp}"
+            if fmt != 'csv':
+                output_file += f".{fmt}" + ('.gz' if compress else '')
         
-        export_data = {
-            'export_time': datetime.now().isoformat(),
-            'session_id': session_id,
-            'data': {}
-        }
+        filters = {'session_id': session_id, 'user_id': user_id,
+                   'start_time': start_time, 'end_time': end_time}
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        # 进度文件：记录每张表已导出的 rowid 及各输出文件的有效字节数
+        progress_file = f"{output_file.rstrip(os.sep)}.progress.json"
+        progress = {'tables': {}, 'offsets': {}}
+        if resume and os.path.exists(progress_file):
+            with open(progress_file, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+        
+        if fmt == 'csv':
+            os.makedirs(output_file, exist_ok=True)
+            suffix = '.csv.gz' if compress else '.csv'
+            targets = {table: os.path.join(output_file, table + suffix) for table in EXPORT_TABLES}
+        else:
+            targets = {table: output_file for table in EXPORT_TABLES}
+        
+        handles = {}
+        try:
+            for path in set(targets.values()):
+                # 截断到上次确认写入的位置，丢弃中断时可能残留的半批数据
+                offset = progress['offsets'].get(path, 0)
+                handle = open(path, 'r+b' if offset else 'wb')
+                handle.truncate(offset)
+                handle.seek(offset)
+                handles[path] = handle
             
-            if session_id:
-                # 导出指定会话数据
-                tables = ['user_sessions', 'learning_behaviors', 'code_operations', 
-                         'ai_interactions', 'error_analysis']
-                for table in tables:
-                    cursor.execute(f'SELECT * FROM {table} WHERE session_id = ?', (session_id,))
-                    export_data['data'][table] = [dict(row) for row in cursor.fetchall()]
-            else:
-                # 导出所有数据
-                tables = ['user_sessions', 'learning_behaviors', 'code_operations', 
-                         'ai_interactions', 'error_analysis']
-                for table in tables:
-                    cursor.execute(f'SELECT * FROM {table}')
-                    export_data['data'][table] = [dict(row) for row in cursor.fetchall()]
+            if fmt == 'json':
+                header = json.dumps({'export_time': datetime.now().isoformat(),
+                                     'session_id': session_id}, ensure_ascii=False)
+                self._write_export_chunk(handles[output_file], header[:-1] + ', "data": {', compress)
+            
+            for index, table in enumerate(EXPORT_TABLES):
+                path = targets[table]
+                handle = handles[path]
+                # csv 文件从头写入时需要表头；json 格式每张表的首批前不加逗号
+                first_batch = fmt == 'json' or handle.tell() == 0
+                
+                if fmt == 'json':
+                    prefix = (', ' if index else '') + json.dumps(table) + ': ['
+                    self._write_export_chunk(handle, prefix, compress)
+                
+                for last_rowid, columns, rows in self.iter_export_batches(
+                        table, after_rowid=progress['tables'].get(table, 0),
+                        batch_size=batch_size, **filters):
+                    chunk = encode_export_rows(table, columns, rows, fmt,
+                                               header=first_batch, leading_comma=not first_batch)
+                    first_batch = False
+                    self._write_export_chunk(handle, chunk, compress)
+                    
+                    if fmt != 'json':
+                        handle.flush()
+                        progress['tables'][table] = last_rowid
+                        progress['offsets'][path] = handle.tell()
+                        with open(progress_file, 'w', encoding='utf-8') as f:
+                            json.dump(progress, f)
+                
+                if fmt == 'json':
+                    self._write_export_chunk(handle, ']', compress)
+            
+            if fmt == 'json':
+                self._write_export_chunk(handles[output_file], '}}\n', compress)
+        finally:
+            for handle in handles.values():
+                handle.close()
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2, default=str)
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
         
         self.logger.info(f"Exported data to: {output_file}")
         return output_file
+    
+    def stream_export(self, tables: List[str] = None, fmt: str = 'jsonl',
+                      session_id: str = None, user_id: str = None,
+                      start_time=None, end_time=None, batch_size: int = 1000) -> Iterator[str]:
+        """
+        逐批读取并编码导出数据，不写入文件，供 HTTP 接口边读边发送
+        
+        Args:
+            tables: 导出的表，默认为全部 EXPORT_TABLES（csv 格式时只能指定一张）
+            fmt: jsonl 或 csv
+            session_id / user_id / start_time / end_time: 可选过滤条件
+            batch_size: 每批读取的行数
+            
+        Returns:
+            文本块的迭代器（参数在调用时即检查，无效时抛出 ValueError）
+        """
+        tables = check_stream_export(tables, fmt)
+        filters = {'session_id': session_id, 'user_id': user_id,
+                   'start_time': start_time, 'end_time': end_time}
+        return iter_export_chunks(
+            tables, fmt,
+            lambda table: self.iter_export_batches(table, batch_size=batch_size, **filters)
+        )
+    
+    def export_parquet(self, output_dir: str = None, session_id: str = None,
+                       user_id: str = None, start_time=None, end_time=None,
+                       batch_size: int = 50000) -> Dict:
+        """
+        导出列式 Parquet 分析快照（需要 pandas 与 pyarrow）
+        
+        每张表写入 <output_dir>/<表名>/date=YYYY-MM-DD/part-NNNNN.parquet，
+        可直接用 pandas.read_parquet(<output_dir>/<表名>) 读取。
+        
+        Args:
+            output_dir: 输出目录
+            session_id / user_id / start_time / end_time: 可选过滤条件
+            batch_size: 每个分片文件的最大行数
+            
+        Returns:
+            包含输出目录、各表行数和文件数的字典
+        """
+        try:
+            import pandas as pd
+        except ImportError as exc:
+            raise RuntimeError("Parquet导出需要安装 pandas 与 pyarrow") from exc
+        
+        if output_dir is None:
+            output_dir = f"analytics_parquet_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        filters = {'session_id': session_id, 'user_id': user_id,
+                   'start_time': start_time, 'end_time': end_time}
+        row_counts = {}
+        file_count = 0
+        
+        for table in EXPORT_TABLES:
+            row_counts[table] = 0
+            time_column = 'start_time' if table == 'user_sessions' else 'timestamp'
+            batches = self.iter_export_batches(table, batch_size=batch_size,
+                                               include_promoted=True, **filters)
+            for part, (_, columns, rows) in enumerate(batches):
+                frame = self._to_typed_frame(pd, table, columns, rows)
+                days = frame[time_column].dt.strftime('%Y-%m-%d').fillna('unknown')
+                for day, day_frame in frame.groupby(days, sort=False):
+                    partition_dir = os.path.join(output_dir, table, f'date={day}')
+                    os.makedirs(partition_dir, exist_ok=True)
+                    day_frame.to_parquet(
+                        os.path.join(partition_dir, f'part-{part:05d}.parquet'),
+                        index=False, compression='zstd'
+                    )
+                    file_count += 1
+                row_counts[table] += len(rows)
+        
+        result = {
+            'output_dir': output_dir,
+            'export_time': datetime.now().isoformat(),
+            'row_counts': row_counts,
+            'file_count': file_count
+        }
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, '_manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        
+        self.logger.info(f"Exported parquet snapshot to: {output_dir}")
+        return result
+    
+    @staticmethod
+    def _to_typed_frame(pd, table: str, columns: List[str], rows: List[tuple]):
+        """将一批行转换为带明确类型的 DataFrame，并展开常用的 additional_data 键"""
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        
+        column_types = {column: PARQUET_COLUMN_TYPES.get(column, 'TEXT') for column in columns}
+        promoted = PROMOTED_JSON_KEYS.get(table, {})
+        # 数据库中已存在的生成列无需再解析 JSON
+        missing = {key for key in promoted if f'data_{key}' not in frame}
+        if missing and 'additional_data' in frame:
+            parsed = frame['additional_data'].map(_parse_json_object)
+            for key in missing:
+                frame[f'data_{key}'] = parsed.map(lambda data, key=key: data.get(key))
+        for key, sql_type in promoted.items():
+            if f'data_{key}' in frame:
+                column_types[f'data_{key}'] = sql_type
+        
+        for column, sql_type in column_types.items():
+            values = frame[column]
+            if sql_type == 'INTEGER':
+                numbers = pd.to_numeric(values, errors='coerce')
+                frame[column] = numbers.where(numbers == numbers.round()).astype('Int64')
+            elif sql_type == 'REAL':
+                frame[column] = pd.to_numeric(values, errors='coerce').astype('Float64')
+            elif sql_type == 'BOOLEAN':
+                frame[column] = pd.to_numeric(values, errors='coerce').astype('Float64').ne(0)
+            elif sql_type == 'TIMESTAMP':
+                frame[column] = pd.to_datetime(values, errors='coerce', format='ISO8601')
+            else:
+                frame[column] = values.astype('string')
+        return frame
+    
+    @staticmethod
+    def _write_export_chunk(handle, text: str, compress: bool):
+        """写入一段导出内容；压缩时每段作为独立的 gzip 成员，便于断点截断"""
+        data = text.encode('utf-8')
+        if compress:
+            data = gzip.compress(data)
+        handle.write(data)
+
+
+def format_overview_stats(days: int, session_totals, rows) -> Dict:
+    """
+    将累计值整理为总体统计结果
+
+    Args:
+        days: 统计的天数范围
+        session_totals: (会话数, 用户数, 活动总数)
+        rows: 按类别、维度汇总的累计值，见 SQLiteAnalytics.fetch_overview_totals
+    """
+    total_sessions, unique_users, activity_total = session_totals
+    session_stats = {
+        'total_sessions': total_sessions,
+        'unique_users': unique_users,
+        'avg_activities_per_session': activity_total / total_sessions if total_sessions else None
+    }
+    rows = sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def _avg(total, count):
+        return total / count if count else None
+
+    behavior_stats, code_stats, ai_stats, error_stats = [], [], [], []
+    for category, dim, count, success_count, time_sum, time_count, size_sum, size2_sum in rows:
+        if category == 'behavior':
+            behavior_stats.append({
+                'behavior_code': dim,
+                'activity_name': BEHAVIOR_MAPPING.get(dim, (None,))[0],
+                'count': count
+            })
+        elif category == 'code':
+            code_stats.append({
+                'operation_type': dim,
+                'total_operations': count,
+                'successful_operations': success_count,
+                'avg_execution_time': _avg(time_sum, time_count)
+            })
+        elif category == 'ai':
+            ai_stats.append({
+                'interaction_type': dim,
+                'total_interactions': count,
+                'avg_response_time': _avg(time_sum, time_count),
+                'avg_question_length': _avg(size_sum, count),
+                'avg_response_length': _avg(size2_sum, count)
+            })
+        elif category == 'error':
+            error_stats.append({
+                'error_type': dim,
+                'total_errors': count,
+                'fixed_errors': success_count,
+                'avg_fix_attempts': _avg(size_sum, count)
+            })
+
+    return {
+        'period': f'Last {days} days',
+        'session_stats': session_stats,
+        'behavior_stats': behavior_stats,
+        'code_stats': code_stats,
+        'ai_stats': ai_stats,
+        'error_stats': error_stats
+    }
+
+
+def segment_search_text(text: str) -> str:
+    """
+    为全文检索切分文本：每个中日韩字符作为单独的词
+    
+    unicode61 分词器会把连续的汉字当作一个词，切分后用短语查询即可匹配任意长度的中文片段。
+    """
+    return _CJK_PATTERN.sub(r' \1 ', text)
+
+
+def is_valid_timestamp(value) -> bool:
+    """
+    事件时间戳能否解析：None、datetime、ISO 字符串或可转换为本地时间的有限 Unix 时间戳
+
+    布尔值不算时间戳；NaN、无穷大与超出范围的数字（如 1e20）无效。
+    """
+    if value is None or isinstance(value, datetime):
+        return True
+    try:
+        if isinstance(value, str):
+            datetime.fromisoformat(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            datetime.fromtimestamp(value)
+        else:
+            return False
+    except (ValueError, OverflowError, OSError):
+        return False
+    return True
+
+
+def invalid_event_reason(event: Dict) -> Optional[str]:
+    """
+    事件无法写入的原因，有效时返回 None
+
+    类型、会话与维度字段（字符串）必须存在，行为编码必须在映射表中，时间戳必须可以解析。
+    写入时跳过无效事件；旧版单事件接口据此直接拒绝请求。
+    """
+    category = event.get('type')
+    if category not in ROLLUP_SOURCES:
+        return f'unknown type {category!r}'
+    if not event.get('session_id'):
+        return 'missing session_id'
+    field = ROLLUP_SOURCES[category][1]
+    value = event.get(field)
+    if not value or not isinstance(value, str):
+        return f'missing or invalid {field}'
+    if category == 'behavior' and value not in BEHAVIOR_MAPPING:
+        return f'unknown behavior_code {value!r}'
+    if not is_valid_timestamp(event.get('timestamp')):
+        return 'invalid timestamp'
+    return None
+
+
+def _replay_snapshots(rows, code: str = None, last_seq: int = None) -> Optional[str]:
+    """
+    依次应用快照行 (版本号, 差异 JSON, 完整内容)，得到最后一个版本的代码
+    
+    Args:
+        code: 第一行之前的版本内容
+        last_seq: 该版本的版本号（版本号不连续时无法应用差异）
+    """
+    for seq, delta, content in rows:
+        if content is not None:
+            code = content
+        elif code is not None and last_seq == seq - 1:
+            code = apply_delta(code, json.loads(delta))
+        else:
+            code = None
+        last_seq = seq
+    return code
+
+
+def _parse_json_object(value) -> Dict:
+    """解析 additional_data，无法解析或不是对象时返回空字典"""
+    try:
+        data = json.loads(value) if value else {}
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def encode_export_rows(table: str, columns: List[str], rows: List[tuple], fmt: str,
+                       header: bool = False, leading_comma: bool = False) -> str:
+    """
+    将一批行编码为导出文本
+    
+    Args:
+        table: 表名（jsonl 格式中写入每行的 table 字段）
+        columns: 列名列表
+        rows: 行数据
+        fmt: json、jsonl 或 csv
+        header: csv 格式时是否输出表头
+        leading_comma: json 格式时是否在本批前加逗号（非首批）
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(columns)
+        writer.writerows(rows)
+        return buffer.getvalue()
+    
+    records = (dict(zip(columns, row)) for row in rows)
+    if fmt == 'jsonl':
+        return ''.join(
+            json.dumps({'table': table, 'data': record}, ensure_ascii=False, default=str) + '\n'
+            for record in records
+        )
+    body = ', '.join(json.dumps(record, ensure_ascii=False, default=str) for record in records)
+    return (', ' if leading_comma else '') + body
+
+
+
+def check_stream_export(tables: Optional[List[str]], fmt: str) -> List[str]:
+    """检查流式导出的格式与表名，返回要导出的表"""
+    if fmt not in STREAM_EXPORT_FORMATS:
+        raise ValueError(f"Unsupported streaming export format: {fmt}")
+    tables = list(tables) if tables else list(EXPORT_TABLES)
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown export table: {', '.join(unknown)}")
+    if fmt == 'csv' and len(tables) != 1:
+        raise ValueError("CSV export requires exactly one table")
+    return tables
+
+
+def iter_export_chunks(tables: List[str], fmt: str, fetch_batches) -> Iterator[str]:
+    """
+    将各表的分批数据编码为导出文本块
+    
+    Args:
+        tables: 按顺序导出的表
+        fmt: jsonl 或 csv（csv 只在第一批前输出表头）
+        fetch_batches: 函数，参数为表名，返回 iter_export_batches 形式的批次迭代器
+    """
+    for table in tables:
+        header = fmt == 'csv'
+        for _, columns, rows in fetch_batches(table):
+            yield encode_export_rows(table, columns, rows, fmt, header=header)
+            header = False
+
+
+def encode_export_stream(chunks: Iterator[str], compress: bool,
+                         chunk_bytes: int = 64 * 1024, logger: logging.Logger = None,
+                         context: str = '') -> Iterator[bytes]:
+    """
+    将导出文本块编码为响应数据（可选 gzip），累积到 chunk_bytes 后输出一次
+    
+    读取或编码出错时记录错误后重新抛出：状态码已经发出，由 WSGI 服务器中断连接，
+    客户端收到不完整的分块响应，而不是看似完整、实际被截断的文件。
+    
+    Args:
+        logger: 记录中断错误的日志器，默认为 learning_analytics
+        context: 写入错误日志的导出说明（如文件名与筛选条件）
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buffer, size, sent = [], 0, 0
+    try:
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            if compressor is not None:
+                data = compressor.compress(data)
+            buffer.append(data)
+            size += len(data)
+            if size >= chunk_bytes:
+                yield b''.join(buffer)
+                buffer, size, sent = [], 0, sent + size
+        if compressor is not None:
+            buffer.append(compressor.flush())
+        if buffer:
+            yield b''.join(buffer)
+    except Exception as e:
+        (logger or logging.getLogger('learning_analytics')).error(
+            "Export stream aborted after %d bytes (%s): %s", sent, context or 'export', e,
+            exc_info=True
+        )
+        raise
+
+# 默认数据库的共享分析器（首次调用 get_analytics 时创建，导入本模块不会打开数据库）
+_default_analytics = None
+_default_analytics_lock = threading.Lock()
+
 
-# 全局分析器实例
-analytics = SQLiteAnalytics()
+def get_analytics() -> SQLiteAnalytics:
+    """默认数据库（data/learning_analytics.db）的共享读写分析器，供桌面端采集使用"""
+    global _default_analytics
+    with _default_analytics_lock:
+        if _default_analytics is None:
+            _default_analytics = SQLiteAnalytics()
+        return _default_analytics
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+云端请求的熔断器
+
+连续失败达到阈值后断开（open），此后的请求直接跳过，不再占用线程与套接字等待超时；
+每隔 reset_timeout 秒放行一个探测请求（half_open），成功则恢复（closed），失败则继续断开。
+"""
+
+import time
+import threading
+
+# 连续失败多少次后断开
+FAILURE_THRESHOLD = 5
+
+# 断开后多久（秒）放行一次探测请求
+RESET_TIMEOUT_SECONDS = 30.0
+
+
+class CircuitOpenError(Exception):
+    """熔断器断开，请求未发送"""
+
+
+class CircuitBreaker:
+    """三态熔断器：closed / open / half_open"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT_SECONDS):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后断开
+            reset_timeout: 断开后的探测间隔（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        """是否允许发送请求（断开期间每个探测周期只放行一个请求）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self) -> bool:
+        """
+        请求成功
+
+        Returns:
+            是否从断开状态恢复
+        """
+        with self._lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            return recovered
+
+    def record_failure(self) -> bool:
+        """
+        请求失败（网络错误、超时、5xx）
+
+        Returns:
+            是否因此次失败而断开
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                tripped = self.state == self.CLOSED
+                self.state = self.OPEN
+                self.opened_at = time.time()
+                return tripped
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+            }
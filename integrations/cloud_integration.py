@@ -2,17 +2,33 @@
 云端行为日志上报客户端。
 
 将本地采集的学习行为通过 REST API 上传到后端。
+事件先进入内存缓冲，按批次以 gzip 压缩的 NDJSON 发送到 /api/events:batch；
+网络不可用时批次保存在本地发件箱（data/cloud_outbox.db），恢复后自动重发。
+所有请求共用一个保持连接的 requests.Session，并发数有上限；
+连续失败后熔断器断开，期间请求直接跳过，定期放行一个探测请求。
+
+云端会话 ID 由客户端生成（UUID），会话开始/结束作为普通事件随批次上传，
+不需要等待服务端返回，启动阶段与离线期间的事件不会因没有会话 ID 而丢失。
 """
 
 from __future__ import annotations
 
+import uuid
 import threading
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from config.backend_config import BACKEND_URL, ENABLE_CLOUD_ANALYTICS, REQUEST_TIMEOUT
+from config.backend_config import (BACKEND_URL, CLOUD_BATCH_SIZE, CLOUD_FLUSH_INTERVAL,
+                                   CLOUD_MAX_CONNECTIONS, CLOUD_OUTBOX_PATH,
+                                   ENABLE_CLOUD_ANALYTICS, REQUEST_TIMEOUT)
+from core.event_records import (AIInteractionEvent, BehaviorEvent, CodeOperationEvent,
+                                ErrorEvent, EventRecord, SessionEndEvent, SessionStartEvent)
 from core.user_identity import get_user_identity
+from integrations.circuit_breaker import CircuitBreaker, CircuitOpenError
+from integrations.cloud_outbox import CloudOutbox
+from integrations.cloud_uploader import BatchUploader
 
 
 class CloudAnalyticsClient:
@@ -24,37 +40,67 @@ class CloudAnalyticsClient:
         self.session_id: Optional[str] = None
         self.user_identity = get_user_identity()
         self.lock = threading.Lock()
+        self.uploader: Optional[BatchUploader] = None
+
+        # 连接池：复用 TCP/TLS 连接，最多 CLOUD_MAX_CONNECTIONS 个请求同时进行
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CLOUD_MAX_CONNECTIONS)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(CLOUD_MAX_CONNECTIONS)
+        self.breaker = CircuitBreaker()
+        self._connection_error_shown = False
+
+        if self.enabled:
+            outbox = None
+            if CLOUD_OUTBOX_PATH:
+                try:
+                    outbox = CloudOutbox(CLOUD_OUTBOX_PATH)
+                except Exception as exc:
+                    print(f"⚠️ 云端发件箱初始化失败，离线期间的事件将不会保存: {exc}")
+            self.uploader = BatchUploader(
+                self._post_batch, batch_size=CLOUD_BATCH_SIZE,
+                flush_interval=CLOUD_FLUSH_INTERVAL, outbox=outbox
+            )
 
     # ---- 会话管理 ---------------------------------------------------------
     def start_session(self, alias: Optional[str] = None) -> None:
+        """在本地生成会话 ID，会话开始记录排在该会话所有事件之前上传"""
         if not self.enabled or self.session_id:
             return
 
-        payload = {
-            "user_id": self.user_identity.get("user_id"),
-            "device_label": self.user_identity.get("device_label"),
-        }
-        if alias:
-            payload["alias"] = alias
-        self._post_async("/api/sessions", payload, save_session=True)
+        user_id = self.user_identity.get("user_id")
+        device_label = self.user_identity.get("device_label") or user_id
+        with self.lock:
+            self.session_id = str(uuid.uuid4())
+            self.uploader.add(self.session_id, SessionStartEvent(
+                self.session_id, user_id=alias or user_id, device_label=device_label
+            ))
 
     def end_session(self) -> None:
-        # 目前后端不要求显式结束会话，这里只清理本地状态
-        if self.session_id:
-            self.session_id = None
+        """上传会话结束记录，缓冲中的事件尽快上传"""
+        with self.lock:
+            session_id, self.session_id = self.session_id, None
+        if session_id and self.uploader:
+            self.uploader.add(session_id, SessionEndEvent(session_id))
+            self.uploader.request_flush()
+
+    def close(self, timeout: float = 3.0) -> None:
+        """应用退出时在限定时间内上传缓冲中的事件"""
+        if self.uploader:
+            self.uploader.close(timeout)
+        self.http.close()
 
     # ---- 行为上报 ---------------------------------------------------------
-    def log_behavior(self, behavior_code: str, duration: float = None, additional_data: Dict[str, Any] = None) -> None:
+    def send(self, record: EventRecord) -> None:
+        """上报一条事件记录（只放入缓冲，由上传线程批量发送）"""
         if not self._ready():
             return
+        self.uploader.add(self.session_id, record)
 
-        payload = {
-            "behavior_code": behavior_code,
-            "duration": duration,
-            "additional_data": additional_data or {},
-        }
-        endpoint = f"/api/sessions/{self.session_id}/behaviors"
-        self._post_async(endpoint, payload)
+    def log_behavior(self, behavior_code: str, duration: float = None, additional_data: Dict[str, Any] = None) -> None:
+        self.send(BehaviorEvent(self.session_id, behavior_code, duration=duration,
+                                additional_data=additional_data))
 
     def log_code_operation(
         self,
@@ -64,18 +110,8 @@ class CloudAnalyticsClient:
         error_message: str = None,
         execution_time: float = None,
     ) -> None:
-        if not self._ready():
-            return
-
-        payload = {
-            "operation_type": operation_type,
-            "code": code,
-            "success": success,
-            "execution_time": execution_time,
-            "additional_data": {"error_message": error_message} if error_message else {},
-        }
-        endpoint = f"/api/sessions/{self.session_id}/code-operations"
-        self._post_async(endpoint, payload)
+        self.send(CodeOperationEvent(self.session_id, operation_type, code=code, success=success,
+                                     error_message=error_message, execution_time=execution_time))
 
     def log_ai_interaction(
         self,
@@ -85,18 +121,9 @@ class CloudAnalyticsClient:
         response_time: float = None,
         additional_data: Dict[str, Any] = None,
     ) -> None:
-        if not self._ready():
-            return
-
-        payload = {
-            "interaction_type": interaction_type,
-            "question": question,
-            "response": response,
-            "response_time": response_time,
-            "additional_data": additional_data or {},
-        }
-        endpoint = f"/api/sessions/{self.session_id}/ai-interactions"
-        self._post_async(endpoint, payload)
+        self.send(AIInteractionEvent(self.session_id, interaction_type, question=question,
+                                     response=response, response_time=response_time,
+                                     additional_data=additional_data))
 
     def log_error_analysis(
         self,
@@ -107,61 +134,60 @@ class CloudAnalyticsClient:
         fix_success: bool = False,
         additional_data: Dict[str, Any] = None,
     ) -> None:
-        if not self._ready():
-            return
-
-        payload = {
-            "error_type": error_type,
-            "error_line": error_line,
-            "error_message": error_message,
-            "fix_attempts": fix_attempts,
-            "fix_success": fix_success,
-            "additional_data": additional_data or {},
-        }
-        endpoint = f"/api/sessions/{self.session_id}/errors"
-        self._post_async(endpoint, payload)
+        self.send(ErrorEvent(self.session_id, error_type, error_line=error_line,
+                             error_message=error_message, fix_attempts=fix_attempts,
+                             fix_success=fix_success, additional_data=additional_data))
+
+    def get_upload_stats(self) -> Dict[str, Any]:
+        """批量上传的计数器（请求数、发送字节数、失败与丢弃的事件数、熔断器状态）"""
+        if not self.uploader:
+            return {}
+        stats = self.uploader.stats()
+        stats["circuit"] = self.breaker.stats()
+        return stats
 
     # ---- 工具方法 ---------------------------------------------------------
     def _ready(self) -> bool:
         return self.enabled and bool(self.session_id)
 
-    def _post_async(self, endpoint: str, payload: Dict[str, Any], save_session: bool = False) -> None:
-        if not self.enabled:
-            return
+    def _post(self, endpoint: str, **kwargs: Any) -> requests.Response:
+        """
+        经连接池发送 POST 请求，并更新熔断器状态
 
-        def worker() -> None:
+        网络错误、超时与 5xx 计为失败；熔断器断开时抛出 CircuitOpenError，不发送请求。
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"云端暂不可用，跳过请求 {endpoint}")
+        with self._slots:
             try:
-                url = f"{self.base_url}{endpoint}"
-                response = requests.post(url, json=payload, timeout=REQUEST_TIMEOUT)
-                response.raise_for_status()
-                if save_session:
-                    data = response.json()
-                    session_id = data.get("session_id")
-                    if session_id:
-                        with self.lock:
-                            self.session_id = session_id
-                            print(f"🌐 已连接云端会话: {session_id}")
+                response = self.http.post(f"{self.base_url}{endpoint}", timeout=REQUEST_TIMEOUT, **kwargs)
             except requests.exceptions.ConnectionError as exc:
-                # 连接错误（服务器未运行、端口被阻止、防火墙等）
-                error_msg = str(exc)
-                if "10061" in error_msg or "actively refused" in error_msg.lower():
-                    # 只在第一次连接失败时显示详细提示
-                    if not hasattr(self, '_connection_error_shown'):
-                        self._connection_error_shown = True
-                        print(f"⚠️ 云端连接失败: 无法连接到服务器 {self.base_url}")
-                        print(f"   可能原因: 1) 服务器未运行  2) 网络被阻止(校园网/移动热点)  3) 防火墙阻止")
-                        print(f"   💡 本地数据采集不受影响，数据将保存在本地数据库")
-                else:
-                    print(f"⚠️ 云端上报失败（{endpoint}）: {exc}")
-            except requests.exceptions.Timeout as exc:
-                print(f"⚠️ 云端上报超时（{endpoint}）: 请求超过 {REQUEST_TIMEOUT} 秒")
-            except requests.exceptions.SSLError as exc:
-                print(f"⚠️ 云端SSL错误（{endpoint}）: {exc}")
-                print(f"   💡 可能是SSL证书问题，请检查服务器配置")
-            except requests.RequestException as exc:
-                print(f"⚠️ 云端上报失败（{endpoint}）: {exc}")
-
-        threading.Thread(target=worker, daemon=True).start()
+                self._record_failure()
+                # 只在第一次连接失败时显示详细提示
+                if not self._connection_error_shown:
+                    self._connection_error_shown = True
+                    print(f"⚠️ 云端连接失败: 无法连接到服务器 {self.base_url}")
+                    print(f"   可能原因: 1) 服务器未运行  2) 网络被阻止(校园网/移动热点)  3) 防火墙阻止")
+                    print(f"   💡 本地数据采集不受影响，上报数据保存在发件箱，网络恢复后自动上传")
+                raise
+            except requests.RequestException:
+                self._record_failure()
+                raise
+        if response.status_code >= 500:
+            self._record_failure()
+        elif self.breaker.record_success():
+            print("🌐 云端连接已恢复")
+        response.raise_for_status()
+        return response
+
+    def _record_failure(self) -> None:
+        if self.breaker.record_failure():
+            print(f"⚠️ 云端连续 {self.breaker.failure_threshold} 次请求失败，暂停上报，"
+                  f"每 {self.breaker.reset_timeout:.0f} 秒探测一次")
+
+    def _post_batch(self, body: bytes, headers: Dict[str, str]) -> None:
+        """发送一批事件（上传线程调用，失败时抛出异常由上传器重试）"""
+        self._post("/api/events:batch", data=body, headers=headers)
 
 
 # 供外部引用的便捷函数
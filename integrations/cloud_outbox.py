@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+云端上报的本地发件箱
+
+网络不可用（校园网、移动热点）时，编码好的批次保存在本地 SQLite 文件中，
+网络恢复后按原顺序重发。每行保存一批事件的 gzip 请求体与幂等键，
+重发内容与首次发送完全相同，服务端按幂等键去重。
+"""
+
+import os
+import time
+import threading
+from typing import List, Tuple
+
+try:
+    from core.db_connection import connect, enable_wal
+except ImportError:
+    from db_connection import connect, enable_wal  # type: ignore
+
+# 超过该时长（秒）仍未发出的批次不再重发
+OUTBOX_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+class CloudOutbox:
+    """保存待上传批次的 SQLite 队列（先进先出）"""
+
+    def __init__(self, db_path: str, max_age: float = OUTBOX_MAX_AGE_SECONDS):
+        """
+        Args:
+            db_path: 发件箱数据库文件路径
+            max_age: 批次的最长保留时间（秒）
+        """
+        self.db_path = db_path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        enable_wal(db_path)
+        self.conn = connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL,
+                body BLOB NOT NULL,
+                event_count INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_created ON outbox(created_at)')
+
+    def put(self, key: str, body: bytes, event_count: int) -> int:
+        """保存一批待上传的事件，返回行 ID"""
+        with self.lock:
+            cursor = self.conn.execute(
+                'INSERT INTO outbox (idempotency_key, body, event_count, created_at) VALUES (?, ?, ?, ?)',
+                (key, body, event_count, time.time())
+            )
+            return cursor.lastrowid
+
+    def peek(self, limit: int) -> List[Tuple[int, str, bytes, int]]:
+        """按保存顺序取出最早的若干批（不删除）：(行 ID, 幂等键, 请求体, 事件数)"""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT id, idempotency_key, body, event_count FROM outbox ORDER BY id LIMIT ?',
+                (limit,)
+            ).fetchall()
+
+    def remove(self, row_id: int):
+        """删除已上传（或被服务端拒绝）的批次"""
+        with self.lock:
+            self.conn.execute('DELETE FROM outbox WHERE id = ?', (row_id,))
+
+    def purge_expired(self) -> int:
+        """删除超过最长保留时间的批次，返回其中的事件数"""
+        cutoff = time.time() - self.max_age
+        with self.lock:
+            expired = self.conn.execute(
+                'SELECT TOTAL(event_count) FROM outbox WHERE created_at < ?', (cutoff,)
+            ).fetchone()[0]
+            if expired:
+                self.conn.execute('DELETE FROM outbox WHERE created_at < ?', (cutoff,))
+            return int(expired)
+
+    def counts(self) -> Tuple[int, int]:
+        """待上传的 (批次数, 事件数)"""
+        with self.lock:
+            batches, events = self.conn.execute(
+                'SELECT COUNT(*), TOTAL(event_count) FROM outbox'
+            ).fetchone()
+            return batches, int(events)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
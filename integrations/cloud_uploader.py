@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+云端事件批量上传
+
+上报事件只放入内存缓冲（O(1)），由单个后台线程在缓冲达到 batch_size 条或
+距上次上传超过 flush_interval 秒时，将事件编码为 gzip 压缩的 NDJSON 一次发送。
+每批生成一个幂等键（Idempotency-Key），重试同一批次时使用同一个键，服务端据此去重。
+
+配置了发件箱（CloudOutbox）时，每批先保存到本地再发送，发送成功后删除；
+网络不可用时按指数退避（带随机抖动）重试，网络恢复后分批重发积压的批次。
+
+NDJSON 每行一个事件：EventRecord.to_payload() 的字段，加上 type 与云端 session_id。
+"""
+
+import gzip
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+try:
+    from core.event_records import EventRecord
+except ImportError:
+    from event_records import EventRecord  # type: ignore
+
+# 每批最多事件数
+UPLOAD_BATCH_SIZE = 200
+
+# 缓冲中最早的事件最多等待多久（秒）后上传
+UPLOAD_FLUSH_INTERVAL = 10.0
+
+# 内存缓冲上限，超过后丢弃最旧的事件
+UPLOAD_MAX_BUFFER = 5000
+
+# 上传失败时的重试间隔（秒），重试沿用同一个幂等键（未配置发件箱时使用）
+UPLOAD_RETRY_DELAYS = (1.0, 2.0, 4.0)
+
+# 发件箱重发的退避：第 n 次连续失败后等待 base * 2^(n-1) 秒（不超过 max），
+# 实际等待时间在其一半到全部之间随机取值，避免所有客户端同时重连
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 300.0
+
+# 每轮最多重发的批次数，两轮之间的间隔（秒），避免积压时占满网络与 CPU
+OUTBOX_REPLAY_BATCHES = 10
+OUTBOX_REPLAY_PAUSE = 1.0
+
+
+def encode_batch(items: List[Tuple[str, EventRecord]]) -> bytes:
+    """将 (云端会话 ID, 事件记录) 列表编码为 gzip 压缩的 NDJSON"""
+    lines = []
+    for session_id, record in items:
+        payload = record.to_payload()
+        payload['type'] = record.type
+        payload['session_id'] = session_id
+        lines.append(json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str))
+    return gzip.compress('\n'.join(lines).encode('utf-8'), compresslevel=6)
+
+
+class BatchUploader:
+    """内存缓冲 + 单个上传线程"""
+
+    def __init__(self, post: Callable[[bytes, Dict[str, str]], object],
+                 batch_size: int = UPLOAD_BATCH_SIZE,
+                 flush_interval: float = UPLOAD_FLUSH_INTERVAL,
+                 max_buffer: int = UPLOAD_MAX_BUFFER, outbox=None,
+                 name: str = 'cloud-uploader'):
+        """
+        Args:
+            post: 发送一批数据的函数，签名为 post(body, headers)，失败时抛出异常
+            batch_size: 每批最多事件数
+            flush_interval: 最早的事件最多等待的秒数
+            max_buffer: 内存缓冲上限
+            outbox: 可选的 CloudOutbox，发送前先保存到本地，失败后退避重发
+            name: 上传线程名
+        """
+        self.post = post
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.outbox = outbox
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._oldest = None
+        self._in_flight = 0
+        # 发件箱中是否有待发批次、下次允许发送的时间、连续失败次数
+        self._backlog = outbox is not None and outbox.counts()[0] > 0
+        self._retry_at = 0.0
+        self._failures = 0
+
+        # 计数器
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.expired = 0
+        self.requests = 0
+        self.bytes_sent = 0
+
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, session_id: str, record: EventRecord) -> bool:
+        """事件放入缓冲（界面线程调用，不做网络请求）"""
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            if len(self._items) >= self.max_buffer:
+                self._items.popleft()
+                self.dropped += 1
+            if not self._items:
+                self._oldest = time.time()
+            self._items.append((session_id, record))
+            self.queued += 1
+            if len(self._items) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def request_flush(self):
+        """不等待，尽快上传缓冲中的事件（如会话结束时）"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        上传缓冲中的全部事件并等待完成
+
+        Returns:
+            是否在超时前上传完
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            while self._items or self._in_flight:
+                if not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """
+        停止接收新事件，在限定时间内上传剩余事件
+
+        有发件箱时，剩余事件先按 batch_size 分批全部写入发件箱（不做网络请求），
+        上传线程不再重发积压，下次启动后重发。
+        """
+        with self._cond:
+            self._closed = True
+            leftovers = []
+            if self.outbox is not None:
+                leftovers = list(self._items)
+                self._items.clear()
+                self._oldest = None
+            self._cond.notify_all()
+        for start in range(0, len(leftovers), self.batch_size):
+            batch = leftovers[start:start + self.batch_size]
+            if not self._submit(batch):
+                with self._cond:
+                    self.failed += len(batch)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        if self.outbox is not None:
+            self.outbox.close()
+        return True
+
+    def _worker(self):
+        """上传线程：凑满一批或等待超时后发送，网络恢复后重发发件箱中的积压"""
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+            if batch is None:
+                return
+
+            if batch:
+                ok = self._submit(batch)
+                with self._cond:
+                    if not ok:
+                        self.failed += len(batch)
+            if self.outbox is not None and not self._closed:
+                try:
+                    self._drain()
+                except Exception as e:
+                    print(f"⚠️ 读取发件箱失败: {e}")
+                    self._retry_at = time.time() + OUTBOX_BACKOFF_MAX
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _next_batch(self):
+        """
+        等待下一批事件（调用方持有锁）
+
+        Returns:
+            事件列表；空列表表示只需重发发件箱；None 表示已关闭且缓冲为空
+        """
+        while True:
+            now = time.time()
+            if self._items and (self._closed or self._flush_requested
+                                or len(self._items) >= self.batch_size
+                                or now >= self._oldest + self.flush_interval):
+                count = min(self.batch_size, len(self._items))
+                batch = [self._items.popleft() for _ in range(count)]
+                self._oldest = time.time() if self._items else None
+                self._in_flight = count
+                return batch
+            if not self._items:
+                self._flush_requested = False
+                if self._closed:
+                    return None
+            if self._backlog and now >= self._retry_at and not self._closed:
+                self._in_flight = 1
+                return []
+            deadlines = []
+            if self._items:
+                deadlines.append(self._oldest + self.flush_interval)
+            if self._backlog:
+                deadlines.append(self._retry_at)
+            self._cond.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+
+    def _submit(self, batch: List[Tuple[str, EventRecord]]) -> bool:
+        """编码一批事件：有发件箱时保存到发件箱，否则直接发送"""
+        try:
+            body = encode_batch(batch)
+        except Exception as e:
+            print(f"⚠️ 编码上报数据失败: {e}")
+            return False
+        key = uuid.uuid4().hex
+        if self.outbox is None:
+            return self._send(body, key, len(batch))
+        try:
+            self.outbox.put(key, body, len(batch))
+        except Exception as e:
+            print(f"⚠️ 保存上报数据到发件箱失败: {e}")
+            return self._send(body, key, len(batch))
+        self._backlog = True
+        return True
+
+    def _send(self, body: bytes, key: str, count: int) -> bool:
+        """直接发送一批事件，失败时按 UPLOAD_RETRY_DELAYS 重试（同一个幂等键）"""
+        for delay in UPLOAD_RETRY_DELAYS + (None,):
+            try:
+                self._post(body, key, count)
+                return True
+            except Exception as e:
+                if delay is None or self._closed or _is_rejected(e):
+                    print(f"⚠️ 云端批量上报失败，丢弃 {count} 条事件: {e}")
+                    return False
+                time.sleep(delay)
+        return False
+
+    def _drain(self):
+        """按保存顺序重发发件箱中的批次（每轮最多 OUTBOX_REPLAY_BATCHES 批）"""
+        if not self._backlog or time.time() < self._retry_at:
+            return
+        expired = self.outbox.purge_expired()
+        if expired:
+            with self._cond:
+                self.expired += expired
+            print(f"⚠️ {expired} 条事件超过保留期仍未上传，已从发件箱删除")
+        rows = self.outbox.peek(OUTBOX_REPLAY_BATCHES)
+
+        for row_id, key, body, count in rows:
+            if self._closed:
+                # 关闭后不再发起新的请求，剩余批次下次启动后重发
+                return
+            try:
+                self._post(body, key, count)
+            except Exception as e:
+                if not _is_rejected(e):
+                    self._back_off(e)
+                    return
+                # 服务端拒绝的批次重发也不会成功，删除以免阻塞后续批次
+                print(f"⚠️ 云端拒绝了 {count} 条事件，已丢弃: {e}")
+                with self._cond:
+                    self.failed += count
+            self.outbox.remove(row_id)
+            self._failures = 0
+
+        if len(rows) < OUTBOX_REPLAY_BATCHES:
+            self._backlog = self.outbox.counts()[0] > 0
+        else:
+            # 积压较多时分轮重发，两轮之间让出网络
+            self._retry_at = time.time() + OUTBOX_REPLAY_PAUSE
+
+    def _back_off(self, error: Exception):
+        """发送失败：按指数退避并加随机抖动推迟下一次重发（服务端给出 Retry-After 时至少等待该时长）"""
+        self._failures += 1
+        delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (self._failures - 1))
+        wait = max(random.uniform(delay / 2, delay), min(OUTBOX_BACKOFF_MAX, _retry_after(error)))
+        self._retry_at = time.time() + wait
+        if self._failures == 1:
+            print(f"⚠️ 云端暂时无法连接，事件已保存在本地，网络恢复后自动上传: {error}")
+
+    def _post(self, body: bytes, key: str, count: int):
+        """发送一个请求体，成功时更新计数器"""
+        headers = {
+            'Content-Type': 'application/x-ndjson',
+            'Content-Encoding': 'gzip',
+            'Idempotency-Key': key,
+        }
+        with self._cond:
+            self.requests += 1
+        self.post(body, headers)
+        with self._cond:
+            self.sent += count
+            self.bytes_sent += len(body)
+
+    def stats(self) -> Dict:
+        """上传计数器快照"""
+        with self._cond:
+            return {
+                'buffered': len(self._items),
+                'queued': self.queued,
+                'dropped': self.dropped,
+                'sent': self.sent,
+                'failed': self.failed,
+                'expired': self.expired,
+                'requests': self.requests,
+                'bytes_sent': self.bytes_sent,
+                'outbox': self.outbox.counts() if self.outbox is not None else None,
+                'retry_in': max(0.0, self._retry_at - time.time()) if self._backlog else 0.0,
+            }
+
+
+def _retry_after(error: Exception) -> float:
+    """服务端响应中的 Retry-After 秒数（如写入队列已满时的 503），没有时为 0"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After', 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _is_rejected(error: Exception) -> bool:
+    """服务端以 4xx 拒绝了请求（408 / 429 除外），重发不会成功"""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
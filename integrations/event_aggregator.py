@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高频界面事件的源端聚合
+
+鼠标悬停（VC）、键入（CP）、选中（SC）在界面线程上只累加计数，
+由定时器在窗口结束时输出一条汇总事件，再进入正常的写入/上报流程：
+
+- VC：每分钟一条，包含各行的停留时长直方图
+- CP：每段连续键入（停顿超过 TYPING_BURST_GAP 秒即结束）一条，包含按键数与编辑行范围
+- SC：每次选中操作（拖动过程中的多次变化合并）一条，包含最终的选中范围
+"""
+
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+# 悬停统计窗口（秒），窗口与整分钟对齐
+HOVER_WINDOW_SECONDS = 60
+
+# 计入统计的最短停留时间（秒）
+MIN_DWELL_SECONDS = 1.0
+
+# 键入停顿超过该时长（秒）视为一段键入结束
+TYPING_BURST_GAP = 2.0
+
+# 单段键入的最长时长（秒），超过后强制输出
+TYPING_MAX_BURST = 60.0
+
+# 选中范围保持不变超过该时长（秒）视为一次选中结束
+SELECTION_SETTLE_SECONDS = 1.0
+
+
+class EventAggregator:
+    """将 VC / CP / SC 事件流折叠为汇总事件"""
+
+    def __init__(self, emit: Callable[..., None]):
+        """
+        Args:
+            emit: 输出汇总事件的函数，签名为
+                emit(behavior_code, duration=..., additional_data=..., timestamp=...)
+        """
+        self.emit = emit
+        self._lock = threading.Lock()
+
+        # 悬停：当前所在行及进入时间；当前窗口的各行停留时长与次数
+        self._hover_line: Optional[int] = None
+        self._hover_since: Optional[float] = None
+        self._hover_window: Optional[float] = None
+        self._hover_dwell: Dict[int, float] = {}
+        self._hover_visits: Dict[int, int] = {}
+
+        # 键入：当前这一段的统计
+        self._typing: Optional[Dict] = None
+
+        # 选中：当前这一次的统计
+        self._selection: Optional[Dict] = None
+
+    # ---- 界面线程调用（只累加，不写库） ---------------------------------------
+    def record_hover(self, line_number: int, now: float = None):
+        """鼠标移动到某一行"""
+        now = now or time.time()
+        pending = []
+        with self._lock:
+            if line_number == self._hover_line:
+                return
+            if self._hover_line is not None and self._hover_since is not None:
+                pending = self._add_dwell(self._hover_line, self._hover_since, now)
+            self._hover_line = line_number
+            self._hover_since = now
+        self._emit_all(pending)
+
+    def record_typing(self, cursor_line: int, cursor_column: int, code_length: int = None,
+                      line_count: int = None, now: float = None):
+        """一次键入（code_length / line_count 可只偶尔提供）"""
+        now = now or time.time()
+        pending = []
+        with self._lock:
+            burst = self._typing
+            if burst and (now - burst['last'] > TYPING_BURST_GAP
+                          or now - burst['first'] > TYPING_MAX_BURST):
+                pending.append(self._close_typing())
+                burst = None
+            if burst is None:
+                burst = self._typing = {
+                    'first': now, 'keystrokes': 0,
+                    'start_line': cursor_line, 'end_line': cursor_line,
+                    'start_length': code_length,
+                }
+            burst['last'] = now
+            burst['keystrokes'] += 1
+            burst['start_line'] = min(burst['start_line'], cursor_line)
+            burst['end_line'] = max(burst['end_line'], cursor_line)
+            burst['cursor_line'] = cursor_line
+            burst['cursor_column'] = cursor_column
+            if code_length is not None:
+                burst['code_length'] = code_length
+                if burst['start_length'] is None:
+                    burst['start_length'] = code_length
+            if line_count is not None:
+                burst['line_count'] = line_count
+        self._emit_all(pending)
+
+    def record_selection(self, start_line: int = None, end_line: int = None,
+                         content_length: int = 0, source: str = 'editor', now: float = None):
+        """选中范围变化（start_line 为 None 表示取消选中）"""
+        now = now or time.time()
+        pending = []
+        with self._lock:
+            current = self._selection
+            if start_line is None or not content_length:
+                if current:
+                    pending.append(self._close_selection())
+            else:
+                if current and current['source'] != source:
+                    pending.append(self._close_selection())
+                    current = None
+                if current is None:
+                    current = self._selection = {'first': now, 'updates': 0, 'source': source}
+                current.update(last=now, start_line=start_line, end_line=end_line,
+                               content_length=content_length)
+                current['updates'] += 1
+        self._emit_all(pending)
+
+    # ---- 定时器 / 会话结束时调用 ------------------------------------------------
+    def tick(self, now: float = None):
+        """输出已经结束的窗口、键入段与选中"""
+        now = now or time.time()
+        pending = []
+        with self._lock:
+            if self._hover_window is not None and now >= self._hover_window + HOVER_WINDOW_SECONDS:
+                # 跨窗口仍停在同一行时，先把本窗口内的停留时间计入
+                if self._hover_line is not None and self._hover_since is not None:
+                    pending.extend(self._add_dwell(self._hover_line, self._hover_since, now))
+                    self._hover_since = now
+                if self._hover_window is not None and now >= self._hover_window + HOVER_WINDOW_SECONDS:
+                    pending.append(self._close_hover_window())
+            if self._typing and now - self._typing['last'] > TYPING_BURST_GAP:
+                pending.append(self._close_typing())
+            if self._selection and now - self._selection['last'] > SELECTION_SETTLE_SECONDS:
+                pending.append(self._close_selection())
+        self._emit_all(pending)
+
+    def flush(self, now: float = None):
+        """立即输出所有未结束的统计（会话结束时调用）"""
+        now = now or time.time()
+        pending = []
+        with self._lock:
+            if self._hover_line is not None and self._hover_since is not None:
+                pending.extend(self._add_dwell(self._hover_line, self._hover_since, now))
+            self._hover_line = self._hover_since = None
+            if self._hover_window is not None:
+                pending.append(self._close_hover_window())
+            if self._typing:
+                pending.append(self._close_typing())
+            if self._selection:
+                pending.append(self._close_selection())
+        self._emit_all(pending)
+
+    # ---- 内部方法（调用方持有锁） ------------------------------------------------
+    def _add_dwell(self, line: int, since: float, until: float):
+        """累加一次停留，跨越窗口时返回需要输出的上一个窗口"""
+        pending = []
+        duration = until - since
+        if duration < MIN_DWELL_SECONDS:
+            return pending
+        window = since - since % HOVER_WINDOW_SECONDS
+        if self._hover_window is not None and window != self._hover_window:
+            pending.append(self._close_hover_window())
+        self._hover_window = window
+        self._hover_dwell[line] = self._hover_dwell.get(line, 0.0) + duration
+        self._hover_visits[line] = self._hover_visits.get(line, 0) + 1
+        return pending
+
+    def _close_hover_window(self):
+        dwell, visits, window = self._hover_dwell, self._hover_visits, self._hover_window
+        self._hover_dwell, self._hover_visits, self._hover_window = {}, {}, None
+        if not dwell:
+            return None
+        lines = sorted(dwell)
+        return ('VC', sum(dwell.values()), {
+            'aggregated': 'hover_window',
+            'window_seconds': HOVER_WINDOW_SECONDS,
+            'line_number': max(dwell, key=dwell.get),
+            'start_line': lines[0],
+            'end_line': lines[-1],
+            'visit_count': sum(visits.values()),
+            'line_dwell': {str(line): round(dwell[line], 2) for line in lines},
+            'line_visits': {str(line): visits[line] for line in lines},
+        }, window)
+
+    def _close_typing(self):
+        burst, self._typing = self._typing, None
+        data = {
+            'aggregated': 'typing_burst',
+            'edit_type': 'typing',
+            'keystrokes': burst['keystrokes'],
+            'start_line': burst['start_line'],
+            'end_line': burst['end_line'],
+            'cursor_line': burst['cursor_line'],
+            'cursor_column': burst['cursor_column'],
+        }
+        if 'code_length' in burst:
+            data['code_length'] = burst['code_length']
+            data['length_change'] = burst['code_length'] - burst['start_length']
+        if 'line_count' in burst:
+            data['line_count'] = burst['line_count']
+        return ('CP', burst['last'] - burst['first'], data, burst['first'])
+
+    def _close_selection(self):
+        selection, self._selection = self._selection, None
+        return ('SC', selection['last'] - selection['first'], {
+            'aggregated': 'selection',
+            'source': selection['source'],
+            'start_line': selection['start_line'],
+            'end_line': selection['end_line'],
+            'content_length': selection['content_length'],
+            'line_count': selection['end_line'] - selection['start_line'] + 1,
+            'updates': selection['updates'],
+        }, selection['first'])
+
+    def _emit_all(self, pending):
+        """在锁外输出汇总事件"""
+        for item in pending:
+            if item is None:
+                continue
+            behavior_code, duration, data, started = item
+            if 'window_seconds' in data:
+                data['window_start'] = datetime.fromtimestamp(started).isoformat()
+            try:
+                self.emit(behavior_code, duration=duration, additional_data=data, timestamp=started)
+            except Exception as e:
+                print(f"⚠️ 输出汇总行为失败: {e}")
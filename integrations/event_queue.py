@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有界事件队列
+
+界面线程只做一次 O(1) 入队，单个后台线程批量取出事件并写入存储，
+避免每个事件创建一个线程、所有线程争抢数据库锁。
+
+配置了 spool 时，每批事件先追加到磁盘缓冲并 fsync，写入成功后再确认；
+启动时先重放上次未确认的事件，关闭时超时未写完的事件转存到缓冲中。
+只有消费者已取出的批次在写入前落盘：仍在内存队列中的事件在进程崩溃时会丢失
+（正常关闭时会转存），界面线程入队不做磁盘 I/O。同样，源端聚合器中尚未结束的
+窗口（悬停统计最长 60 秒）只在内存中，崩溃时丢失。
+
+队列满时携带代码快照的代码操作事件不会被丢弃（也不会被挤出）：后续版本只保存差异，
+丢失一个快照会使同一文件之后的版本都无法还原。
+
+写入时遇到写锁冲突（默认由 is_busy_error 判断）的批次留在队首原地重试
+（后续批次等待，确认位置按顺序推进）；重试 SINK_RETRY_DELAYS 次仍失败，
+或遇到重试无效的错误（缺表、磁盘 I/O 错误、数据无法写入等）时，
+该批事件转入缓冲的隔离目录后照常确认，避免一个无法写入的批次让缓冲一直无法推进。
+重放时的批次同样处理。
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, List
+
+try:
+    from core.db_connection import is_busy_error
+except ImportError:
+    from db_connection import is_busy_error  # type: ignore
+
+# 队列满时的处理策略
+#   block:       界面线程最多等待 block_timeout 秒，仍然满则丢弃新事件
+#   drop_oldest: 丢弃最旧的事件，保留新事件
+#   sample:      每 sample_every 个新事件保留 1 个（替换最旧的事件），其余丢弃
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'sample')
+
+# 写锁冲突时的重试间隔（秒），全部用完后该批事件转入隔离目录（未配置 spool 时丢弃）
+SINK_RETRY_DELAYS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+def _must_keep(event) -> bool:
+    """队列满时也不能丢弃的事件：携带代码快照（差异链的一环）"""
+    return bool(event.get('snapshot'))
+
+
+class _Interrupted(Exception):
+    """关闭时放弃重试：该批事件不确认，留在磁盘缓冲中下次启动时重放"""
+
+
+class EventQueue:
+    """有界事件队列 + 单消费者线程"""
+
+    def __init__(self, sink: Callable[[List[Dict]], object], max_size: int = 10000,
+                 batch_size: int = 200, overflow: str = 'drop_oldest',
+                 block_timeout: float = 0.05, sample_every: int = 10,
+                 spool=None, retryable: Callable[[Exception], bool] = is_busy_error,
+                 name: str = 'analytics-writer'):
+        """
+        初始化事件队列
+
+        Args:
+            sink: 批量写入函数，接收事件列表（如 SQLiteAnalytics.log_events）
+            max_size: 队列容量
+            batch_size: 每次写入的最大事件数
+            overflow: 队列满时的策略，见 OVERFLOW_POLICIES
+            block_timeout: block 策略下界面线程的最长等待时间（秒）
+            sample_every: sample 策略下的保留间隔
+            spool: 可选的 EventSpool，写入前先持久化到磁盘
+            retryable: 判断写入异常是否值得原地重试，默认只重试写锁冲突
+            name: 消费者线程名
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.sink = sink
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.sample_every = max(1, sample_every)
+        self.spool = spool
+        self.retryable = retryable
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = 0
+        self._overflow_count = 0
+        self._interrupted = False
+
+        # 计数器
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.quarantined = 0
+        self.batches = 0
+        self.replayed = 0
+        self.spooled_on_close = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, event: Dict) -> bool:
+        """
+        事件入队（只在内存中排队，批次被取出写入时才落盘）
+
+        携带代码快照的事件在队列满时仍然接收（可暂时超出容量）。
+
+        Returns:
+            事件是否被接收（因队列满被丢弃时返回 False）
+        """
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            if len(self._items) >= self.max_size and not _must_keep(event) \
+                    and not self._make_room():
+                self.dropped += 1
+                return False
+            self._items.append((time.time(), event))
+            self.enqueued += 1
+            self._cond.notify()
+            return True
+
+    def _make_room(self) -> bool:
+        """队列已满时按策略腾出空间（调用方持有锁）"""
+        if self.overflow == 'block':
+            deadline = time.time() + self.block_timeout
+            while len(self._items) >= self.max_size and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return len(self._items) < self.max_size
+
+        if self.overflow == 'sample':
+            self._overflow_count += 1
+            if self._overflow_count % self.sample_every:
+                return False
+
+        # 挤出最旧的一个可丢弃事件（快照事件很少，通常就是队首）
+        for index, (_, queued) in enumerate(self._items):
+            if not _must_keep(queued):
+                del self._items[index]
+                self.dropped += 1
+                return True
+        return False
+
+    def _worker(self):
+        """消费者线程：批量取出事件并写入"""
+        if self.spool is not None:
+            try:
+                self.replayed = self.spool.replay(self._write)
+            except _Interrupted:
+                self._interrupted = True
+                return
+            except Exception as e:
+                print(f"⚠️ 重放未写入的事件失败: {e}")
+        
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items and self._closed:
+                    return
+                count = min(self.batch_size, len(self._items))
+                batch = [self._items.popleft() for _ in range(count)]
+                self._in_flight = count
+                # 唤醒 block 策略下等待空间的生产者
+                self._cond.notify_all()
+
+            events = [event for _, event in batch]
+            position = None
+            if self.spool is not None:
+                try:
+                    position = self.spool.append(events)
+                except Exception as e:
+                    print(f"⚠️ 写入事件缓冲失败: {e}")
+            try:
+                ok = self._write(events)
+            except _Interrupted:
+                with self._cond:
+                    # 未能落盘的批次放回队首，由 close() 转存
+                    if position is None:
+                        self._items.extendleft(reversed(batch))
+                    self._in_flight = 0
+                    self._interrupted = True
+                    self._cond.notify_all()
+                return
+            # 写入成功或已转入隔离目录，确认位置按顺序推进
+            if position is not None:
+                try:
+                    self.spool.ack(position)
+                except Exception as e:
+                    print(f"⚠️ 确认事件缓冲失败: {e}")
+
+            now = time.time()
+            with self._cond:
+                self._in_flight = 0
+                self.batches += 1
+                if ok:
+                    self.written += count
+                else:
+                    self.failed += count
+                for enqueued_at, _ in batch:
+                    latency = now - enqueued_at
+                    self.latency_total += latency
+                    if latency > self.latency_max:
+                        self.latency_max = latency
+                self._cond.notify_all()
+
+    def _write(self, events: List[Dict]) -> bool:
+        """
+        写入一批事件，可重试的错误按 SINK_RETRY_DELAYS 原地重试
+
+        Returns:
+            是否写入成功；失败时返回 False，配置了 spool 的批次已转入隔离目录
+
+        Raises:
+            _Interrupted: 配置了 spool 且队列正在关闭，放弃重试
+        """
+        for delay in SINK_RETRY_DELAYS + (None,):
+            try:
+                self.sink(events)
+                return True
+            except Exception as e:
+                print(f"⚠️ 批量写入事件失败: {e}")
+                if not self.retryable(e):
+                    break
+                if self._closed and self.spool is not None:
+                    raise _Interrupted() from e
+                if delay is None:
+                    break
+                time.sleep(delay)
+
+        if self.spool is not None:
+            try:
+                path = self.spool.quarantine(events)
+                print(f"⚠️ {len(events)} 个事件无法写入，已转入隔离文件: {path}")
+            except Exception as e:
+                print(f"⚠️ 隔离写入失败的事件失败: {e}")
+            with self._cond:
+                self.quarantined += len(events)
+        return False
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待队列中已有的事件全部写入
+
+        Returns:
+            是否在超时前写完
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._items or self._in_flight:
+                if not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """
+        停止接收新事件，写完剩余事件后结束消费者线程
+
+        超时仍未写完（或写入失败时放弃了重试）时，剩余事件转存到磁盘缓冲，下次启动时重放。
+
+        Returns:
+            是否在超时前全部写入
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        finished = not self._thread.is_alive()
+        if self.spool is None:
+            return finished
+
+        with self._cond:
+            leftovers = [event for _, event in self._items]
+            self._items.clear()
+        if leftovers:
+            try:
+                self.spool.append(leftovers)
+                self.spooled_on_close = len(leftovers)
+            except Exception as e:
+                print(f"⚠️ 转存未写入的事件失败: {e}")
+        if finished:
+            self.spool.close()
+        return finished and not leftovers and not self._interrupted
+
+    def stats(self) -> Dict:
+        """队列计数器快照"""
+        with self._cond:
+            processed = self.written + self.failed
+            return {
+                'depth': len(self._items),
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'written': self.written,
+                'failed': self.failed,
+                'quarantined': self.quarantined,
+                'batches': self.batches,
+                'replayed': self.replayed,
+                'spooled_on_close': self.spooled_on_close,
+                'avg_latency': self.latency_total / processed if processed else None,
+                'max_latency': self.latency_max,
+                'overflow': self.overflow,
+            }
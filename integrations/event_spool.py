@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地事件的持久化缓冲（spool）
+
+写入队列的消费者先把每批事件追加到分段日志文件并 fsync（每批一次，而不是每个事件一次），
+再写入 SQLite，写库成功后推进确认位置。进程崩溃或关闭时尚未确认的事件保留在磁盘上，
+下次启动时重放。
+
+文件格式：<spool_dir>/segment-<序号>.log，每条记录为
+    4 字节长度 + 4 字节 CRC32 + 事件负载（core.event_records.pack 的 JSON 编码）
+末尾不完整或校验失败的记录（写入中途崩溃）在重放时被忽略。
+确认位置保存在 <spool_dir>/ack.json 中：{"segment": 序号, "offset": 字节偏移}。
+多次写入失败的批次由写入方转存到 <spool_dir>/quarantine/batch-<时间戳>.log（格式相同，
+可用 read_frames 读出），随后照常确认，不再阻塞后续事件。
+"""
+
+import os
+import json
+import glob
+import time
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+try:
+    from core.event_records import write_frames, read_frames
+except ImportError:
+    from event_records import write_frames, read_frames  # type: ignore
+
+# 单个分段文件的最大字节数，超过后切换到新分段
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+
+
+class EventSpool:
+    """分段、带校验的追加写事件日志"""
+
+    def __init__(self, spool_dir: str, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        """
+        Args:
+            spool_dir: 缓冲文件目录
+            segment_max_bytes: 单个分段文件的最大字节数
+        """
+        self.spool_dir = spool_dir
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._ack_path = os.path.join(spool_dir, 'ack.json')
+        self._ack = self._load_ack()
+        # 新写入总是从一个新的分段开始，已有分段只用于重放
+        self._seq = max([seq for seq, _ in self._segments()] + [self._ack[0]]) + 1
+        # 重放范围在构造时固定：重放期间的追加与分段切换不会被重放或被确认删除
+        self._replay_end = self._seq
+        self._file = None
+
+    # ---- 写入 -------------------------------------------------------------
+    def append(self, events: List[Dict]) -> Tuple[int, int]:
+        """
+        追加一批事件并 fsync
+
+        Returns:
+            这批事件结束处的位置 (分段序号, 偏移)，写库成功后传给 ack()
+        """
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_max_bytes:
+                self._rotate()
+            write_frames(self._file, events)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            return self._seq, self._file.tell()
+
+    def ack(self, position: Tuple[int, int]):
+        """确认某个位置之前的事件已写入数据库，删除已全部确认的分段"""
+        with self._lock:
+            if position <= self._ack:
+                return
+            self._ack = position
+            tmp_path = self._ack_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'segment': position[0], 'offset': position[1]}, f)
+            os.replace(tmp_path, self._ack_path)
+            for seq, path in self._segments():
+                if seq < position[0]:
+                    os.remove(path)
+
+    def quarantine(self, events: List[Dict]) -> str:
+        """
+        转存一批多次写入失败的事件，排查后可手动重新导入
+
+        Returns:
+            隔离文件路径
+        """
+        quarantine_dir = os.path.join(self.spool_dir, 'quarantine')
+        with self._lock:
+            os.makedirs(quarantine_dir, exist_ok=True)
+            path = os.path.join(quarantine_dir, f'batch-{time.time_ns()}.log')
+            with open(path, 'wb') as f:
+                write_frames(f, events)
+                f.flush()
+                os.fsync(f.fileno())
+        return path
+
+    def close(self):
+        """关闭当前分段文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _rotate(self):
+        """切换到新的分段文件（调用方持有锁）"""
+        if self._file is not None:
+            self._file.close()
+            self._seq += 1
+        self._file = open(self._segment_path(self._seq), 'ab')
+        # 目录项也需要落盘，否则崩溃后新文件可能不可见
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(self.spool_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    # ---- 重放 -------------------------------------------------------------
+    def pending(self) -> Iterator[Tuple[Tuple[int, int], Dict]]:
+        """
+        逐条读取尚未确认的事件（只读取启动前已存在的分段）
+
+        Yields:
+            (记录结束处的位置, 事件)
+        """
+        for seq, path in self._segments():
+            if seq < self._ack[0] or seq >= self._replay_end:
+                continue
+            start = self._ack[1] if seq == self._ack[0] else 0
+            with open(path, 'rb') as f:
+                f.seek(start)
+                # 写入中途崩溃留下的不完整记录及之后的数据不会被读出
+                for offset, event in read_frames(f):
+                    yield (seq, offset), event
+
+    def replay(self, sink: Callable[[List[Dict]], object], batch_size: int = 500) -> int:
+        """
+        将启动前未确认的事件重新写入
+
+        Args:
+            sink: 批量写入函数
+            batch_size: 每批事件数
+
+        Returns:
+            重放的事件数
+        """
+        total = 0
+        batch, position = [], None
+        for position, event in self.pending():
+            batch.append(event)
+            if len(batch) >= batch_size:
+                sink(batch)
+                self.ack(position)
+                total += len(batch)
+                batch = []
+        if batch:
+            sink(batch)
+            self.ack(position)
+            total += len(batch)
+        # 旧分段已全部处理（包括末尾损坏的部分），确认到启动后第一个分段的起点
+        self.ack((self._replay_end, 0))
+        return total
+
+    # ---- 内部方法 ---------------------------------------------------------
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.spool_dir, f'segment-{seq:012d}.log')
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for path in glob.glob(os.path.join(self.spool_dir, 'segment-*.log')):
+            try:
+                segments.append((int(os.path.basename(path)[8:-4]), path))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def _load_ack(self) -> Tuple[int, int]:
+        try:
+            with open(self._ack_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return int(data['segment']), int(data['offset'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+空闲行为（IO）检测
+
+界面事件只更新最近活动时间；后台定时器检查无操作时长，
+空闲超过阈值后按检查点分段输出 IO 行为，空闲结束时输出最后一段。
+各段的 duration 之和即为整个空闲时长，应用在空闲中关闭也不会丢失已经过的部分。
+"""
+
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+# 无操作超过该时长（秒）视为空闲
+IDLE_THRESHOLD_SECONDS = 60
+
+# 持续空闲时每隔多久（秒）输出一段
+IDLE_CHECKPOINT_SECONDS = 300
+
+
+class IdleTracker:
+    """基于定时器的空闲检测"""
+
+    def __init__(self, emit: Callable[..., None], threshold: float = IDLE_THRESHOLD_SECONDS,
+                 checkpoint: float = IDLE_CHECKPOINT_SECONDS):
+        """
+        Args:
+            emit: 输出 IO 行为的函数，签名为
+                emit(behavior_code, duration=..., additional_data=..., timestamp=...)
+            threshold: 空闲阈值（秒）
+            checkpoint: 持续空闲时的分段间隔（秒）
+        """
+        self.emit = emit
+        self.threshold = threshold
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self.last_activity = time.time()
+        # 当前空闲期已输出到的时间点（None 表示尚未输出任何一段）
+        self._reported_until: Optional[float] = None
+
+    def touch(self, now: float = None):
+        """记录一次用户活动（界面线程调用，O(1)）"""
+        now = now or time.time()
+        with self._lock:
+            last = self.last_activity
+            self.last_activity = now
+            pending = self._close_period(last, now)
+        self._emit(pending)
+
+    def tick(self, now: float = None):
+        """定时检查：持续空闲超过检查点时输出一段"""
+        now = now or time.time()
+        with self._lock:
+            start = self._reported_until or self.last_activity
+            if now - self.last_activity < self.threshold or now - start < self.checkpoint:
+                return
+            pending = self._segment(self.last_activity, start, now, final=False)
+            self._reported_until = now
+        self._emit(pending)
+
+    def flush(self, now: float = None):
+        """结束当前空闲期（会话结束时调用）"""
+        now = now or time.time()
+        with self._lock:
+            pending = self._close_period(self.last_activity, now)
+            self.last_activity = now
+        self._emit(pending)
+
+    def reset(self, now: float = None):
+        """重新开始计时（新会话开始时调用，不输出任何行为）"""
+        with self._lock:
+            self.last_activity = now or time.time()
+            self._reported_until = None
+
+    def _close_period(self, last: float, now: float):
+        """活动恢复时输出空闲期的最后一段（调用方持有锁）"""
+        reported, self._reported_until = self._reported_until, None
+        if now - last < self.threshold:
+            return None
+        return self._segment(last, reported or last, now, final=True)
+
+    @staticmethod
+    def _segment(idle_start: float, start: float, end: float, final: bool):
+        return (end - start, {
+            'idle_seconds': end - start,
+            'idle_start': datetime.fromtimestamp(idle_start).isoformat(),
+            'segment_start': datetime.fromtimestamp(start).isoformat(),
+            'idle_total_seconds': end - idle_start,
+            'final': final,
+        }, start)
+
+    def _emit(self, pending):
+        if pending is None:
+            return
+        duration, data, started = pending
+        try:
+            self.emit('IO', duration=duration, additional_data=data, timestamp=started)
+        except Exception as e:
+            print(f"⚠️ 记录空闲行为失败: {e}")
@@ -9,6 +9,7 @@ import sys
 import os
 import io
 import time
+import atexit
 import threading
 from typing import Dict, Any
 
@@ -31,11 +32,11 @@ for extra_path in (root_dir, core_dir):
 
 # 优先使用包导入，静态分析工具可识别；若失败再退回旧路径
 try:
-    from core.sqlite_analytics import analytics  # type: ignore
+    from core.sqlite_analytics import get_analytics  # type: ignore
     ANALYTICS_AVAILABLE = True
 except ImportError:
     try:
-        from sqlite_analytics import analytics  # type: ignore
+        from sqlite_analytics import get_analytics  # type: ignore
         ANALYTICS_AVAILABLE = True
     except ImportError:
         ANALYTICS_AVAILABLE = False
@@ -49,6 +50,42 @@ except ImportError:
     except ImportError:
         get_user_identity = None
 
+try:
+    from integrations.event_queue import EventQueue
+    from integrations.event_aggregator import EventAggregator
+    from integrations.idle_tracker import IdleTracker
+    from integrations.event_spool import EventSpool
+except ImportError:
+    from event_queue import EventQueue  # type: ignore
+    from event_aggregator import EventAggregator  # type: ignore
+    from idle_tracker import IdleTracker  # type: ignore
+    from event_spool import EventSpool  # type: ignore
+
+try:
+    from core.event_records import (AIInteractionEvent, BehaviorEvent,
+                                    CodeOperationEvent, ErrorEvent)
+except ImportError:
+    from event_records import (AIInteractionEvent, BehaviorEvent,  # type: ignore
+                               CodeOperationEvent, ErrorEvent)
+
+try:
+    from core.code_snapshots import SnapshotEncoder
+except ImportError:
+    from code_snapshots import SnapshotEncoder  # type: ignore
+
+# 本地事件写入队列的容量与溢出策略（block / drop_oldest / sample）
+EVENT_QUEUE_SIZE = int(os.environ.get('PYCHATCAT_EVENT_QUEUE_SIZE', '10000'))
+EVENT_QUEUE_OVERFLOW = os.environ.get('PYCHATCAT_EVENT_OVERFLOW', 'drop_oldest')
+
+# 是否在写库前先将事件持久化到磁盘缓冲（崩溃或关闭后下次启动时重放）
+EVENT_SPOOL_ENABLED = os.environ.get('PYCHATCAT_EVENT_SPOOL', 'true').lower() == 'true'
+
+# 关闭时等待事件写完的最长时间（秒），超时后剩余事件转存到磁盘缓冲
+SHUTDOWN_TIMEOUT_SECONDS = 3.0
+
+# 后台定时器间隔（秒），用于输出已结束的悬停/键入/选中汇总与空闲行为
+TIMER_INTERVAL_SECONDS = 1.0
+
 try:
     from integrations.cloud_integration import create_cloud_client
     CLOUD_CLIENT_AVAILABLE = True
@@ -60,7 +97,7 @@ class SQLiteIntegration:
     """SQLite数据采集集成类"""
     
     def __init__(self):
-        self.analytics = analytics if ANALYTICS_AVAILABLE else None
+        self.analytics = get_analytics() if ANALYTICS_AVAILABLE else None
         self.enabled = ANALYTICS_AVAILABLE
         self.current_session_id = None
         self.current_user_id = "anonymous"
@@ -94,6 +131,38 @@ class SQLiteIntegration:
         # 行为开始时间记录
         self.behavior_start_times = {}
         
+        # 本地写入队列：界面线程只入队，由单个后台线程批量写入数据库
+        # 磁盘缓冲位于数据库目录下的 spool/，每批事件 fsync 一次
+        self.event_queue = None
+        self.event_spool = None
+        if self.enabled:
+            if EVENT_SPOOL_ENABLED:
+                try:
+                    db_dir = os.path.dirname(os.path.abspath(self.analytics.db_path))
+                    self.event_spool = EventSpool(os.path.join(db_dir, 'spool'))
+                except OSError as e:
+                    print(f"⚠️ 事件缓冲不可用: {e}")
+            self.event_queue = EventQueue(
+                self.analytics.log_events,
+                max_size=EVENT_QUEUE_SIZE,
+                overflow=EVENT_QUEUE_OVERFLOW,
+                spool=self.event_spool
+            )
+            # 进程退出前写完（或转存）队列中的事件
+            atexit.register(self.shutdown)
+        
+        # 高频的悬停/键入/选中事件先在本地聚合，再以汇总事件写入
+        self.aggregator = EventAggregator(self._record_behavior)
+        # 空闲检测：界面事件只更新活动时间，由后台定时器判断并输出 IO
+        self.idle_tracker = IdleTracker(self._record_behavior)
+        # 运行/保存的代码按文件增量编码为快照
+        self.snapshots = SnapshotEncoder()
+        self._timer_stop = threading.Event()
+        self._timer_thread = None
+        if self.enabled:
+            self._timer_thread = threading.Thread(target=self._timer_worker, daemon=True)
+            self._timer_thread.start()
+        
         # 如果启用，开始会话
         if self.enabled:
             self.start_session()
@@ -132,8 +201,10 @@ class SQLiteIntegration:
             except Exception as exc:
                 print(f"⚠️ 云端会话启动失败: {exc}")
         
-        # 最近活动时间（用于检测空闲行为）
-        self.last_activity_time: float = time.time()
+        # 重新开始空闲计时
+        self.idle_tracker.reset()
+        # 新会话中每个文件的第一个版本保存完整内容
+        self.snapshots.reset()
         # 最近一次剪贴板来源与内容，用于识别从哪里复制到哪里
         self.last_clipboard_source: str = "unknown"
         self.last_clipboard_content: str = ""
@@ -144,6 +215,12 @@ class SQLiteIntegration:
         if not self.enabled or not self.current_session_id:
             return
         
+        # 先输出未结束的汇总与空闲期，并写完队列中的事件
+        self.aggregator.flush()
+        self.idle_tracker.flush()
+        if self.event_queue:
+            self.event_queue.flush(timeout=2.0)
+        
         try:
             self.analytics.end_session(self.current_session_id)
             print(f"📊 数据采集会话已结束: {self.current_session_id}")
@@ -157,26 +234,78 @@ class SQLiteIntegration:
                 print(f"⚠️ 云端会话结束失败: {exc}")
     
     def _touch_activity(self):
-        """更新最近活动时间并在长时间无操作时记录 Idle 行为"""
+        """更新最近活动时间（空闲期结束时由空闲检测器经异步队列记录 IO）"""
         if not self.enabled or not self.current_session_id:
             return
-        now = time.time()
-        # 如果距离上次事件超过 60 秒，记录一次 Idle 行为
-        try:
-            gap = now - getattr(self, "last_activity_time", None) if getattr(self, "last_activity_time", None) else None
-            if gap is not None and gap >= 60:
-                try:
-                    if self.analytics:
-                        self.analytics.log_behavior(
-                            self.current_session_id,
-                            'IO',
-                            duration=gap,
-                            additional_data={'idle_seconds': gap}
-                        )
-                except Exception as e:
-                    print(f"⚠️ 记录空闲行为失败: {e}")
-        finally:
-            self.last_activity_time = now
+        self.idle_tracker.touch()
+
+    def _enqueue(self, record):
+        """将事件记录放入本地写入队列（O(1)，不访问数据库）"""
+        if self.event_queue:
+            self.event_queue.put(record)
+
+    def _timer_worker(self):
+        """后台定时器：输出已结束的聚合窗口"""
+        while not self._timer_stop.wait(TIMER_INTERVAL_SECONDS):
+            try:
+                self.aggregator.tick()
+                self.idle_tracker.tick()
+            except Exception as e:
+                print(f"⚠️ 定时任务失败: {e}")
+
+    def stop_timer(self):
+        """停止后台定时器"""
+        self._timer_stop.set()
+        if self._timer_thread:
+            self._timer_thread.join(timeout=2.0)
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT_SECONDS):
+        """
+        应用关闭时调用：输出未结束的汇总，在限定时间内写完队列
+
+        超时未写入数据库的事件保留在磁盘缓冲中，下次启动时重放。
+        可重复调用。
+        """
+        if not self.event_queue or self._timer_stop.is_set():
+            return
+        self.stop_timer()
+        if self.current_session_id:
+            self.aggregator.flush()
+            self.idle_tracker.flush()
+        if not self.event_queue.close(timeout):
+            print("⚠️ 关闭时仍有事件未写入数据库，已保存到磁盘缓冲，下次启动时写入")
+        if self.cloud_enabled:
+            try:
+                self.cloud_client.close(timeout)
+            except Exception as exc:
+                print(f"⚠️ 云端上报关闭失败: {exc}")
+
+    def record_hover(self, line_number: int):
+        """鼠标悬停到代码某一行（聚合为每分钟一条 VC）"""
+        if not self.enabled or not self.current_session_id:
+            return
+        self._touch_activity()
+        self.aggregator.record_hover(line_number)
+
+    def record_typing(self, cursor_line: int, cursor_column: int,
+                      code_length: int = None, line_count: int = None):
+        """一次键入（聚合为每段连续键入一条 CP）"""
+        if not self.enabled or not self.current_session_id:
+            return
+        self._touch_activity()
+        self.aggregator.record_typing(cursor_line, cursor_column, code_length, line_count)
+
+    def record_selection(self, start_line: int = None, end_line: int = None,
+                         content_length: int = 0, source: str = 'editor'):
+        """选中范围变化（聚合为每次选中一条 SC）"""
+        if not self.enabled or not self.current_session_id:
+            return
+        self._touch_activity()
+        self.aggregator.record_selection(start_line, end_line, content_length, source)
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """本地写入队列的计数器（入队、丢弃、写入、延迟等）"""
+        return self.event_queue.stats() if self.event_queue else {}
 
     def record_clipboard(self, source: str, content: str):
         """记录最近一次剪贴板来源及内容"""
@@ -193,23 +322,14 @@ class SQLiteIntegration:
         
         self.behavior_start_times[behavior_code] = time.time()
         
-        # 异步记录行为
-        def log_async():
-            try:
-                self.analytics.log_behavior(
-                    self.current_session_id, 
-                    behavior_code, 
-                    duration=0,  # 开始时不记录时长
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录行为失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+        # 异步记录行为（开始时不记录时长）
+        record = BehaviorEvent(self.current_session_id, behavior_code, duration=0,
+                               additional_data=additional_data)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_behavior(behavior_code, additional_data=additional_data)
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端行为记录失败: {exc}")
     
@@ -225,37 +345,20 @@ class SQLiteIntegration:
             del self.behavior_start_times[behavior_code]
         
         # 异步记录行为
-        def log_async():
-            try:
-                self.analytics.log_behavior(
-                    self.current_session_id, 
-                    behavior_code, 
-                    duration=duration,
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录行为失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+        record = BehaviorEvent(self.current_session_id, behavior_code, duration=duration,
+                               additional_data=additional_data)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_behavior(behavior_code, duration=duration, additional_data=additional_data)
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端行为记录失败: {exc}")
                 # 记录一次 AI 相关的失败行为（FC）用于后续分析网络/平台问题
-                try:
-                    if self.analytics:
-                        self.analytics.log_behavior(
-                            self.current_session_id,
-                            'FC',
-                            additional_data={
-                                'stage': 'cloud_behavior',
-                                'error': str(exc)
-                            }
-                        )
-                except Exception as e2:
-                    print(f"⚠️ 记录FC行为失败: {e2}")
+                self._enqueue(BehaviorEvent(self.current_session_id, 'FC', additional_data={
+                    'stage': 'cloud_behavior',
+                    'error': str(exc)
+                }))
     
     def log_behavior(self, behavior_code: str, duration: float = None, additional_data: Dict = None):
         """记录学习行为"""
@@ -263,60 +366,54 @@ class SQLiteIntegration:
             return
         # 更新活动时间并检测是否需要记录 Idle
         self._touch_activity()
+        self._record_behavior(behavior_code, duration=duration, additional_data=additional_data)
+
+    def _record_behavior(self, behavior_code: str, duration: float = None,
+                         additional_data: Dict = None, timestamp: float = None):
+        """写入本地队列并上报云端（不更新活动时间，供聚合器输出汇总事件）"""
+        if not self.enabled or not self.current_session_id:
+            return
         # 异步记录行为
-        def log_async():
-            try:
-                self.analytics.log_behavior(
-                    self.current_session_id, 
-                    behavior_code, 
-                    duration=duration,
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录行为失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+        record = BehaviorEvent(self.current_session_id, behavior_code, duration=duration,
+                               additional_data=additional_data, timestamp=timestamp)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_behavior(behavior_code, duration=duration, additional_data=additional_data)
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端行为记录失败: {exc}")
     
     def log_code_operation(self, operation_type: str, code: str = None, 
                           success: bool = True, error_message: str = None, 
-                          execution_time: float = None, additional_data: Dict = None):
-        """记录代码操作"""
+                          execution_time: float = None, additional_data: Dict = None,
+                          file_key: str = None):
+        """
+        记录代码操作
+        
+        Args:
+            file_key: 代码所属文件（未保存的代码为"未命名"），用于按文件增量保存代码快照
+        """
         if not self.enabled or not self.current_session_id:
             return
         # 更新活动时间并检测是否需要记录 Idle
         self._touch_activity()
-        # 异步记录代码操作
-        def log_async():
+        snapshot = None
+        if code is not None:
             try:
-                self.analytics.log_code_operation(
-                    self.current_session_id,
-                    operation_type,
-                    code,
-                    success,
-                    error_message,
-                    execution_time,
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录代码操作失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+                snapshot = self.snapshots.encode(file_key or "未命名", code)
+            except Exception as exc:
+                print(f"⚠️ 生成代码快照失败: {exc}")
+        # 异步记录代码操作
+        record = CodeOperationEvent(self.current_session_id, operation_type, code=code,
+                                    success=success, error_message=error_message,
+                                    execution_time=execution_time,
+                                    additional_data=additional_data, snapshot=snapshot)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_code_operation(
-                    operation_type,
-                    code=code,
-                    success=success,
-                    error_message=error_message,
-                    execution_time=execution_time,
-                )
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端代码操作记录失败: {exc}")
     
@@ -330,46 +427,23 @@ class SQLiteIntegration:
         self._touch_activity()
         
         # 异步记录AI交互
-        def log_async():
-            try:
-                self.analytics.log_ai_interaction(
-                    self.current_session_id,
-                    interaction_type,
-                    question,
-                    response,
-                    response_time,
-                    feedback_quality,
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录AI交互失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+        record = AIInteractionEvent(self.current_session_id, interaction_type,
+                                    question=question, response=response,
+                                    response_time=response_time,
+                                    feedback_quality=feedback_quality,
+                                    additional_data=additional_data)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_ai_interaction(
-                    interaction_type,
-                    question=question,
-                    response=response,
-                    response_time=response_time,
-                    additional_data=additional_data or {},
-                )
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端AI交互失败: {exc}")
                 # 记录一次 FC 行为（AI 上报失败）
-                try:
-                    if self.analytics:
-                        self.analytics.log_behavior(
-                            self.current_session_id,
-                            'FC',
-                            additional_data={
-                                'stage': 'cloud_ai',
-                                'error': str(exc)
-                            }
-                        )
-                except Exception as e2:
-                    print(f"⚠️ 记录FC行为失败: {e2}")
+                self._enqueue(BehaviorEvent(self.current_session_id, 'FC', additional_data={
+                    'stage': 'cloud_ai',
+                    'error': str(exc)
+                }))
     
     def log_error_analysis(self, error_type: str, error_line: int,
                           error_message: str, fix_attempts: int = 0,
@@ -381,32 +455,14 @@ class SQLiteIntegration:
         self._touch_activity()
         
         # 异步记录错误分析
-        def log_async():
-            try:
-                self.analytics.log_error_analysis(
-                    self.current_session_id,
-                    error_type,
-                    error_line,
-                    error_message,
-                    fix_attempts,
-                    fix_success,
-                    additional_data=additional_data
-                )
-            except Exception as e:
-                print(f"⚠️ 记录错误分析失败: {e}")
-        
-        threading.Thread(target=log_async, daemon=True).start()
+        record = ErrorEvent(self.current_session_id, error_type, error_line=error_line,
+                            error_message=error_message, fix_attempts=fix_attempts,
+                            fix_success=fix_success, additional_data=additional_data)
+        self._enqueue(record)
 
         if self.cloud_enabled:
             try:
-                self.cloud_client.log_error_analysis(
-                    error_type,
-                    error_line,
-                    error_message,
-                    fix_attempts,
-                    fix_success,
-                    additional_data=additional_data or {},
-                )
+                self.cloud_client.send(record)
             except Exception as exc:
                 print(f"⚠️ 云端错误分析记录失败: {exc}")
 
@@ -458,31 +514,25 @@ def integrate_code_editor(code_editor):
     original_on_selection_change = getattr(code_editor, 'on_selection_change', None)
     
     def tracked_on_text_change(event=None):
-        # 记录代码编写行为（使用防抖，避免每次按键都记录）
-        if not hasattr(code_editor, '_last_log_time'):
-            code_editor._last_log_time = 0
-        
-        import time
-        current_time = time.time()
-        # 每5秒最多记录一次代码编写行为
-        if current_time - code_editor._last_log_time > 5:
-            code_editor._last_log_time = current_time
-            try:
-                code_content = code_editor.text_area.get("1.0", "end-1c")
-                # 获取当前光标位置
-                cursor_pos = code_editor.text_area.index("insert")
-                line_num = int(cursor_pos.split('.')[0])
-                col_num = int(cursor_pos.split('.')[1])
-                
-                sqlite_integration.log_behavior('CP', additional_data={
-                    'code_length': len(code_content),
-                    'line_count': len(code_content.split('\n')),
-                    'cursor_line': line_num,
-                    'cursor_column': col_num,
-                    'edit_type': 'typing'
-                })
-            except Exception as e:
-                print(f"⚠️ 记录代码编写行为失败: {e}")
+        # 每次键入只累加到当前键入段，停顿后由聚合器输出一条 CP
+        try:
+            text_area = code_editor.text_area
+            cursor_pos = text_area.index("insert")
+            line_num = int(cursor_pos.split('.')[0])
+            col_num = int(cursor_pos.split('.')[1])
+            
+            # 代码长度需要读取全文，每秒最多读取一次
+            code_length = line_count = None
+            current_time = time.time()
+            if current_time - getattr(code_editor, '_last_length_time', 0) > 1:
+                code_editor._last_length_time = current_time
+                code_content = text_area.get("1.0", "end-1c")
+                code_length = len(code_content)
+                line_count = len(code_content.split('\n'))
+            
+            sqlite_integration.record_typing(line_num, col_num, code_length, line_count)
+        except Exception as e:
+            print(f"⚠️ 记录代码编写行为失败: {e}")
         
         # 调用原始方法
         if original_on_text_change:
@@ -493,33 +543,21 @@ def integrate_code_editor(code_editor):
 
     # 集成代码选择行为
     def tracked_selection_change(event=None):
-        # 记录选择行为（防抖，避免频繁记录）
+        # 拖动选择过程中的多次变化由聚合器合并为一条 SC
         try:
-            if not hasattr(code_editor, '_last_select_log_time'):
-                code_editor._last_select_log_time = 0
-            import time
-            now = time.time()
-            if now - code_editor._last_select_log_time < 2:
-                # 2 秒内不重复记录
-                if original_on_selection_change:
-                    return original_on_selection_change(event)
-                return
-
-            if code_editor.text_area.tag_ranges("sel"):
-                start = code_editor.text_area.index("sel.first")
-                end = code_editor.text_area.index("sel.last")
-                start_line = int(start.split('.')[0])
-                end_line = int(end.split('.')[0])
-                selected = code_editor.text_area.get("sel.first", "sel.last")
+            text_area = code_editor.text_area
+            if text_area.tag_ranges("sel"):
+                start = text_area.index("sel.first")
+                end = text_area.index("sel.last")
+                selected = text_area.get("sel.first", "sel.last")
                 if selected.strip():
-                    sqlite_integration.log_behavior('SC', additional_data={
-                        'source': 'editor',
-                        'start_line': start_line,
-                        'end_line': end_line,
-                        'content_length': len(selected),
-                        'line_count': end_line - start_line + 1
-                    })
-                    code_editor._last_select_log_time = now
+                    sqlite_integration.record_selection(
+                        int(start.split('.')[0]), int(end.split('.')[0]), len(selected)
+                    )
+                else:
+                    sqlite_integration.record_selection(None)
+            else:
+                sqlite_integration.record_selection(None)
         except Exception:
             pass
         if original_on_selection_change:
@@ -534,7 +572,6 @@ def integrate_code_editor(code_editor):
         sqlite_integration.log_behavior('DP', additional_data={
             'line_number': line_number,
             'action': 'toggle_breakpoint',
-            'timestamp': time.time()
         })
         
         if original_toggle_breakpoint:
@@ -599,27 +636,11 @@ def integrate_code_editor(code_editor):
     code_editor.text_area.bind('<Control-c>', on_copy)
     code_editor.text_area.bind('<Control-v>', on_paste)
     
-    # 集成代码查看（鼠标悬停）
-    last_view_line = None
-    view_start_time = None
-    
+    # 集成代码查看（鼠标悬停），各行停留时长由聚合器按分钟汇总为 VC
     def on_mouse_motion(event):
-        nonlocal last_view_line, view_start_time
         try:
             index = code_editor.text_area.index(f"@{event.x},{event.y}")
-            line_num = int(index.split('.')[0])
-            
-            if line_num != last_view_line:
-                # 记录上一个位置的查看时间
-                if last_view_line and view_start_time:
-                    duration = time.time() - view_start_time
-                    if duration > 1:  # 只记录超过1秒的查看
-                        sqlite_integration.log_behavior('VC', duration=duration, additional_data={
-                            'line_number': last_view_line
-                        })
-                
-                last_view_line = line_num
-                view_start_time = time.time()
+            sqlite_integration.record_hover(int(index.split('.')[0]))
         except Exception:
             pass
     
@@ -663,20 +684,17 @@ def integrate_console(console):
                 'error_line': error_line,
                 'message_length': len(text),
                 'error_message': text[:200],
-                'view_timestamp': time.time()
             })
         elif "警告" in text or "Warning" in text:
             sqlite_integration.log_behavior('RCM', additional_data={
                 'message_type': 'warning',
                 'message_length': len(text),
-                'view_timestamp': time.time()
             })
         elif tag == "output" and text.strip():
             # 记录输出查看
             sqlite_integration.log_behavior('VO', additional_data={
                 'output_type': tag,
                 'output_length': len(text),
-                'view_timestamp': time.time()
             })
         
         # 调用原始方法
@@ -735,7 +753,6 @@ def integrate_ai_assistant(ai_assistant):
                     additional_data={
                         'question_type': 'manual',
                         'question_length': len(user_input),
-                        'timestamp': time.time()
                     }
                 )
         
@@ -754,7 +771,6 @@ def integrate_ai_assistant(ai_assistant):
         chat_enter_time = time.time()
         sqlite_integration.log_behavior('AC', additional_data={
             'action': 'enter',
-            'timestamp': time.time()
         })
     
     def on_chat_focus_out(event=None):
@@ -765,7 +781,6 @@ def integrate_ai_assistant(ai_assistant):
             sqlite_integration.log_behavior('AC', duration=duration, additional_data={
                 'action': 'leave',
                 'total_time': chat_total_time,
-                'timestamp': time.time()
             })
             chat_enter_time = None
     
@@ -787,7 +802,6 @@ def integrate_ai_assistant(ai_assistant):
                         'source': 'ai',
                         'content_length': len(selected),
                         'content_preview': selected[:100],
-                        'timestamp': time.time()
                     })
                     # 记录剪贴板来源为 ai，便于之后在编辑器粘贴时识别为 CPC
                     try:
@@ -844,7 +858,6 @@ def integrate_ai_assistant(ai_assistant):
                 'source': source,
                 'content_length': length,
                 'content_preview': (clip[:100] if clip else ""),
-                'timestamp': time.time()
             }
             # 从编辑器粘贴代码到 AI -> PPC
             if source == 'editor':
@@ -893,7 +906,6 @@ def integrate_ai_assistant(ai_assistant):
                     response=message,
                     additional_data={
                         'response_length': len(message),
-                        'view_timestamp': time.time()
                     }
                 )
             
@@ -917,6 +929,13 @@ def integrate_code_executor_with_app(code_executor, main_app):
         start_line = 1
         end_line = 1
         
+        # 当前文件名（代码快照按文件增量保存）
+        file_key = None
+        try:
+            file_key = main_app.file_manager.get_current_file()
+        except Exception:
+            pass
+        
         try:
             if code and hasattr(main_app, 'code_editor'):
                 code_editor = main_app.code_editor
@@ -971,8 +990,8 @@ def integrate_code_executor_with_app(code_executor, main_app):
                     'start_line': start_line,
                     'end_line': end_line,
                     'code_range': code_range,
-                    'timestamp': time.time()
-                }
+                },
+                file_key=file_key,
             )
             
             # 记录行为结束
@@ -1004,8 +1023,8 @@ def integrate_code_executor_with_app(code_executor, main_app):
                     'end_line': end_line,
                     'code_range': code_range,
                     'error_line': error_line,
-                    'timestamp': time.time()
-                }
+                },
+                file_key=file_key,
             )
             
             # 记录错误分析
@@ -1058,3 +1077,4 @@ def cleanup():
     """清理资源"""
     if sqlite_integration.enabled:
         sqlite_integration.end_session()
+        sqlite_integration.shutdown()
@@ -605,6 +605,8 @@ AI: DeepSeek集成
                 print("📊 数据采集会话已结束")
             except Exception as e:
                 print(f"⚠️ 结束数据采集会话失败: {e}")
+            # 在限定时间内写完待写入的事件，未写完的保留在磁盘缓冲中
+            sqlite_integration.shutdown()
         
         self.root.destroy()
         
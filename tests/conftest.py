@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""pytest 配置：把项目根目录加入导入路径"""
+
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""云端请求熔断器：连续失败后断开、定期放行探测请求与恢复"""
+
+import threading
+
+import pytest
+
+from integrations import circuit_breaker
+from integrations.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    assert [breaker.record_failure() for _ in range(2)] == [False, False]
+    assert breaker.allow()
+    # 成功一次后重新计数
+    breaker.record_success()
+    assert [breaker.record_failure() for _ in range(3)] == [False, False, True]
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert not breaker.allow() and not breaker.allow()
+    assert breaker.stats() == {'state': 'open', 'failures': 3, 'short_circuited': 2}
+
+
+def test_one_probe_per_reset_period(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测请求进行中，其余请求仍然跳过
+    assert not breaker.allow()
+
+    # 探测失败：重新断开（不重复报告断开），等待下一个周期
+    assert breaker.record_failure() is False
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 10
+    assert not breaker.allow()
+    clock.now += 20
+    assert breaker.allow()
+
+    # 探测成功：恢复
+    assert breaker.record_success() is True
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+    assert breaker.allow()
+    assert breaker.record_success() is False
+
+
+def test_only_one_thread_gets_the_probe(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+
+    allowed = []
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow())) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 1
+
+
+def test_client_skips_requests_while_open(breaker):
+    pytest.importorskip('requests')
+    from integrations.cloud_integration import CloudAnalyticsClient
+
+    class FailingHttp:
+        calls = 0
+
+        def post(self, url, **kwargs):
+            FailingHttp.calls += 1
+            import requests
+            raise requests.exceptions.Timeout('timed out')
+
+    client = CloudAnalyticsClient.__new__(CloudAnalyticsClient)
+    client.base_url = 'http://cloud.invalid'
+    client.http = FailingHttp()
+    client.breaker = breaker
+    client._slots = threading.BoundedSemaphore(1)
+    client._connection_error_shown = False
+
+    for _ in range(3):
+        with pytest.raises(Exception):
+            client._post_batch(b'', {})
+    with pytest.raises(CircuitOpenError):
+        client._post_batch(b'', {})
+    assert FailingHttp.calls == 3
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""云端批量上传：关闭时剩余事件先写入发件箱"""
+
+import threading
+
+from core.event_records import BehaviorEvent
+from integrations.cloud_outbox import CloudOutbox
+from integrations.cloud_uploader import BatchUploader
+
+
+class SlowPost:
+    """第一个请求阻塞到 release() 为止，模拟很慢的网络"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.bodies = []
+
+    def __call__(self, body, headers):
+        self.started.set()
+        self.released.wait(10)
+        self.bodies.append(headers['Idempotency-Key'])
+
+    def release(self):
+        self.released.set()
+
+
+def test_close_writes_all_buffered_events_to_outbox_before_network(tmp_path):
+    outbox = CloudOutbox(str(tmp_path / 'outbox.db'))
+    post = SlowPost()
+    uploader = BatchUploader(post, batch_size=200, flush_interval=60, outbox=outbox)
+    for index in range(1000):
+        uploader.add('cloud-session', BehaviorEvent('local-session', 'CP', timestamp=1000.0 + index))
+    uploader.request_flush()
+    assert post.started.wait(5)
+
+    # 第一批正在发送（阻塞），剩余 800 条在关闭时全部进入发件箱
+    assert not uploader.close(timeout=0.2)
+    assert outbox.counts() == (5, 1000)
+
+    post.release()
+    uploader._thread.join(5)
+    assert not uploader._thread.is_alive()
+    stats = uploader.stats()
+    assert stats['sent'] == 200 and stats['requests'] == 1 and stats['failed'] == 0
+    # 关闭后不再重发积压，剩余批次留给下次启动
+    assert outbox.counts() == (4, 800)
+    outbox.close()
+
+
+def test_close_sends_nothing_when_outbox_holds_everything(tmp_path):
+    outbox = CloudOutbox(str(tmp_path / 'outbox.db'))
+    post = SlowPost()
+    post.release()
+    uploader = BatchUploader(post, batch_size=50, flush_interval=60, outbox=outbox)
+    for index in range(120):
+        uploader.add('cloud-session', BehaviorEvent('local-session', 'CP', timestamp=1000.0 + index))
+    assert uploader.close(timeout=5)
+    assert post.bodies == []
+
+    reopened = CloudOutbox(str(tmp_path / 'outbox.db'))
+    assert reopened.counts() == (3, 120)
+    reopened.close()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""源端聚合：悬停窗口、键入段与选中操作折叠为汇总事件"""
+
+import pytest
+
+from integrations.event_aggregator import (EventAggregator, HOVER_WINDOW_SECONDS,
+                                           TYPING_BURST_GAP, TYPING_MAX_BURST)
+
+# 与整分钟对齐的起始时间
+T = 1_700_000_040.0
+
+
+@pytest.fixture
+def emitted():
+    return []
+
+
+@pytest.fixture
+def aggregator(emitted):
+    return EventAggregator(lambda code, **kwargs: emitted.append((code, kwargs)))
+
+
+def test_hover_dwell_is_summed_per_line_per_window(aggregator, emitted):
+    aggregator.record_hover(3, now=T)
+    aggregator.record_hover(4, now=T + 5)      # 第 3 行停留 5 秒
+    aggregator.record_hover(3, now=T + 5.5)    # 第 4 行 0.5 秒，不计入
+    aggregator.record_hover(7, now=T + 8.5)    # 第 3 行再停留 3 秒
+    aggregator.tick(now=T + 30)
+    assert emitted == []
+
+    aggregator.tick(now=T + HOVER_WINDOW_SECONDS)
+    (code, event), = emitted
+    data = event['additional_data']
+    assert code == 'VC' and event['timestamp'] == T
+    # 跨窗口仍停在第 7 行：本窗口内的停留时间计入本窗口
+    assert event['duration'] == pytest.approx(8 + HOVER_WINDOW_SECONDS - 8.5)
+    assert data['line_dwell'] == {'3': 8.0, '7': 51.5}
+    assert data['line_visits'] == {'3': 2, '7': 1}
+    assert data['line_number'] == 7 and (data['start_line'], data['end_line']) == (3, 7)
+    assert data['window_start']
+
+
+def test_hover_in_a_new_window_closes_the_previous_one(aggregator, emitted):
+    aggregator.record_hover(1, now=T + 10)
+    aggregator.record_hover(2, now=T + 20)
+    # 停留计入开始时所在的窗口
+    aggregator.record_hover(3, now=T + HOVER_WINDOW_SECONDS + 5)
+    aggregator.record_hover(4, now=T + HOVER_WINDOW_SECONDS + 10)
+    assert [event['additional_data']['line_dwell'] for _, event in emitted] == [
+        {'1': 10.0, '2': HOVER_WINDOW_SECONDS - 15.0},
+    ]
+
+    aggregator.flush(now=T + HOVER_WINDOW_SECONDS + 12)
+    assert [event['additional_data']['line_dwell'] for _, event in emitted[1:]] == [
+        {'3': 5.0, '4': 2.0},
+    ]
+    assert emitted[1][1]['timestamp'] == T + HOVER_WINDOW_SECONDS
+
+
+def test_typing_bursts_end_after_a_pause(aggregator, emitted):
+    aggregator.record_typing(5, 1, code_length=100, line_count=10, now=T)
+    aggregator.record_typing(6, 2, now=T + 1)
+    aggregator.record_typing(4, 3, code_length=103, now=T + 1.5)
+    aggregator.tick(now=T + 1.5 + TYPING_BURST_GAP / 2)
+    assert emitted == []
+
+    aggregator.record_typing(9, 0, code_length=104, now=T + 1.5 + TYPING_BURST_GAP + 1)
+    (code, event), = emitted
+    assert code == 'CP' and event['timestamp'] == T and event['duration'] == 1.5
+    assert event['additional_data'] == {
+        'aggregated': 'typing_burst', 'edit_type': 'typing', 'keystrokes': 3,
+        'start_line': 4, 'end_line': 6, 'cursor_line': 4, 'cursor_column': 3,
+        'code_length': 103, 'length_change': 3, 'line_count': 10,
+    }
+
+
+def test_continuous_typing_is_split_at_the_maximum_burst_length(aggregator, emitted):
+    steps = int(TYPING_MAX_BURST) + 5
+    for step in range(steps):
+        aggregator.record_typing(1, step, now=T + step)
+    aggregator.flush(now=T + steps)
+    assert [event['additional_data']['keystrokes'] for _, event in emitted] == [
+        int(TYPING_MAX_BURST) + 1, steps - int(TYPING_MAX_BURST) - 1,
+    ]
+
+
+def test_selection_drag_is_one_event(aggregator, emitted):
+    aggregator.record_selection(2, 2, content_length=5, now=T)
+    aggregator.record_selection(2, 4, content_length=40, now=T + 0.2)
+    aggregator.record_selection(2, 6, content_length=80, now=T + 0.4)
+    aggregator.tick(now=T + 0.6)
+    assert emitted == []
+
+    aggregator.tick(now=T + 2)
+    (code, event), = emitted
+    assert code == 'SC' and event['duration'] == pytest.approx(0.4)
+    assert event['additional_data'] == {
+        'aggregated': 'selection', 'source': 'editor', 'start_line': 2, 'end_line': 6,
+        'content_length': 80, 'line_count': 5, 'updates': 3,
+    }
+
+
+def test_selection_ends_on_clear_or_source_change(aggregator, emitted):
+    aggregator.record_selection(1, 1, content_length=3, now=T)
+    aggregator.record_selection(1, 1, content_length=3, source='output', now=T + 0.1)
+    aggregator.record_selection(None, now=T + 0.2)
+    assert [event['additional_data']['source'] for _, event in emitted] == ['editor', 'output']
+
+
+def test_emit_errors_do_not_reach_the_ui_thread():
+    def failing_emit(code, **kwargs):
+        raise RuntimeError('queue closed')
+
+    aggregator = EventAggregator(failing_emit)
+    aggregator.record_typing(1, 1, now=T)
+    aggregator.flush(now=T + 1)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""本地写入队列与磁盘缓冲：失败重试、隔离、重启重放与队列满时的丢弃策略"""
+
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from core.event_records import read_frames
+from integrations import event_queue
+from integrations.event_queue import EventQueue
+from integrations.event_spool import EventSpool
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    # 保留重试次数（4 次尝试），去掉等待时间
+    monkeypatch.setattr(event_queue, 'SINK_RETRY_DELAYS', (0, 0, 0))
+
+
+class FlakySink:
+    """记录写入的事件 ID；包含 fail_id 的批次前 failures 次写入时抛出 error"""
+
+    def __init__(self, fail_id=None, failures=0, error=None):
+        self.fail_id = fail_id
+        self.failures = failures
+        self.error = error or sqlite3.OperationalError('database is locked')
+        self.calls = 0
+        self.written = []
+
+    def __call__(self, events):
+        self.calls += 1
+        ids = [event['id'] for event in events]
+        if self.fail_id in ids and self.failures > 0:
+            self.failures -= 1
+            raise self.error
+        self.written.extend(ids)
+
+
+def run_queue(spool_dir, sink, ids, flush_each=False):
+    queue = EventQueue(sink, spool=EventSpool(spool_dir))
+    for event_id in ids:
+        queue.put({'id': event_id})
+        if flush_each:
+            queue.flush(timeout=5)
+    assert queue.close(timeout=5)
+    return queue
+
+
+def test_failed_batch_is_quarantined_and_not_replayed_twice(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    sink = FlakySink(fail_id=0, failures=4)
+    first = run_queue(spool_dir, sink, range(5), flush_each=True)
+    assert sink.written == [1, 2, 3, 4]
+    assert first.stats()['quarantined'] == 1
+
+    quarantined = glob.glob(os.path.join(spool_dir, 'quarantine', '*.log'))
+    assert len(quarantined) == 1
+    with open(quarantined[0], 'rb') as f:
+        assert [event['id'] for _, event in read_frames(f)] == [0]
+
+    # 重启后不会重放已写入的 [1, 2, 3, 4]
+    restarted = FlakySink()
+    second = run_queue(spool_dir, restarted, [5])
+    assert second.replayed == 0
+    assert restarted.written == [5]
+
+
+def test_transient_failure_is_retried_in_place(tmp_path):
+    sink = FlakySink(fail_id=0, failures=2)
+    queue = run_queue(str(tmp_path / 'spool'), sink, range(3), flush_each=True)
+    assert sink.written == [0, 1, 2]
+    assert queue.stats()['quarantined'] == 0
+    assert queue.stats()['failed'] == 0
+
+
+def test_close_during_retry_keeps_batch_for_replay(tmp_path, monkeypatch):
+    # 重试足够多次，保证关闭时仍在重试
+    monkeypatch.setattr(event_queue, 'SINK_RETRY_DELAYS', (0.01,) * 1000)
+    spool_dir = str(tmp_path / 'spool')
+    sink = FlakySink(fail_id=0, failures=10 ** 6)
+    queue = EventQueue(sink, spool=EventSpool(spool_dir))
+    for event_id in range(3):
+        queue.put({'id': event_id})
+    assert not queue.close(timeout=5)
+    assert sink.written == []
+
+    restarted = FlakySink()
+    second = run_queue(spool_dir, restarted, [])
+    assert second.replayed == 3
+    assert restarted.written == [0, 1, 2]
+
+
+@pytest.mark.parametrize('error', [sqlite3.OperationalError('no such table: learning_behaviors'),
+                                   sqlite3.IntegrityError('NOT NULL constraint failed'),
+                                   TypeError('bad event')])
+def test_errors_that_retrying_cannot_fix_are_quarantined_at_once(tmp_path, error):
+    spool_dir = str(tmp_path / 'spool')
+    sink = FlakySink(fail_id=0, failures=10 ** 6, error=error)
+    queue = run_queue(spool_dir, sink, range(3), flush_each=True)
+    assert sink.calls == 3
+    assert sink.written == [1, 2]
+    assert queue.stats()['quarantined'] == 1
+    assert len(glob.glob(os.path.join(spool_dir, 'quarantine', '*.log'))) == 1
+
+
+def blocked_queue(overflow, **kwargs):
+    """消费者卡在第一批上的队列，之后入队的事件都留在内存中"""
+    gate = threading.Event()
+    written = []
+
+    def sink(events):
+        gate.wait(5)
+        written.extend(event['id'] for event in events)
+
+    queue = EventQueue(sink, max_size=3, batch_size=1, overflow=overflow, **kwargs)
+    queue.put({'id': 'first'})
+    while queue.stats()['depth']:
+        time.sleep(0.001)
+    return queue, gate, written
+
+
+def snapshot_event(event_id):
+    return {'id': event_id, 'type': 'code', 'snapshot': {'file': 'main.py', 'seq': event_id}}
+
+
+@pytest.mark.parametrize('overflow', ['drop_oldest', 'sample'])
+def test_snapshot_events_are_never_dropped_or_evicted(overflow):
+    queue, gate, written = blocked_queue(overflow, sample_every=1)
+    queue.put(snapshot_event(1))
+    queue.put({'id': 'a'})
+    queue.put(snapshot_event(2))
+    # 队列已满：挤出的是普通事件，快照事件照常入队
+    assert queue.put({'id': 'b'})
+    assert queue.put(snapshot_event(3))
+    assert queue.put({'id': 'c'})
+
+    gate.set()
+    assert queue.close(timeout=5)
+    assert written == ['first', 1, 2, 3, 'c']
+    assert queue.stats()['dropped'] == 2
+
+
+def test_full_queue_of_snapshots_rejects_plain_events():
+    queue, gate, written = blocked_queue('drop_oldest')
+    for seq in range(1, 5):
+        assert queue.put(snapshot_event(seq))
+    assert not queue.put({'id': 'plain'})
+
+    gate.set()
+    assert queue.close(timeout=5)
+    assert written == ['first', 1, 2, 3, 4]
+
+
+def test_block_policy_does_not_wait_for_snapshot_events():
+    queue, gate, written = blocked_queue('block', block_timeout=0.01)
+    for event_id in 'abc':
+        queue.put({'id': event_id})
+    assert not queue.put({'id': 'd'})
+    assert queue.put(snapshot_event(1))
+
+    gate.set()
+    assert queue.close(timeout=5)
+    assert written == ['first', 'a', 'b', 'c', 1]
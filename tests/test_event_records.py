@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""事件记录的存储格式：JSON 帧的编码、还原与损坏数据处理"""
+
+import io
+import json
+import pickle
+import struct
+import zlib
+
+from core.event_records import (BehaviorEvent, CodeOperationEvent, ErrorEvent,
+                                pack, read_frames, unpack, write_frames)
+
+
+def test_records_round_trip_as_json_arrays():
+    events = [
+        BehaviorEvent('s1', 'CP', duration=1.5, additional_data={'keystrokes': 3}, timestamp=100.0),
+        CodeOperationEvent('s1', 'run', code='x = 1', snapshot={'seq': 1, 'content': 'x = 1'},
+                           timestamp=101.0),
+        ErrorEvent('s1', 'NameError', error_line=2, timestamp=102.0),
+        {'sessions': [], 'events': [{'type': 'behavior'}], 'key': 'k1'},
+    ]
+    f = io.BytesIO()
+    write_frames(f, events)
+    f.seek(0)
+    restored = [event for _, event in read_frames(f)]
+
+    assert [type(event) for event in restored] == [type(event) for event in events]
+    assert [event.to_row() for event in restored[:3]] == [event.to_row() for event in events[:3]]
+    assert restored[3] == events[3]
+    assert json.loads(pack(events[0]))[:3] == [BehaviorEvent.type_id, 's1', 100.0]
+
+
+def test_missing_trailing_fields_use_defaults():
+    row = json.dumps([ErrorEvent.type_id, 's1', 100.0, 'TypeError']).encode('utf-8')
+    event = unpack(row)
+    assert event.error_type == 'TypeError'
+    assert event.fix_attempts == 0 and event.fix_success is False
+
+
+def test_truncated_and_non_json_frames_stop_reading():
+    f = io.BytesIO()
+    write_frames(f, [{'id': 1}])
+    payload = pickle.dumps({'id': 2})
+    f.write(struct.pack('<II', len(payload), zlib.crc32(payload)) + payload)
+    f.seek(0)
+    assert [event for _, event in read_frames(f)] == [{'id': 1}]
+
+    f = io.BytesIO()
+    write_frames(f, [{'id': 1}, {'id': 2}])
+    f.truncate(len(f.getvalue()) - 3)
+    f.seek(0)
+    assert [event for _, event in read_frames(f)] == [{'id': 1}]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""文件导出：分批写入、断点续传与 csv/gzip 格式"""
+
+import csv
+import gzip
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from core.sqlite_analytics import SQLiteAnalytics
+
+DAY1 = datetime(2024, 3, 1, 10, 0).timestamp()
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    analytics.start_session('alice', 's1')
+    analytics.start_session('bob', 's2')
+    analytics.log_events(
+        [{'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CP', 'timestamp': DAY1 + index}
+         for index in range(5)] +
+        [{'type': 'error', 'session_id': 's2', 'error_type': 'NameError', 'error_line': 1,
+          'error_message': "name 'x' is not defined", 'timestamp': DAY1}]
+    )
+    return analytics
+
+
+def read_jsonl(path, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_json_export_keeps_the_legacy_layout_across_batches(analytics, tmp_path):
+    path = analytics.export_data(output_file=str(tmp_path / 'export.json'), batch_size=2)
+    with open(path, encoding='utf-8') as f:
+        exported = json.load(f)
+
+    assert exported['session_id'] is None
+    assert list(exported['data']) == ['user_sessions', 'learning_behaviors', 'code_operations',
+                                      'ai_interactions', 'error_analysis']
+    assert [row['behavior_code'] for row in exported['data']['learning_behaviors']] == ['CP'] * 5
+    assert exported['data']['code_operations'] == []
+    assert exported['data']['error_analysis'][0]['error_type'] == 'NameError'
+
+
+def test_jsonl_export_filters_and_compresses(analytics, tmp_path):
+    path = analytics.export_data(output_file=str(tmp_path / 'export.jsonl.gz'), fmt='jsonl',
+                                 compress=True, user_id='bob', batch_size=2)
+    records = read_jsonl(path, compress=True)
+    assert [(record['table'], record['data']['session_id']) for record in records] == [
+        ('user_sessions', 's2'), ('error_analysis', 's2'),
+    ]
+    assert not os.path.exists(path + '.progress.json')
+
+
+def test_interrupted_export_resumes_after_the_last_written_batch(analytics, tmp_path, monkeypatch):
+    output = str(tmp_path / 'export.jsonl')
+    original = SQLiteAnalytics._write_export_chunk
+    written = []
+
+    def fail_on_third_batch(handle, text, compress):
+        written.append(text)
+        original(handle, text, compress)
+        if len(written) == 3:
+            # 本批数据已写入文件，但进度尚未记录
+            raise OSError('disk full')
+
+    monkeypatch.setattr(SQLiteAnalytics, '_write_export_chunk', staticmethod(fail_on_third_batch))
+    with pytest.raises(OSError):
+        analytics.export_data(output_file=output, fmt='jsonl', batch_size=2)
+    assert os.path.exists(output + '.progress.json')
+
+    monkeypatch.setattr(SQLiteAnalytics, '_write_export_chunk', staticmethod(original))
+    analytics.export_data(output_file=output, fmt='jsonl', batch_size=2, resume=True)
+
+    records = read_jsonl(output)
+    ids = [(record['table'], record['data'].get('id', record['data']['session_id']))
+           for record in records]
+    assert len(ids) == len(set(ids)) == 2 + 5 + 1
+    assert not os.path.exists(output + '.progress.json')
+
+
+def test_csv_export_writes_one_file_per_table(analytics, tmp_path):
+    output = analytics.export_data(output_file=str(tmp_path / 'csv'), fmt='csv', batch_size=2)
+    assert sorted(os.listdir(output)) == ['ai_interactions.csv', 'code_operations.csv',
+                                          'error_analysis.csv', 'learning_behaviors.csv',
+                                          'user_sessions.csv']
+    with open(os.path.join(output, 'learning_behaviors.csv'), newline='', encoding='utf-8') as f:
+        table = list(csv.reader(f))
+    assert table[0][:3] == ['id', 'session_id', 'user_id']
+    assert [row[0] for row in table[1:]] == ['1', '2', '3', '4', '5']
+
+
+def test_resume_is_rejected_for_json(analytics, tmp_path):
+    with pytest.raises(ValueError):
+        analytics.export_data(output_file=str(tmp_path / 'export.json'), resume=True)
+
+
+def test_exports_omit_generated_columns(analytics, tmp_path):
+    assert 'data_line_number' in analytics.promoted_columns['learning_behaviors'].values()
+    path = analytics.export_data(output_file=str(tmp_path / 'export.jsonl'), fmt='jsonl')
+    for record in read_jsonl(path):
+        assert not any(column.startswith('data_') for column in record['data'])
+
+    _, columns, _ = next(analytics.iter_export_batches('learning_behaviors', include_promoted=True))
+    assert 'data_line_number' in columns
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Parquet 导出：按日期分区、列类型与 additional_data 键展开"""
+
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from core.sqlite_analytics import SQLiteAnalytics
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+DAY1 = datetime(2024, 3, 1, 10, 0).timestamp()
+DAY2 = datetime(2024, 3, 2, 10, 0).timestamp()
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    analytics.start_session('alice', 's1', start_time=DAY1)
+    analytics.log_events([
+        {'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CP', 'timestamp': DAY1,
+         'duration': 1.5, 'additional_data': {'line_number': 3, 'source': 'editor'}},
+        {'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CP', 'timestamp': DAY2,
+         'additional_data': {'line_number': 'n/a'}},
+        {'type': 'code', 'session_id': 's1', 'operation_type': 'run', 'code': 'print(1)',
+         'success': False, 'execution_time': 0.25, 'timestamp': DAY2},
+    ])
+    return analytics
+
+
+def test_tables_are_partitioned_by_day(analytics, tmp_path):
+    output = str(tmp_path / 'parquet')
+    result = analytics.export_parquet(output_dir=output, batch_size=1)
+
+    assert result['row_counts'] == {'user_sessions': 1, 'learning_behaviors': 2,
+                                    'code_operations': 1, 'ai_interactions': 0,
+                                    'error_analysis': 0}
+    assert sorted(os.listdir(os.path.join(output, 'learning_behaviors'))) == [
+        'date=2024-03-01', 'date=2024-03-02',
+    ]
+    with open(os.path.join(output, '_manifest.json'), encoding='utf-8') as f:
+        assert json.load(f)['file_count'] == result['file_count'] == 4
+
+
+def test_columns_are_typed_and_promoted_keys_expanded(analytics, tmp_path):
+    output = str(tmp_path / 'parquet')
+    analytics.export_parquet(output_dir=output)
+
+    behaviors = pd.read_parquet(os.path.join(output, 'learning_behaviors')).sort_values('id')
+    assert str(behaviors['timestamp'].dtype).startswith('datetime64')
+    assert behaviors['duration'].dtype == 'Float64'
+    # 无法转换为整数的值导出为空值，而不是让整列退化为字符串
+    assert behaviors['data_line_number'].dtype == 'Int64'
+    assert behaviors['data_line_number'].tolist()[0] == 3
+    assert behaviors['data_line_number'].isna().tolist() == [False, True]
+    assert behaviors['data_source'].tolist()[0] == 'editor'
+
+    code = pd.read_parquet(os.path.join(output, 'code_operations'))
+    assert code['success'].dtype == 'boolean' and not code['success'].iloc[0]
+    assert code['code_length'].tolist() == [len('print(1)')]
+
+
+def test_missing_generated_columns_are_parsed_from_json(tmp_path):
+    frame = SQLiteAnalytics._to_typed_frame(
+        pd, 'error_analysis', ['id', 'additional_data'],
+        [(1, json.dumps({'source': 'runtime'})), (2, 'not json')]
+    )
+    assert frame['data_source'].tolist()[0] == 'runtime'
+    assert frame['data_source'].isna().tolist() == [False, True]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""流式导出：分块编码、gzip 与中途出错时中断响应"""
+
+import gzip
+import json
+
+import pytest
+
+from core.sqlite_analytics import encode_export_stream, iter_export_chunks
+
+
+def fake_batches(rows_per_table):
+    def fetch_batches(table):
+        for start in range(0, rows_per_table, 2):
+            yield start, ['id'], [(index,) for index in range(start, min(start + 2, rows_per_table))]
+    return fetch_batches
+
+
+def test_stream_is_buffered_into_chunks_and_gzipped():
+    chunks = list(iter_export_chunks(['user_sessions'], 'jsonl', fake_batches(5)))
+    plain = list(encode_export_stream(iter(chunks), compress=False, chunk_bytes=64))
+    assert b''.join(plain).decode('utf-8') == ''.join(chunks)
+    assert len(plain) > 1
+
+    compressed = b''.join(encode_export_stream(iter(chunks), compress=True, chunk_bytes=64))
+    lines = gzip.decompress(compressed).decode('utf-8').splitlines()
+    assert [json.loads(line)['data']['id'] for line in lines] == [0, 1, 2, 3, 4]
+
+
+def test_error_during_stream_is_logged_and_reraised(caplog):
+    def failing_batches(table):
+        yield 0, ['id'], [(1,)]
+        raise RuntimeError('disk I/O error')
+
+    stream = encode_export_stream(
+        iter_export_chunks(['user_sessions'], 'jsonl', failing_batches), compress=True, chunk_bytes=1,
+        context='export.jsonl: tables=user_sessions'
+    )
+    received = [next(stream)]
+    with pytest.raises(RuntimeError, match='disk I/O error'):
+        received.extend(stream)
+    assert received
+    record, = [record for record in caplog.records if record.levelname == 'ERROR']
+    assert record.name == 'learning_analytics' and record.exc_info
+    assert record.getMessage() == (
+        f'Export stream aborted after {len(received[0])} bytes '
+        '(export.jsonl: tables=user_sessions): disk I/O error'
+    )
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""空闲检测：阈值、按检查点分段输出与会话结束时的最后一段"""
+
+import pytest
+
+from integrations.idle_tracker import IdleTracker
+
+T = 1_700_000_000.0
+
+
+@pytest.fixture
+def emitted():
+    return []
+
+
+@pytest.fixture
+def tracker(emitted):
+    tracker = IdleTracker(lambda code, **kwargs: emitted.append((code, kwargs)),
+                          threshold=60, checkpoint=300)
+    tracker.reset(now=T)
+    return tracker
+
+
+def test_short_pauses_are_not_idle(tracker, emitted):
+    tracker.tick(now=T + 59)
+    tracker.touch(now=T + 59)
+    tracker.flush(now=T + 100)
+    assert emitted == []
+
+
+def test_idle_period_is_reported_when_activity_resumes(tracker, emitted):
+    tracker.tick(now=T + 120)
+    assert emitted == []
+
+    tracker.touch(now=T + 150)
+    (code, event), = emitted
+    assert code == 'IO' and event['duration'] == 150 and event['timestamp'] == T
+    assert event['additional_data']['final'] is True
+    assert event['additional_data']['idle_total_seconds'] == 150
+
+
+def test_long_idle_periods_are_split_at_checkpoints(tracker, emitted):
+    for minute in range(1, 13):
+        tracker.tick(now=T + minute * 60)
+    tracker.touch(now=T + 740)
+
+    assert [(event['duration'], event['timestamp'], event['additional_data']['final'])
+            for _, event in emitted] == [
+        (300, T, False), (300, T + 300, False), (140, T + 600, True),
+    ]
+    # 各段之和即为整个空闲时长
+    assert sum(event['duration'] for _, event in emitted) == 740
+    assert {event['additional_data']['idle_total_seconds'] for _, event in emitted} == {300, 600, 740}
+
+    # 活动恢复后重新计时
+    tracker.tick(now=T + 740 + 299)
+    assert len(emitted) == 3
+
+
+def test_flush_closes_the_period_and_reset_discards_it(tracker, emitted):
+    tracker.tick(now=T + 300)
+    tracker.flush(now=T + 400)
+    assert [event['duration'] for _, event in emitted] == [300, 100]
+
+    tracker.reset(now=T + 1000)
+    tracker.flush(now=T + 1030)
+    assert len(emitted) == 2
+
+
+def test_emit_errors_are_swallowed():
+    def failing_emit(code, **kwargs):
+        raise RuntimeError('database closed')
+
+    tracker = IdleTracker(failing_emit, threshold=1, checkpoint=10)
+    tracker.reset(now=T)
+    tracker.touch(now=T + 5)
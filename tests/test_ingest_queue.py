@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""后端写入队列与磁盘缓冲：数据库忙时原地重试、隔离、关闭与重启重放"""
+
+import glob
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from backend import ingest_queue
+from backend.ingest_queue import IngestQueue
+from integrations.event_spool import EventSpool
+
+
+@pytest.fixture(autouse=True)
+def short_retry_delay(monkeypatch):
+    monkeypatch.setattr(ingest_queue, 'INGEST_RETRY_DELAYS', (0.01,))
+
+
+def make_batch(key):
+    return {'sessions': [], 'session_ends': [], 'key': key,
+            'events': [{'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CP'}]}
+
+
+class Database:
+    """记录写入的批次键；busy 次调用抛出数据库忙，键在 poison 中的批次总是抛出 error"""
+
+    def __init__(self, busy=0, poison=(), error=None):
+        self.busy = busy
+        self.poison = set(poison)
+        self.error = error or ValueError('bad batch')
+        self.keys = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batches):
+        with self.lock:
+            if self.busy:
+                self.busy -= 1
+                raise sqlite3.OperationalError('database is locked')
+            if any(batch['key'] in self.poison for batch in batches):
+                raise self.error
+            self.keys.extend(batch['key'] for batch in batches)
+            return [({}, False) for _ in batches]
+
+
+def test_busy_database_is_retried_in_place_and_not_replayed(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    database = Database(busy=5)
+    queue = IngestQueue(database, spool_dir=spool_dir)
+    for index in range(4):
+        queue.put(make_batch(f'k{index}'))
+    assert queue.flush(timeout=5)
+    assert queue.close(timeout=5)
+    assert database.keys == ['k0', 'k1', 'k2', 'k3']
+    assert queue.stats()['failed'] == 0
+
+    restarted = Database()
+    second = IngestQueue(restarted, spool_dir=spool_dir)
+    assert second.close(timeout=5)
+    assert second.replayed == 0 and restarted.keys == []
+
+
+def test_poison_batch_is_quarantined_without_blocking_the_lane(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    database = Database(poison={'k1'})
+    queue = IngestQueue(database, spool_dir=spool_dir)
+    for index in range(3):
+        queue.put(make_batch(f'k{index}'))
+    assert queue.close(timeout=5)
+    assert database.keys == ['k0', 'k2']
+    assert queue.stats()['quarantined'] == 1
+    assert len(glob.glob(os.path.join(spool_dir, 'lane-00', 'quarantine', '*.log'))) == 1
+
+    second = IngestQueue(Database(), spool_dir=spool_dir)
+    assert second.close(timeout=5)
+    assert second.replayed == 0
+
+
+@pytest.mark.parametrize('message', ['no such table: learning_behaviors', 'disk I/O error',
+                                     'database disk image is malformed'])
+def test_non_busy_operational_errors_are_quarantined_not_retried(tmp_path, message):
+    spool_dir = str(tmp_path / 'spool')
+    database = Database(poison={'k1'}, error=sqlite3.OperationalError(message))
+    queue = IngestQueue(database, spool_dir=spool_dir)
+    for index in range(3):
+        queue.put(make_batch(f'k{index}'))
+    assert queue.close(timeout=5)
+    assert database.keys == ['k0', 'k2']
+    assert queue.stats()['quarantined'] == 1
+
+
+def test_close_while_database_is_busy_keeps_batches_for_replay(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    database = Database(busy=10 ** 6)
+    queue = IngestQueue(database, spool_dir=spool_dir)
+    for index in range(3):
+        queue.put(make_batch(f'k{index}'))
+    assert not queue.close(timeout=5)
+    assert database.keys == []
+
+    restarted = Database()
+    second = IngestQueue(restarted, spool_dir=spool_dir)
+    assert second.close(timeout=5)
+    assert second.replayed == 3
+    assert restarted.keys == ['k0', 'k1', 'k2']
+
+
+def test_replay_keeps_segments_appended_during_replay(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    # 每次追加都切换到新分段
+    spool = EventSpool(spool_dir, segment_max_bytes=1)
+    spool.append([{'id': 'old-0'}])
+    spool.append([{'id': 'old-1'}])
+    spool.close()
+
+    restarted = EventSpool(spool_dir, segment_max_bytes=1)
+    replayed = []
+
+    def sink(events):
+        replayed.extend(event['id'] for event in events)
+        restarted.append([{'id': f'live-{len(replayed)}'}])
+
+    assert restarted.replay(sink, batch_size=1) == 2
+    restarted.close()
+    assert replayed == ['old-0', 'old-1']
+
+    reopened = EventSpool(spool_dir)
+    assert [event['id'] for _, event in reopened.pending()] == ['live-1', 'live-2']
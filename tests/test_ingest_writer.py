@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""多进程部署：写入进程的监听端与客户端、工作进程的只读数据库"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+from backend import ingest_queue
+from backend.ingest_queue import IngestQueue, IngestQueueFull
+from backend.ingest_writer import (IngestWriterClient, IngestWriterServer,
+                                   WRITER_UNAVAILABLE_RETRY_AFTER)
+from core.sharded_analytics import ShardedAnalytics
+from core.sqlite_analytics import SQLiteAnalytics
+
+AUTHKEY = b'test-key'
+
+
+@pytest.fixture(autouse=True)
+def short_retry_delay(monkeypatch):
+    monkeypatch.setattr(ingest_queue, 'INGEST_RETRY_DELAYS', (0.01,))
+
+
+@pytest.fixture
+def address():
+    if not hasattr(os, 'fork'):
+        pytest.skip('Unix sockets only')
+    # Unix 套接字路径有长度限制，不使用 tmp_path
+    directory = tempfile.mkdtemp(prefix='iw')
+    yield os.path.join(directory, 'writer.sock')
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    return SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+
+
+def rows(db_path, sql, params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def make_batch(key, session_id='s1'):
+    return {'sessions': [{'session_id': session_id, 'user_id': 'alice'}], 'session_ends': [],
+            'key': key, 'events': [{'type': 'behavior', 'session_id': session_id,
+                                    'behavior_code': 'CP'}]}
+
+
+@pytest.fixture
+def writer(analytics, address):
+    queue = IngestQueue(analytics.ingest_batches)
+    server = IngestWriterServer(queue, address, AUTHKEY)
+    server.start()
+    client = IngestWriterClient(address, AUTHKEY)
+    yield queue, server, client
+    client.close()
+    server.close()
+    queue.close(timeout=5)
+
+
+def test_batches_are_written_by_the_writer_process(analytics, writer):
+    queue, _, client = writer
+    assert client.put(make_batch('k1')) == 2
+    assert client.put(make_batch('k1')) == 2
+    assert queue.flush(timeout=5)
+
+    assert rows(analytics.db_path, 'SELECT user_id FROM user_sessions') == [('alice',)]
+    assert rows(analytics.db_path, 'SELECT COUNT(*) FROM learning_behaviors') == [(1,)]
+    stats = client.stats()
+    assert stats['duplicates'] == 1 and stats['writer'] == client.address
+
+
+def test_closed_queue_is_reported_as_full(writer):
+    queue, _, client = writer
+    queue.close(timeout=5)
+    with pytest.raises(IngestQueueFull):
+        client.put(make_batch('k1'))
+    assert client.retry_after() == queue.retry_after()
+
+
+def test_unknown_operations_are_errors(writer):
+    _, _, client = writer
+    assert client._call(('drop',)) == ('error', "unknown operation 'drop'")
+
+
+def test_close_right_after_a_connection_does_not_hang(analytics, address):
+    queue = IngestQueue(analytics.ingest_batches)
+    for _ in range(20):
+        server = IngestWriterServer(queue, address, AUTHKEY)
+        server.start()
+        client = IngestWriterClient(address, AUTHKEY)
+        client.stats()
+        server.close()
+        client.close()
+    # 未启动的监听端直接关闭
+    IngestWriterServer(queue, address, AUTHKEY).close()
+    assert queue.close(timeout=5)
+
+
+def test_unavailable_writer_is_reported_as_full(address):
+    client = IngestWriterClient(address, AUTHKEY)
+    with pytest.raises(IngestQueueFull, match='unavailable'):
+        client.put(make_batch('k1'))
+    assert client.retry_after() == WRITER_UNAVAILABLE_RETRY_AFTER
+
+
+def test_client_reconnects_after_the_writer_restarts(analytics, address):
+    queue = IngestQueue(analytics.ingest_batches)
+    client = IngestWriterClient(address, AUTHKEY)
+    for key in ('k1', 'k2'):
+        server = IngestWriterServer(queue, address, AUTHKEY)
+        server.start()
+        try:
+            client.put(make_batch(key))
+        finally:
+            server.close()
+            client._discard()
+    assert queue.close(timeout=5)
+    assert rows(analytics.db_path, 'SELECT COUNT(*) FROM ingest_batches') == [(2,)]
+
+
+def test_worker_opens_the_database_read_only(analytics, writer):
+    queue, _, client = writer
+    client.put(make_batch('k1'))
+    assert queue.flush(timeout=5)
+    version = rows(analytics.db_path, 'PRAGMA user_version')
+
+    worker = SQLiteAnalytics(db_path=analytics.db_path, readonly=True, promoted_keys={
+        'learning_behaviors': {'line_number': 'INTEGER', 'extra_key': 'TEXT'},
+    })
+    # 只识别已有的生成列，不新建
+    assert worker.promoted_columns['learning_behaviors'] == {'line_number': 'data_line_number'}
+    assert worker.search_enabled == analytics.search_enabled
+    assert rows(analytics.db_path, 'PRAGMA user_version') == version
+    assert 'data_extra_key' not in analytics.base_columns('learning_behaviors') + [
+        row[1] for row in rows(analytics.db_path, 'PRAGMA table_xinfo(learning_behaviors)')]
+
+    assert worker.get_overview_stats(7)['session_stats']['total_sessions'] == 1
+    assert worker.query_events('learning_behaviors', session_id='s1')[0]['behavior_code'] == 'CP'
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        worker.start_session('mallory', 's2')
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        with worker.connect(readonly=False) as conn:
+            conn.execute("DELETE FROM user_sessions")
+
+
+def test_worker_requires_an_initialized_database(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        SQLiteAnalytics(db_path=str(tmp_path / 'missing' / 'analytics.db'), readonly=True)
+    assert not os.path.exists(tmp_path / 'missing')
+
+    sqlite3.connect(str(tmp_path / 'empty.db')).close()
+    with pytest.raises(RuntimeError, match='not initialized'):
+        SQLiteAnalytics(db_path=str(tmp_path / 'empty.db'), readonly=True)
+
+
+def test_sharded_worker_opens_every_shard_read_only(tmp_path):
+    ShardedAnalytics(data_dir=str(tmp_path), num_shards=2)
+    worker = ShardedAnalytics(data_dir=str(tmp_path), num_shards=2, readonly=True)
+    assert all(shard.readonly for shard in worker.shards)
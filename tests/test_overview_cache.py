@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""总体统计缓存：最短使用时长、写入水位、最长使用时长、ETag 与 If-None-Match"""
+
+import pytest
+
+from backend import overview_cache
+from backend.overview_cache import OverviewCache, etag_matches, make_etag
+from core.sqlite_analytics import SQLiteAnalytics
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(overview_cache.time, 'time', clock)
+    return clock
+
+
+class Source:
+    """统计结果为 {'days', 'version'}；记录计算次数"""
+
+    def __init__(self):
+        self.version = 1
+        self.calls = []
+
+    def compute(self, days):
+        self.calls.append(days)
+        return {'days': days, 'version': self.version}
+
+    def watermark(self):
+        return self.version
+
+
+@pytest.fixture
+def source():
+    return Source()
+
+
+@pytest.fixture
+def cache(source, clock):
+    return OverviewCache(source.compute, source.watermark, min_age=5, ttl=60, refresh_interval=0)
+
+
+def test_results_are_reused_while_the_watermark_is_unchanged(cache, source, clock):
+    overview, etag, age = cache.get(7)
+    assert overview == {'days': 7, 'version': 1} and age == 0
+    clock.now += 30
+    assert cache.get(7) == (overview, etag, 30)
+    assert source.calls == [7]
+    assert cache.stats() == {'entries': 1, 'windows': [7], 'hits': 1, 'misses': 1, 'refreshes': 1}
+
+
+def test_writes_invalidate_after_the_minimum_age(cache, source, clock):
+    _, etag, _ = cache.get(7)
+    source.version = 2
+    # 最短使用时长内不检查水位
+    clock.now += 4
+    assert cache.get(7)[1] == etag and source.calls == [7]
+
+    clock.now += 1
+    overview, new_etag, age = cache.get(7)
+    assert overview['version'] == 2 and new_etag != etag and age == 0
+    assert source.calls == [7, 7]
+
+
+def test_results_expire_after_the_ttl(cache, source, clock):
+    _, etag, _ = cache.get(7)
+    clock.now += 60
+    # 数据未变化：重新计算得到相同的 ETag
+    assert cache.get(7)[1] == etag
+    assert source.calls == [7, 7]
+
+
+def test_windows_are_cached_separately_and_evicted_lru(source, clock):
+    cache = OverviewCache(source.compute, source.watermark, refresh_interval=0, max_entries=2)
+    cache.get(1)
+    cache.get(7)
+    cache.get(1)
+    cache.get(30)
+    assert cache.stats()['windows'] == [1, 30]
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+
+
+def test_etag_is_a_stable_content_hash():
+    assert make_etag({'a': 1, 'b': [1, 2]}) == make_etag({'b': [1, 2], 'a': 1})
+    assert make_etag({'a': 1}) != make_etag({'a': 2})
+    etag = make_etag({'a': 1})
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('"xyz"', False),
+    ('abc', False),
+    ('*', True),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+def test_data_version_tracks_writes_from_other_connections(tmp_path, clock):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    writer = SQLiteAnalytics(db_path=analytics.db_path)
+    writer.start_session('alice', 's1')
+    cache = OverviewCache(analytics.get_overview_stats, analytics.data_version, refresh_interval=0)
+
+    overview, etag, _ = cache.get(7)
+    clock.now += 10
+    assert cache.get(7)[1] == etag
+
+    writer.log_behavior('s1', 'CP')
+    clock.now += 10
+    assert cache.get(7)[1] != etag
+    assert cache.stats()['refreshes'] == 2
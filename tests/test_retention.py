@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""数据保留：按月归档、删除原始行与全文索引、归档修复与增量 VACUUM"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from core.analytics_retention import RetentionManager
+from core.code_snapshots import SnapshotEncoder
+from core.sqlite_analytics import SQLiteAnalytics
+
+NOW = datetime(2025, 6, 1)
+OLD = datetime(2024, 3, 1, 10, 0)
+RECENT = datetime(2025, 5, 20, 10, 0)
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    analytics.start_session('alice', 's1')
+    return analytics
+
+
+def rows(analytics, sql, params=()):
+    with sqlite3.connect(analytics.db_path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def error(message, timestamp):
+    return {'type': 'error', 'session_id': 's1', 'error_type': 'NameError', 'error_line': 1,
+            'error_message': message, 'timestamp': timestamp}
+
+
+def test_expired_rows_are_archived_by_month_and_removed(analytics, tmp_path):
+    analytics.log_events([
+        {'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CP', 'timestamp': RECENT},
+        {'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CR', 'timestamp': RECENT},
+        {'type': 'behavior', 'session_id': 's1', 'behavior_code': 'CR', 'timestamp': OLD},
+        error('old failure', OLD),
+        error('recent failure', RECENT),
+    ])
+    before = rows(analytics, 'SELECT * FROM session_rollups ORDER BY category, dim')
+
+    retention = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive'),
+                                 behavior_retention_days={'CP': 7}, batch_size=1)
+    archived = retention.archive_expired(now=NOW)
+
+    assert archived['learning_behaviors'] == 2 and archived['error_analysis'] == 1
+    assert rows(analytics, 'SELECT behavior_code FROM learning_behaviors') == [('CR',)]
+    assert rows(analytics, 'SELECT error_message FROM error_analysis') == [('recent failure',)]
+    # 汇总表不受归档影响
+    assert rows(analytics, 'SELECT * FROM session_rollups ORDER BY category, dim') == before
+
+    assert {(a['table'], a['month'], a['row_count']) for a in retention.list_archives()} == {
+        ('learning_behaviors', '2024-03', 1), ('learning_behaviors', '2025-05', 1),
+        ('error_analysis', '2024-03', 1),
+    }
+    records = list(retention.iter_archive('error_analysis', session_id='s1'))
+    assert [record['error_message'] for record in records] == ['old failure']
+    assert not any(column.startswith('data_') for column in records[0])
+    assert retention.archive_expired(now=NOW) == dict.fromkeys(retention.retention_days, 0)
+
+
+def test_archived_rows_are_removed_from_search(analytics, tmp_path):
+    if not analytics.search_enabled:
+        pytest.skip('SQLite built without FTS5')
+    analytics.log_events([
+        error('undefined name foo', OLD),
+        error('undefined name bar', RECENT),
+        {'type': 'ai', 'session_id': 's1', 'interaction_type': 'question',
+         'question': 'why is foo undefined', 'response': 'foo was never assigned',
+         'timestamp': OLD},
+    ])
+    assert analytics.search('foo')['total'] == 3
+
+    RetentionManager(analytics, archive_dir=str(tmp_path / 'archive')).archive_expired(now=NOW)
+
+    assert analytics.search('foo') == {'total': 0, 'results': []}
+    assert [r['content'] for r in analytics.search('undefined')['results']] == ['undefined name bar']
+    assert rows(analytics, 'SELECT COUNT(*) FROM event_search') == [(1,)]
+
+
+def save(encoder, file_key, code, timestamp):
+    return {'type': 'code', 'session_id': 's1', 'operation_type': 'save',
+            'snapshot': encoder.encode(file_key, code), 'timestamp': timestamp}
+
+
+def test_snapshot_retention_keeps_delta_chains_restorable(analytics, tmp_path):
+    encoder = SnapshotEncoder(rebase_every=2)
+    versions = [''.join(f'line {n}\n' for n in range(count)) for count in range(20, 26)]
+    # main.py：版本 1 基准 + 2、3 差异 | 4 基准 + 5、6 差异，从版本 3 起未过期
+    # old.py：全部过期
+    analytics.log_events(
+        [save(encoder, 'main.py', code, OLD if seq < 3 else RECENT)
+         for seq, code in enumerate(versions, 1)] +
+        [save(encoder, 'old.py', code, OLD) for code in versions[:3]]
+    )
+    assert [row[0] for row in rows(analytics, """
+        SELECT seq FROM code_snapshots WHERE file_key = 'main.py' AND content IS NOT NULL
+    """)] == [1, 4]
+
+    archived = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive')).archive_expired(now=NOW)
+
+    # 版本 1、2 已过期，但版本 3 依赖它们
+    assert archived['code_snapshots'] == 3
+    history = analytics.get_code_history('s1')
+    assert list(history) == ['main.py']
+    assert [version['code'] for version in history['main.py']] == versions
+
+    # 版本 3 也过期后整条差异链一起归档，之后的版本从基准 4 开始仍可还原
+    with sqlite3.connect(analytics.db_path) as conn:
+        conn.execute("UPDATE code_snapshots SET timestamp = ? WHERE seq = 3", (OLD,))
+    archived = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive')).archive_expired(now=NOW)
+    assert archived['code_snapshots'] == 3
+    assert [(version['seq'], version['code']) for version in analytics.get_code_history('s1')['main.py']] \
+        == [(seq, versions[seq - 1]) for seq in (4, 5, 6)]
+
+
+def test_uncommitted_archive_data_is_truncated(analytics, tmp_path):
+    analytics.log_events([error('first', OLD)])
+    retention = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive'))
+    retention.archive_expired(now=NOW)
+    path = retention.archive_path('error_analysis', '2024-03')
+    committed = os.path.getsize(path)
+
+    # 模拟写入归档后、删除原始行前中断：文件中残留未登记的数据
+    with open(path, 'ab') as f:
+        f.write(b'partial gzip member')
+    RetentionManager(analytics, archive_dir=str(tmp_path / 'archive'))
+    assert os.path.getsize(path) == committed
+
+    analytics.log_events([error('second', OLD)])
+    retention.archive_expired(now=NOW)
+    assert [r['error_message'] for r in retention.iter_archive('error_analysis')] == ['first', 'second']
+
+
+def test_compact_never_runs_a_full_vacuum(tmp_path, caplog):
+    db_path = str(tmp_path / 'legacy.db')
+    # 旧数据库：建表时未启用 auto_vacuum
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('CREATE TABLE legacy (value TEXT)')
+    analytics = SQLiteAnalytics(db_path=db_path)
+    retention = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive'))
+
+    retention.compact()
+    retention.compact()
+    assert rows(analytics, 'PRAGMA auto_vacuum') == [(0,)]
+    assert caplog.text.count('Incremental auto_vacuum is off') == 1
+
+    retention.vacuum_full()
+    assert rows(analytics, 'PRAGMA auto_vacuum') == [(2,)]
+    retention.compact()
+
+
+def test_new_databases_use_incremental_vacuum(analytics, tmp_path):
+    assert rows(analytics, 'PRAGMA auto_vacuum') == [(2,)]
+    analytics.log_events([error('x' * 2000, OLD) for _ in range(200)])
+    retention = RetentionManager(analytics, archive_dir=str(tmp_path / 'archive'))
+    retention.archive_expired(now=NOW)
+    assert rows(analytics, 'PRAGMA freelist_count')[0][0] > 0
+
+    retention.compact()
+    assert rows(analytics, 'PRAGMA freelist_count') == [(0,)]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""全文检索：索引行指向原始事件、过滤条件、分页与未编译 FTS5 时的 LIKE 查询"""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from core.sqlite_analytics import SQLiteAnalytics, segment_search_text
+
+DAY1 = datetime(2024, 3, 1, 10, 0)
+DAY2 = datetime(2024, 3, 2, 10, 0)
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    if not analytics.search_enabled:
+        pytest.skip('SQLite built without FTS5')
+    analytics.start_session('alice', 's1')
+    analytics.start_session('bob', 's2')
+    analytics.log_events([
+        {'type': 'ai', 'session_id': 's1', 'interaction_type': 'question',
+         'question': '什么是列表推导式', 'response': 'A list comprehension builds a list',
+         'timestamp': DAY1},
+        {'type': 'error', 'session_id': 's1', 'error_type': 'IndexError', 'error_line': 2,
+         'error_message': 'list index out of range', 'timestamp': DAY1},
+        {'type': 'ai', 'session_id': 's2', 'interaction_type': 'question',
+         'question': 'how do I sort a list', 'response': None, 'timestamp': DAY2},
+        {'type': 'error', 'session_id': 's2', 'error_type': 'NameError', 'error_line': 1,
+         'error_message': "name 'lst' is not defined", 'timestamp': DAY2},
+    ])
+    return analytics
+
+
+def source_text(analytics, result):
+    column = {'question': "json_extract(additional_data, '$.question_preview')",
+              'response': "json_extract(additional_data, '$.response_preview')",
+              'error': 'error_message'}[result['kind']]
+    with sqlite3.connect(analytics.db_path) as conn:
+        return conn.execute(f"SELECT {column} FROM {result['source_table']} WHERE id = ?",
+                            (result['source_id'],)).fetchone()[0]
+
+
+def test_every_result_points_at_its_source_row(analytics):
+    results = analytics.search('list', limit=10)['results']
+    assert sorted((r['source_table'], r['kind']) for r in results) == [
+        ('ai_interactions', 'question'), ('ai_interactions', 'response'),
+        ('error_analysis', 'error'),
+    ]
+    for result in results:
+        assert source_text(analytics, result) == result['content']
+
+
+def test_filters_and_pagination(analytics):
+    assert analytics.search('list', user_id='bob')['total'] == 1
+    assert analytics.search('list', kind='error')['results'][0]['user_id'] == 'alice'
+    assert analytics.search('list', start_time=DAY2)['total'] == 1
+    assert analytics.search('list', end_time=DAY2)['total'] == 2
+
+    first = analytics.search('list', limit=2)
+    rest = analytics.search('list', limit=2, offset=2)
+    assert first['total'] == rest['total'] == 3
+    assert len(first['results']) == 2 and len(rest['results']) == 1
+
+    assert analytics.search('   ') == {'total': 0, 'results': []}
+
+
+def test_cjk_text_is_matched_by_characters_and_prefixes(analytics):
+    assert segment_search_text('列表ab').split() == ['列', '表', 'ab']
+    assert [r['content'] for r in analytics.search('推导')['results']] == ['什么是列表推导式']
+    assert analytics.search('comprehen')['results'][0]['kind'] == 'response'
+    assert analytics.search('列表 sort')['total'] == 0
+
+
+def test_like_fallback_searches_the_event_tables(analytics):
+    analytics.search_enabled = False
+    results = analytics.search('defined')['results']
+    assert [(r['source_table'], r['content']) for r in results] == [
+        ('error_analysis', "name 'lst' is not defined"),
+    ]
+    assert analytics.search('sort', kind='question')['total'] == 1
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""分片存储：按学生路由、跨分片批量写入、合并统计、跨分片检索与导出"""
+
+import csv
+import io
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.sharded_analytics import ShardedAnalytics
+from core.sqlite_analytics import SQLiteAnalytics
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    sharded = ShardedAnalytics(data_dir=str(tmp_path / 'shards'), num_shards=3)
+    yield sharded
+    sharded.close()
+
+
+@pytest.fixture
+def users(sharded):
+    """三个分别位于不同分片的学生"""
+    found = {}
+    for index in range(100):
+        found.setdefault(sharded.shard_index(f'user{index}'), f'user{index}')
+    assert len(found) == 3
+    return [found[index] for index in range(3)]
+
+
+def count(shard, table, session_id=None):
+    with sqlite3.connect(shard.db_path) as conn:
+        if session_id is None:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE session_id = ?',
+                            (session_id,)).fetchone()[0]
+
+
+def error(session_id, message, timestamp):
+    return {'type': 'error', 'session_id': session_id, 'error_type': 'NameError',
+            'error_line': 1, 'error_message': message, 'timestamp': timestamp}
+
+
+def test_sessions_and_events_stay_on_the_students_shard(sharded, users):
+    for user in users:
+        sharded.start_session(user, f'session-{user}')
+    sharded.log_events([{'type': 'behavior', 'session_id': f'session-{user}',
+                         'behavior_code': 'CP'} for user in users])
+    sharded.log_behavior(f'session-{users[0]}', 'CR')
+
+    for index, user in enumerate(users):
+        for shard_index, shard in enumerate(sharded.shards):
+            expected = (2 if index == 0 else 1) if shard_index == index else 0
+            assert count(shard, 'learning_behaviors', f'session-{user}') == expected
+    assert sharded.get_session_stats(f'session-{users[0]}')['session_info'][4] == 2
+
+
+def test_sessions_created_by_another_process_are_located(sharded, users, tmp_path):
+    sharded.start_session(users[1], 'shared-session')
+    other = ShardedAnalytics(data_dir=str(tmp_path / 'shards'), num_shards=3)
+    try:
+        assert other.shard_for_session('shared-session') is other.shards[1]
+        # 未知会话与单库时一样记为匿名用户
+        assert other.shard_for_session('unknown') is other.shard_for_user(None)
+    finally:
+        other.close()
+
+
+def test_batches_are_split_per_shard_and_deduplicated(sharded, users):
+    batch = {
+        'sessions': [{'session_id': f'b-{user}', 'user_id': user} for user in users],
+        'events': [error(f'b-{user}', 'oops', NOW) for user in users],
+        'key': 'batch-1',
+    }
+    (counts, duplicate), = sharded.ingest_batches([batch])
+    assert counts['error'] == 3 and not duplicate
+    assert [count(shard, 'error_analysis') for shard in sharded.shards] == [1, 1, 1]
+
+    assert sharded.ingest_batch(batch['sessions'], batch['events'], [], 'batch-1')[1] is True
+    assert [count(shard, 'error_analysis') for shard in sharded.shards] == [1, 1, 1]
+
+    # 某个分片未写入时，重发的批次只在该分片写入（其余分片返回首次写入时的计数）
+    with sqlite3.connect(sharded.shards[2].db_path) as conn:
+        conn.execute("DELETE FROM ingest_batches")
+    counts, duplicate = sharded.ingest_batch(batch['sessions'], batch['events'], [], 'batch-1')
+    assert counts['error'] == 3 and not duplicate
+    assert [count(shard, 'error_analysis') for shard in sharded.shards] == [1, 1, 2]
+
+
+def test_overview_matches_a_single_database(sharded, users, tmp_path):
+    single = SQLiteAnalytics(db_path=str(tmp_path / 'single.db'))
+    events = []
+    for day, user in enumerate(users):
+        events += [
+            {'type': 'behavior', 'session_id': f'o-{user}', 'behavior_code': 'CP',
+             'duration': 1.0 + day, 'timestamp': NOW - timedelta(days=day)},
+            {'type': 'code', 'session_id': f'o-{user}', 'operation_type': 'run',
+             'code': 'x' * (day + 1), 'success': day % 2 == 0, 'execution_time': 0.1,
+             'timestamp': NOW - timedelta(days=day)},
+        ]
+    for target in (sharded, single):
+        for user in users:
+            target.start_session(user, f'o-{user}')
+        target.log_events(events)
+
+    merged = sharded.get_overview_stats(days=7)
+    expected = single.get_overview_stats(days=7)
+    for result in (merged, expected):
+        result.pop('generated_at', None)
+    assert merged == expected
+
+
+def test_search_merges_shards_by_time(sharded, users):
+    if not sharded.shards[0].search_enabled:
+        pytest.skip('SQLite built without FTS5')
+    for age, user in enumerate(users):
+        sharded.start_session(user, f's-{user}')
+        sharded.log_events([error(f's-{user}', f'undefined name v{age}', NOW - timedelta(hours=age))])
+
+    result = sharded.search('undefined', limit=2)
+    assert result['total'] == 3
+    assert [row['content'] for row in result['results']] == ['undefined name v0', 'undefined name v1']
+    assert [row['content'] for row in sharded.search('undefined', limit=2, offset=2)['results']] == [
+        'undefined name v2',
+    ]
+    assert [row['user_id'] for row in sharded.search('undefined', user_id=users[1])['results']] == [
+        users[1],
+    ]
+
+
+def test_stream_export_reads_every_shard(sharded, users):
+    for user in users:
+        sharded.start_session(user, f'e-{user}')
+
+    lines = ''.join(sharded.stream_export(tables=['user_sessions'])).splitlines()
+    assert sorted(json.loads(line)['data']['user_id'] for line in lines) == sorted(users)
+
+    table = list(csv.reader(io.StringIO(''.join(sharded.stream_export(['user_sessions'], 'csv')))))
+    assert table[0][0] == 'session_id' and len(table) == 1 + len(users)
+
+    only = ''.join(sharded.stream_export(tables=['user_sessions'], user_id=users[2])).splitlines()
+    assert [json.loads(line)['data']['session_id'] for line in only] == [f'e-{users[2]}']
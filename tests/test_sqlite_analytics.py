@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""批量写入：汇总表、全文检索行 ID、批次幂等键、会话补全与无效事件"""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from core import sqlite_analytics
+from core.sqlite_analytics import SQLiteAnalytics, get_analytics, invalid_event_reason
+
+DAY1 = datetime(2024, 3, 1, 10, 0).timestamp()
+DAY2 = datetime(2024, 3, 2, 10, 0).timestamp()
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'))
+    analytics.start_session('alice', 's1')
+    analytics.start_session('bob', 's2')
+    return analytics
+
+
+def rows(analytics, sql, params=()):
+    with sqlite3.connect(analytics.db_path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def behavior(session_id, code, timestamp, duration=None):
+    return {'type': 'behavior', 'session_id': session_id, 'behavior_code': code,
+            'timestamp': timestamp, 'duration': duration}
+
+
+def test_log_events_maintains_session_and_user_day_rollups(analytics):
+    counts = analytics.log_events([
+        behavior('s1', 'CP', DAY1, 2.0),
+        behavior('s1', 'CP', DAY2, 4.0),
+        behavior('s2', 'CR', DAY1),
+        {'type': 'code', 'session_id': 's1', 'operation_type': 'run', 'code': 'print(1)\nx = 2',
+         'success': False, 'execution_time': 0.5, 'timestamp': DAY1},
+    ])
+    assert counts == {'behavior': 3, 'code': 1, 'ai': 0, 'error': 0, 'skipped': 0}
+
+    assert rows(analytics, '''
+        SELECT session_id, category, dim, event_count, success_count, time_sum, time_count, size_sum
+        FROM session_rollups ORDER BY session_id, category, dim
+    ''') == [
+        ('s1', 'behavior', 'CP', 2, 0, 6.0, 2, 0),
+        ('s1', 'code', 'run', 1, 0, 0.5, 1, len('print(1)\nx = 2')),
+        ('s2', 'behavior', 'CR', 1, 0, 0.0, 0, 0),
+    ]
+    assert rows(analytics, '''
+        SELECT user_id, day, dim, event_count FROM user_day_rollups
+        WHERE category = 'behavior' ORDER BY user_id, day
+    ''') == [
+        ('alice', '2024-03-01', 'CP', 1),
+        ('alice', '2024-03-02', 'CP', 1),
+        ('bob', '2024-03-01', 'CR', 1),
+    ]
+    # 汇总表与明细表一致
+    assert rows(analytics, "SELECT SUM(event_count) FROM session_rollups WHERE category = 'behavior'") == \
+        rows(analytics, 'SELECT COUNT(*) FROM learning_behaviors')
+    assert analytics.get_session_stats('s1')['session_info'][4] == 2
+
+
+def test_search_rows_point_at_the_inserted_events(analytics):
+    if not analytics.search_enabled:
+        pytest.skip('SQLite built without FTS5')
+    analytics.log_error_analysis('s1', 'NameError', 1, "name 'foo' is not defined")
+    analytics.log_events([
+        {'type': 'error', 'session_id': 's1', 'error_type': 'TypeError', 'error_line': 2,
+         'error_message': 'unsupported operand type'},
+        {'type': 'error', 'session_id': 's2', 'error_type': 'KeyError', 'error_line': 3,
+         'error_message': None},
+        {'type': 'error', 'session_id': 's2', 'error_type': 'IndexError', 'error_line': 4,
+         'error_message': 'list index out of range 列表越界'},
+    ])
+
+    for query, expected in (('foo', "name 'foo' is not defined"),
+                            ('operand', 'unsupported operand type'),
+                            ('越界', 'list index out of range 列表越界')):
+        results = analytics.search(query)['results']
+        assert [result['content'] for result in results] == [expected]
+        source_id = results[0]['source_id']
+        assert rows(analytics, 'SELECT error_message FROM error_analysis WHERE id = ?',
+                    (source_id,)) == [(expected,)]
+
+
+def test_ingest_batches_skips_repeated_idempotency_keys(analytics):
+    batch = {
+        'sessions': [{'session_id': 's3', 'user_id': 'carol', 'timestamp': DAY1}],
+        'events': [behavior('s3', 'CP', DAY1), behavior('s3', 'SV', DAY1)],
+        'session_ends': [{'session_id': 's3', 'timestamp': DAY2}],
+        'key': 'batch-1',
+    }
+    results = analytics.ingest_batches([batch, dict(batch)])
+    assert results[0] == ({'behavior': 2, 'code': 0, 'ai': 0, 'error': 0, 'skipped': 0}, False)
+    assert results[1] == (results[0][0], True)
+    assert analytics.ingest_batch(batch['sessions'], batch['events'], batch['session_ends'],
+                                  'batch-1') == (results[0][0], True)
+
+    assert rows(analytics, "SELECT COUNT(*) FROM learning_behaviors WHERE session_id = 's3'") == [(2,)]
+    assert rows(analytics, "SELECT SUM(event_count) FROM session_rollups WHERE session_id = 's3'") == [(2,)]
+    # 没有幂等键的批次每次都写入
+    analytics.ingest_batches([{'events': [behavior('s3', 'CP', DAY2)]}] * 2)
+    assert rows(analytics, "SELECT COUNT(*) FROM learning_behaviors WHERE session_id = 's3'") == [(4,)]
+
+
+def test_repeated_session_start_does_not_change_the_owner(analytics):
+    analytics.ingest_batches([{'sessions': [{'session_id': 's1', 'user_id': 'mallory'}],
+                               'events': [behavior('s1', 'CP', DAY1)], 'key': 'b1'}])
+    assert rows(analytics, "SELECT user_id FROM user_sessions WHERE session_id = 's1'") == [('alice',)]
+    assert rows(analytics, "SELECT DISTINCT user_id FROM user_day_rollups") == [('alice',)]
+
+
+def test_repeated_session_start_fills_missing_columns(analytics):
+    analytics.start_session(None, 's3', device_label='laptop')
+    analytics.ingest_batches([{'sessions': [{'session_id': 's3', 'user_id': 'carol',
+                                             'device_label': 'desktop'}]}])
+    analytics.start_session('mallory', 's3')
+    assert rows(analytics, "SELECT user_id, platform FROM user_sessions WHERE session_id = 's3'") \
+        == [('carol', 'laptop')]
+
+
+@pytest.mark.parametrize('event, reason', [
+    ({'type': 'click', 'session_id': 's1'}, "unknown type 'click'"),
+    ({'type': 'behavior', 'behavior_code': 'CP'}, 'missing session_id'),
+    ({'type': 'code', 'session_id': 's1'}, 'missing or invalid operation_type'),
+    ({'type': 'error', 'session_id': 's1', 'error_type': 7}, 'missing or invalid error_type'),
+    ({'type': 'behavior', 'session_id': 's1', 'behavior_code': 'ZZ'}, "unknown behavior_code 'ZZ'"),
+    (behavior('s1', 'CP', 'yesterday'), 'invalid timestamp'),
+    (behavior('s1', 'CP', DAY1), None),
+])
+def test_invalid_event_reason(event, reason):
+    assert invalid_event_reason(event) == reason
+
+
+def test_skipped_events_are_counted_and_logged(analytics, caplog):
+    counts = analytics.log_events([
+        behavior('s1', 'ZZ', DAY1), behavior('s1', 'ZZ', DAY1),
+        behavior('s1', 'CP', 'yesterday'), behavior('s1', 'CP', DAY1),
+    ])
+    assert counts['behavior'] == 1 and counts['skipped'] == 3
+    warnings = [record.getMessage() for record in caplog.records if record.levelname == 'WARNING']
+    assert warnings == ["Skipped 3 invalid events: invalid timestamp x1; unknown behavior_code 'ZZ' x2"]
+
+
+@pytest.mark.parametrize('timestamp', [True, float('nan'), float('inf'), 1e20, 'yesterday', [1]])
+def test_invalid_timestamps_are_skipped(analytics, timestamp):
+    counts = analytics.log_events([behavior('s1', 'CP', timestamp), behavior('s1', 'CP', DAY1)])
+    assert counts['behavior'] == 1 and counts['skipped'] == 1
+
+    counts, duplicate = analytics.ingest_batch([], [behavior('s2', 'CR', timestamp)], [], 'bad-ts')
+    assert counts['skipped'] == 1 and not duplicate
+    assert rows(analytics, "SELECT COUNT(*) FROM learning_behaviors WHERE session_id = 's2'") == [(0,)]
+
+
+def test_valid_timestamp_forms_are_stored(analytics):
+    analytics.log_events([
+        behavior('s1', 'CP', DAY1),
+        behavior('s1', 'CP', '2024-03-01T11:00:00'),
+        behavior('s1', 'CP', datetime(2024, 3, 1, 12, 0)),
+    ])
+    stored = [datetime.fromisoformat(value) for value, in rows(
+        analytics, 'SELECT timestamp FROM learning_behaviors ORDER BY timestamp')]
+    assert [value.hour for value in stored] == [10, 11, 12]
+
+
+def test_invalid_promoted_keys_are_skipped_with_a_warning(tmp_path, caplog):
+    analytics = SQLiteAnalytics(db_path=str(tmp_path / 'analytics.db'), promoted_keys={
+        'learning_behaviors': {'line_number': 'INTEGER', 'bad key': 'TEXT', 'source': 'BLOB'},
+    })
+    assert analytics.promoted_columns['learning_behaviors'] == {'line_number': 'data_line_number'}
+    assert 'bad key' in caplog.text and 'source' in caplog.text
+
+    analytics.start_session('alice', 's1')
+    analytics.log_behavior('s1', 'CP', additional_data={'line_number': 7, 'source': 'editor'})
+    assert analytics.json_field('learning_behaviors', 'source') == "json_extract(additional_data, '$.source')"
+    assert [event['behavior_code'] for event in analytics.query_events(
+        'learning_behaviors', line_number=7, source='editor')] == ['CP']
+
+
+def test_default_analytics_is_created_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sqlite_analytics, '_default_analytics', None)
+    assert not hasattr(sqlite_analytics, 'analytics')
+    assert not (tmp_path / 'data').exists()
+
+    analytics = get_analytics()
+    assert get_analytics() is analytics
+    assert (tmp_path / 'data' / 'learning_analytics.db').exists()
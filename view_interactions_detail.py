@@ -14,6 +14,8 @@ import os
 import sqlite3
 from datetime import datetime, timedelta
 
+from core.db_connection import read_snapshot
+
 # Windows 控制台编码修复
 if sys.platform == "win32" and hasattr(sys.stdout, "buffer"):
     try:
@@ -46,6 +48,20 @@ def get_db_path(cli_path: str = None) -> str:
     return candidates[0]
 
 
+def json_field(cur, table: str, alias: str, key: str) -> str:
+    """
+    返回读取 additional_data 中某个键的 SQL 表达式
+
+    数据库已创建 data_<键> 生成列（带索引）时直接使用该列，
+    否则退回逐行解析 JSON 的 json_extract。
+    """
+    cur.execute(f"PRAGMA table_xinfo({table})")
+    columns = {row[1] for row in cur.fetchall()}
+    if f"data_{key}" in columns:
+        return f"{alias}.data_{key}"
+    return f"json_extract({alias}.additional_data, '$.{key}')"
+
+
 def main():
     # 解析天数参数，默认查看最近 1 天
     days = 1
@@ -73,194 +89,195 @@ def main():
     print(f"⏱ 统计范围：最近 {days} 天 (从 {start_iso} 起)")
     print("=" * 80)
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    with read_snapshot(db_path, row_factory=sqlite3.Row) as conn:
+        cur = conn.cursor()
 
-    # 1. 最近行为明细
-    print("\n📝 最近的学习行为（最多显示 50 条）")
-    print("-" * 80)
-    try:
-        cur.execute(
-            """
-            SELECT 
-                b.timestamp,
-                b.user_id,
-                b.behavior_code,
-                b.activity_name,
-                s.platform AS device_label,
-                json_extract(b.additional_data, '$.line_number')      AS line_number,
-                json_extract(b.additional_data, '$.start_line')       AS start_line,
-                json_extract(b.additional_data, '$.end_line')         AS end_line,
-                json_extract(b.additional_data, '$.code_range')       AS code_range,
-                json_extract(b.additional_data, '$.content_length')   AS content_len,
-                json_extract(b.additional_data, '$.question_preview') AS q_preview,
-                json_extract(b.additional_data, '$.response_preview') AS r_preview
-            FROM learning_behaviors b
-            LEFT JOIN user_sessions s ON b.session_id = s.session_id
-            WHERE b.timestamp >= ?
-            ORDER BY b.timestamp DESC
-            LIMIT 50
-            """,
-            (start_iso,),
-        )
-        rows = cur.fetchall()
-        if not rows:
-            print("  (最近没有学习行为记录)")
-        else:
-            for r in rows:
-                ts = r["timestamp"]
-                uid = r["user_id"] or "unknown"
-                device = r["device_label"] or "unknown-device"
-                code = r["behavior_code"]
-                name = r["activity_name"] or ""
-                line = r["line_number"] or ""
-                start_line = r["start_line"] or ""
-                end_line = r["end_line"] or ""
-                code_range = r["code_range"] or ""
-                content_len = r["content_len"] or ""
-                q_preview = r["q_preview"]
-                r_preview = r["r_preview"]
+        # 1. 最近行为明细
+        print("\n📝 最近的学习行为（最多显示 50 条）")
+        print("-" * 80)
+        try:
+            b_field = lambda key: json_field(cur, "learning_behaviors", "b", key)
+            cur.execute(
+                f"""
+                SELECT 
+                    b.timestamp,
+                    b.user_id,
+                    b.behavior_code,
+                    b.activity_name,
+                    s.platform AS device_label,
+                    {b_field('line_number')}      AS line_number,
+                    {b_field('start_line')}       AS start_line,
+                    {b_field('end_line')}         AS end_line,
+                    {b_field('code_range')}       AS code_range,
+                    {b_field('content_length')}   AS content_len,
+                    {b_field('question_preview')} AS q_preview,
+                    {b_field('response_preview')} AS r_preview
+                FROM learning_behaviors b
+                LEFT JOIN user_sessions s ON b.session_id = s.session_id
+                WHERE b.timestamp >= ?
+                ORDER BY b.timestamp DESC
+                LIMIT 50
+                """,
+                (start_iso,),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                print("  (最近没有学习行为记录)")
+            else:
+                for r in rows:
+                    ts = r["timestamp"]
+                    uid = r["user_id"] or "unknown"
+                    device = r["device_label"] or "unknown-device"
+                    code = r["behavior_code"]
+                    name = r["activity_name"] or ""
+                    line = r["line_number"] or ""
+                    start_line = r["start_line"] or ""
+                    end_line = r["end_line"] or ""
+                    code_range = r["code_range"] or ""
+                    content_len = r["content_len"] or ""
+                    q_preview = r["q_preview"]
+                    r_preview = r["r_preview"]
 
-                print(f"[{ts}] 用户:{uid} 设备:{device} 行为:{code}({name})", end="")
-                extra = []
-                if line:
-                    extra.append(f"行={line}")
-                if start_line or end_line:
-                    extra.append(f"范围={start_line}-{end_line}")
-                if code_range:
-                    extra.append(f"区间={code_range}")
-                if content_len:
-                    extra.append(f"内容长度={content_len}")
-                if extra:
-                    print(" | " + "; ".join(str(x) for x in extra))
-                else:
-                    print()
-                if q_preview:
-                    print(f"    问题预览: {q_preview}")
-                if r_preview:
-                    print(f"    AI回复预览: {r_preview}")
-    except Exception as e:
-        print(f"  ⚠️ 查询学习行为出错: {e}")
+                    print(f"[{ts}] 用户:{uid} 设备:{device} 行为:{code}({name})", end="")
+                    extra = []
+                    if line:
+                        extra.append(f"行={line}")
+                    if start_line or end_line:
+                        extra.append(f"范围={start_line}-{end_line}")
+                    if code_range:
+                        extra.append(f"区间={code_range}")
+                    if content_len:
+                        extra.append(f"内容长度={content_len}")
+                    if extra:
+                        print(" | " + "; ".join(str(x) for x in extra))
+                    else:
+                        print()
+                    if q_preview:
+                        print(f"    问题预览: {q_preview}")
+                    if r_preview:
+                        print(f"    AI回复预览: {r_preview}")
+        except Exception as e:
+            print(f"  ⚠️ 查询学习行为出错: {e}")
 
-    # 2. 最近代码操作明细
-    print("\n💻 最近的代码操作（最多显示 50 条）")
-    print("-" * 80)
-    try:
-        cur.execute(
-            """
-            SELECT 
-                c.timestamp,
-                c.user_id,
-                c.operation_type,
-                c.code_length,
-                c.line_count,
-                c.success,
-                c.error_message,
-                c.execution_time,
-                json_extract(c.additional_data, '$.start_line') AS start_line,
-                json_extract(c.additional_data, '$.end_line')   AS end_line,
-                json_extract(c.additional_data, '$.code_range') AS code_range,
-                s.platform AS device_label
-            FROM code_operations c
-            LEFT JOIN user_sessions s ON c.session_id = s.session_id
-            WHERE c.timestamp >= ?
-            ORDER BY c.timestamp DESC
-            LIMIT 50
-            """,
-            (start_iso,),
-        )
-        rows = cur.fetchall()
-        if not rows:
-            print("  (最近没有代码操作记录)")
-        else:
-            for r in rows:
-                ts = r["timestamp"]
-                uid = r["user_id"] or "unknown"
-                device = r["device_label"] or "unknown-device"
-                op = r["operation_type"]
-                ok = "成功" if r["success"] else "失败"
-                print(f"[{ts}] 用户:{uid} 设备:{device} 操作:{op} - {ok}", end="")
-                extra = []
-                if r["code_length"] is not None:
-                    extra.append(f"代码长度={r['code_length']}")
-                if r["line_count"] is not None:
-                    extra.append(f"行数={r['line_count']}")
-                if r["start_line"] or r["end_line"]:
-                    extra.append(f"范围={r['start_line']}-{r['end_line']}")
-                if r["code_range"]:
-                    extra.append(f"区间={r['code_range']}")
-                if r["execution_time"] is not None:
-                    try:
-                        extra.append(f"耗时={float(r['execution_time']):.2f}s")
-                    except Exception:
-                        pass
-                if extra:
-                    print(" | " + "; ".join(str(x) for x in extra))
-                else:
-                    print()
-                if r["error_message"]:
-                    print(f"    错误信息: {r['error_message']}")
-    except Exception as e:
-        print(f"  ⚠️ 查询代码操作出错: {e}")
+        # 2. 最近代码操作明细
+        print("\n💻 最近的代码操作（最多显示 50 条）")
+        print("-" * 80)
+        try:
+            c_field = lambda key: json_field(cur, "code_operations", "c", key)
+            cur.execute(
+                f"""
+                SELECT 
+                    c.timestamp,
+                    c.user_id,
+                    c.operation_type,
+                    c.code_length,
+                    c.line_count,
+                    c.success,
+                    c.error_message,
+                    c.execution_time,
+                    {c_field('start_line')} AS start_line,
+                    {c_field('end_line')}   AS end_line,
+                    {c_field('code_range')} AS code_range,
+                    s.platform AS device_label
+                FROM code_operations c
+                LEFT JOIN user_sessions s ON c.session_id = s.session_id
+                WHERE c.timestamp >= ?
+                ORDER BY c.timestamp DESC
+                LIMIT 50
+                """,
+                (start_iso,),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                print("  (最近没有代码操作记录)")
+            else:
+                for r in rows:
+                    ts = r["timestamp"]
+                    uid = r["user_id"] or "unknown"
+                    device = r["device_label"] or "unknown-device"
+                    op = r["operation_type"]
+                    ok = "成功" if r["success"] else "失败"
+                    print(f"[{ts}] 用户:{uid} 设备:{device} 操作:{op} - {ok}", end="")
+                    extra = []
+                    if r["code_length"] is not None:
+                        extra.append(f"代码长度={r['code_length']}")
+                    if r["line_count"] is not None:
+                        extra.append(f"行数={r['line_count']}")
+                    if r["start_line"] or r["end_line"]:
+                        extra.append(f"范围={r['start_line']}-{r['end_line']}")
+                    if r["code_range"]:
+                        extra.append(f"区间={r['code_range']}")
+                    if r["execution_time"] is not None:
+                        try:
+                            extra.append(f"耗时={float(r['execution_time']):.2f}s")
+                        except Exception:
+                            pass
+                    if extra:
+                        print(" | " + "; ".join(str(x) for x in extra))
+                    else:
+                        print()
+                    if r["error_message"]:
+                        print(f"    错误信息: {r['error_message']}")
+        except Exception as e:
+            print(f"  ⚠️ 查询代码操作出错: {e}")
 
-    # 3. 最近 AI 交互明细
-    print("\n🤖 最近的 AI 交互（最多显示 50 条）")
-    print("-" * 80)
-    try:
-        cur.execute(
-            """
-            SELECT 
-                a.timestamp,
-                a.user_id,
-                a.interaction_type,
-                a.question_length,
-                a.response_length,
-                a.response_time,
-                json_extract(a.additional_data, '$.question_preview') AS q_preview,
-                json_extract(a.additional_data, '$.response_preview') AS r_preview,
-                s.platform AS device_label
-            FROM ai_interactions a
-            LEFT JOIN user_sessions s ON a.session_id = s.session_id
-            WHERE a.timestamp >= ?
-            ORDER BY a.timestamp DESC
-            LIMIT 50
-            """,
-            (start_iso,),
-        )
-        rows = cur.fetchall()
-        if not rows:
-            print("  (最近没有 AI 交互记录)")
-        else:
-            for r in rows:
-                ts = r["timestamp"]
-                uid = r["user_id"] or "unknown"
-                device = r["device_label"] or "unknown-device"
-                it = r["interaction_type"]
-                qlen = r["question_length"]
-                rlen = r["response_length"]
-                rt = r["response_time"]
-                q_preview = r["q_preview"]
-                r_preview = r["r_preview"]
+        # 3. 最近 AI 交互明细
+        print("\n🤖 最近的 AI 交互（最多显示 50 条）")
+        print("-" * 80)
+        try:
+            a_field = lambda key: json_field(cur, "ai_interactions", "a", key)
+            cur.execute(
+                f"""
+                SELECT 
+                    a.timestamp,
+                    a.user_id,
+                    a.interaction_type,
+                    a.question_length,
+                    a.response_length,
+                    a.response_time,
+                    {a_field('question_preview')} AS q_preview,
+                    {a_field('response_preview')} AS r_preview,
+                    s.platform AS device_label
+                FROM ai_interactions a
+                LEFT JOIN user_sessions s ON a.session_id = s.session_id
+                WHERE a.timestamp >= ?
+                ORDER BY a.timestamp DESC
+                LIMIT 50
+                """,
+                (start_iso,),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                print("  (最近没有 AI 交互记录)")
+            else:
+                for r in rows:
+                    ts = r["timestamp"]
+                    uid = r["user_id"] or "unknown"
+                    device = r["device_label"] or "unknown-device"
+                    it = r["interaction_type"]
+                    qlen = r["question_length"]
+                    rlen = r["response_length"]
+                    rt = r["response_time"]
+                    q_preview = r["q_preview"]
+                    r_preview = r["r_preview"]
 
-                # 有些旧记录可能没有 response_time
-                if rt is None:
-                    rt_str = "未知"
-                else:
-                    try:
-                        rt_str = f"{float(rt):.2f}s"
-                    except Exception:
-                        rt_str = str(rt)
+                    # 有些旧记录可能没有 response_time
+                    if rt is None:
+                        rt_str = "未知"
+                    else:
+                        try:
+                            rt_str = f"{float(rt):.2f}s"
+                        except Exception:
+                            rt_str = str(rt)
 
-                print(f"[{ts}] 用户:{uid} 设备:{device} 类型:{it} | 问长={qlen}字, 回答长={rlen}字, 响应时间={rt_str}")
-                if q_preview:
-                    print(f"    问: {q_preview}")
-                if r_preview:
-                    print(f"    答: {r_preview}")
-    except Exception as e:
-        print(f"  ⚠️ 查询 AI 交互出错: {e}")
+                    print(f"[{ts}] 用户:{uid} 设备:{device} 类型:{it} | 问长={qlen}字, 回答长={rlen}字, 响应时间={rt_str}")
+                    if q_preview:
+                        print(f"    问: {q_preview}")
+                    if r_preview:
+                        print(f"    答: {r_preview}")
+        except Exception as e:
+            print(f"  ⚠️ 查询 AI 交互出错: {e}")
 
-    conn.close()
     print("\n✅ 明细查看完成。")
     print("提示：可以在命令后面加数字查看更长时间，例如：")
     print("  python view_interactions_detail.py 7   # 最近 7 天")